@@ -7,14 +7,45 @@ from tqdm import tqdm
 import time
 from collections import defaultdict
 
+from embedding_shards import ShardReader, ShardWriter, embed_into_shards, sample_feature_name
+from embedding_store import EMBEDDING_STORE_DIR, EmbeddingStore, embed_into_store
+from esm_batching import BatchStats
+from esm_chunking import ESM_MAX_RESIDUES, ChunkedEmbeddingEngine
+from esm_engine import get_esm2_engine, read_fasta_sequence
+from esm_local_window import embed_mutants_local, run_local_window
+from esm_shared_pool import SharedModelPool
+from generate_individual_lists import locate_mutation_indices, parse_mutations_from_name
+from pipeline_io import check_file_exists, load_names_from_csv
+
 # 配置路径
 GEOSTAB_DIR = "/home/corp/xingqiao.lin/code/GeoStab"
 DATA_DIR = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train"
 CSV_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754.csv"
 
-def check_file_exists(file_path, min_size=1):
-    """检查文件是否存在且大小大于min_size字节"""
-    return os.path.exists(file_path) and os.path.getsize(file_path) > min_size
+# True: 进程内复用已加载的ESM-2模型；False: 每条序列启动一次esm2_embedding.py子进程
+USE_INPROCESS_ENGINE = True
+# 进程内模式下，先把所有缺失的esm2.pt按token预算组批生成，再走原有的WT/mut循环
+USE_BATCHED_INFERENCE = True
+ESM2_MAX_TOKENS = 4096
+# 推理后端: "fp32" / "bf16" / "int8" / "compile"，输出格式相同，精度与速度对比见 esm_backend_benchmark.py
+ESM2_BACKEND = "fp32"
+# 超过窗口长度的序列按重叠窗口分块嵌入后拼接（"center-crop" 或 "linear-blend"），峰值内存只取决于窗口大小
+ESM2_CHUNK_WINDOW = ESM_MAX_RESIDUES
+ESM2_CHUNK_OVERLAP = 256
+ESM2_CHUNK_STITCH = "linear-blend"
+# 大于1时，模型权重只加载一次并放入共享内存，由多个CPU推理进程并行处理批次
+ESM2_NUM_WORKERS = 1
+ESM2_THREADS_PER_WORKER = None  # None: CPU核心数 / 进程数
+# 进程内模式下，按序列内容寻址存储去重，样本目录中的esm2.pt为指向存储的硬链接
+USE_EMBEDDING_STORE = True
+# mut嵌入模式: "exact" 全长重新嵌入；"local-window" 复用WT的esm2.pt，只重新嵌入突变位点两侧
+# MUT_LOCAL_WINDOW 个残基并拼回两侧 MUT_LOCAL_SPLICE 个残基（近似，误差见 esm_local_window.py 基准）
+MUT_EMBEDDING_MODE = "exact"
+MUT_LOCAL_WINDOW = 64
+MUT_LOCAL_SPLICE = 16
+# 不为None时，进程内模式改为直接追加写入打包的内存映射分片（见embedding_shards.py），不再生成逐样本的esm2.pt
+ESM2_SHARD_DIR = None
+ESM2_SHARD_DTYPE = "float16"
 
 def run_command(cmd, description=""):
     """运行命令并处理错误"""
@@ -35,23 +66,32 @@ def run_command(cmd, description=""):
         print(f"❌ {description} 出错: {e}")
         return False
 
-def load_names_from_csv(csv_file):
-    """从CSV文件加载蛋白质名称"""
-    names = []
+def generate_esm2(fasta_file, saved_folder, description=""):
+    """生成esm2.pt，默认使用进程内常驻的ESM-2引擎"""
+    if not USE_INPROCESS_ENGINE:
+        cmd = f"python {GEOSTAB_DIR}/generate_features/esm2_embedding.py --fasta_file {fasta_file} --saved_folder {saved_folder}"
+        return run_command(cmd, description)
+    
     try:
-        with open(csv_file, 'r') as f:
-            lines = f.readlines()
-        
-        # 跳过标题行，提取第一列（name列）
-        for line in lines[1:]:
-            if line.strip():
-                name = line.split(',')[0].strip()
-                names.append(name)
-        
-        return names
+        print(f"🔄 {description}")
+        get_chunked_engine().embed_fasta(fasta_file, saved_folder)
+        print(f"✅ {description} 完成")
+        return True
     except Exception as e:
-        print(f"❌ 读取CSV文件失败: {e}")
-        return []
+        print(f"❌ {description} 出错: {e}")
+        return False
+
+def get_chunked_engine():
+    """进程内共享的ESM-2引擎，外面包一层超长序列分块"""
+    return ChunkedEmbeddingEngine(get_esm2_engine(backend=ESM2_BACKEND), ESM2_CHUNK_WINDOW, ESM2_CHUNK_OVERLAP,
+                                  ESM2_CHUNK_STITCH, ESM2_MAX_TOKENS)
+
+def get_inference_engine():
+    """返回组批推理使用的引擎：单进程引擎，或共享权重的多进程推理池"""
+    engine = get_chunked_engine()
+    if ESM2_NUM_WORKERS > 1:
+        return SharedModelPool(engine, ESM2_NUM_WORKERS, ESM2_THREADS_PER_WORKER)
+    return engine
 
 def extract_pdb_id(name):
     """从蛋白质名称中提取PDB ID"""
@@ -126,8 +166,7 @@ def process_wt_pdb_group(pdb_id, names):
             return False, 0, 0
         
         # 生成esm2.pt
-        cmd = f"python {GEOSTAB_DIR}/generate_features/esm2_embedding.py --fasta_file {fasta_file} --saved_folder {wt_folder}"
-        if not run_command(cmd, f"生成 {pdb_id} 的esm2.pt"):
+        if not generate_esm2(fasta_file, wt_folder, f"生成 {pdb_id} 的esm2.pt"):
             return False, 0, 0
         
         # 复制到同PDB ID的其他目录
@@ -145,6 +184,165 @@ def process_wt_pdb_group(pdb_id, names):
         print(f"📊 PDB {pdb_id}: 生成了1个文件，复制了 {copy_count} 个文件")
         return True, copy_count + 1, 0
 
+def precompute_esm2_batched(pdb_groups, names):
+    """组批生成所有缺失的esm2.pt：每个PDB组一条WT代表序列 + 每个mut序列"""
+    pairs = []
+    for pdb_id, pdb_names in pdb_groups.items():
+        if find_existing_esm2_file(pdb_id, pdb_groups) is None:
+            clean_name = pdb_names[0].replace(' ', '_')
+            pairs.append((f"{pdb_id} WT", f'{DATA_DIR}/{clean_name}/wt_data/result.fasta'))
+    for name in names:
+        clean_name = name.replace(' ', '_')
+        pairs.append((name, f'{DATA_DIR}/{clean_name}/mut_data/result.fasta'))
+    
+    stats = BatchStats()
+    generated_count = 0
+    failed_count = 0
+    results = get_chunked_engine().run_batched(pairs, max_tokens=ESM2_MAX_TOKENS, stats=stats)
+    for sample, status, message in tqdm(results, total=len(pairs), desc="组批生成esm2.pt"):
+        if status == 'generated':
+            generated_count += 1
+        elif status == 'failed':
+            failed_count += 1
+    
+    print(f"📊 组批生成: {generated_count} 个, 失败: {failed_count} 个（失败的样本在后续循环中报告）")
+    stats.report("ESM-2 ")
+
+def collect_mut_local_window(names, is_done):
+    """
+    局部窗口模式的mut样本：is_done(clean_name) 为真的跳过
+    逐个产出 (name, 'skipped' / 'failed', message) 或 (name, None, (clean_name, mut_seq, seq_indices))
+    """
+    for name in names:
+        clean_name = name.replace(' ', '_')
+        if is_done(clean_name):
+            yield name, 'skipped', clean_name
+            continue
+        
+        try:
+            wt_seq = read_fasta_sequence(f'{DATA_DIR}/{clean_name}/wt_data/result.fasta')
+            mut_seq = read_fasta_sequence(f'{DATA_DIR}/{clean_name}/mut_data/result.fasta')
+        except Exception as e:
+            yield name, 'failed', f"读取FASTA出错: {e}"
+            continue
+        
+        mutations = parse_mutations_from_name(clean_name)
+        seq_indices = None
+        if mutations is not None:
+            seq_indices = locate_mutation_indices(wt_seq, mutations, mut_seq)
+        if seq_indices is None:
+            yield name, 'failed', "无法确定突变在序列中的位置"
+            continue
+        yield name, None, (clean_name, mut_seq, seq_indices)
+
+def iter_mut_local_window(names, engine):
+    """局部窗口模式：复用WT的esm2.pt，只重新嵌入突变位点附近的窗口"""
+    samples = []
+    is_done = lambda clean_name: check_file_exists(f'{DATA_DIR}/{clean_name}/mut_data/esm2.pt')
+    for name, status, message in collect_mut_local_window(names, is_done):
+        if status is not None:
+            yield name, status, message
+            continue
+        clean_name, mut_seq, seq_indices = message
+        samples.append((name, f'{DATA_DIR}/{clean_name}/wt_data/esm2.pt', mut_seq, seq_indices,
+                        f'{DATA_DIR}/{clean_name}/mut_data/esm2.pt'))
+    
+    yield from run_local_window(engine, samples, MUT_LOCAL_WINDOW, MUT_LOCAL_SPLICE, ESM2_MAX_TOKENS)
+
+def iter_mut_local_window_shards(names, engine, writer):
+    """局部窗口模式的分片版本：WT嵌入从分片读取，近似的mut嵌入追加到同一分片目录"""
+    reader = ShardReader(ESM2_SHARD_DIR)
+    items = []
+    is_done = lambda clean_name: sample_feature_name(clean_name, 'mut') in writer
+    for name, status, message in collect_mut_local_window(names, is_done):
+        if status is not None:
+            yield name, status, message
+            continue
+        clean_name, mut_seq, seq_indices = message
+        wt_entry = sample_feature_name(clean_name, 'wt')
+        if wt_entry not in reader:
+            yield name, 'failed', f"分片中没有WT嵌入: {wt_entry}"
+            continue
+        items.append((name, reader.get(wt_entry).float(), mut_seq, seq_indices))
+    
+    for name, reps in embed_mutants_local(engine, items, MUT_LOCAL_WINDOW, MUT_LOCAL_SPLICE, ESM2_MAX_TOKENS):
+        if isinstance(reps, Exception):
+            yield name, 'failed', f"局部窗口嵌入出错: {reps}"
+            continue
+        # 近似结果不带内容键，不会与精确嵌入共享偏移
+        writer.append(sample_feature_name(name.replace(' ', '_'), 'mut'), reps)
+        yield name, 'generated', name
+
+def process_with_embedding_store(names):
+    """WT和mut按序列内容去重：每条唯一序列只推理一次，写入存储后链接到各样本目录"""
+    store = EmbeddingStore(EMBEDDING_STORE_DIR)
+    # 局部窗口模式下mut嵌入是近似结果，不进入按内容寻址的存储
+    sides = ('wt', 'mut') if MUT_EMBEDDING_MODE == "exact" else ('wt',)
+    pairs = []
+    for side in sides:
+        for name in names:
+            clean_name = name.replace(' ', '_')
+            pairs.append(((name, side), f'{DATA_DIR}/{clean_name}/{side}_data/result.fasta'))
+    
+    counts = {'wt': defaultdict(int), 'mut': defaultdict(int)}
+    stats = BatchStats()
+    engine = get_inference_engine()
+    results = embed_into_store(engine, pairs, store, max_tokens=ESM2_MAX_TOKENS, stats=stats)
+    for (name, side), status, message in tqdm(results, total=len(pairs), desc="生成esm2.pt"):
+        counts[side][status] += 1
+        if status == 'failed':
+            print(f"❌ {name} {side}: {message}")
+    
+    if MUT_EMBEDDING_MODE == "local-window":
+        results = iter_mut_local_window(names, engine)
+        for name, status, message in tqdm(results, total=len(names), desc="局部窗口mut esm2.pt"):
+            counts['mut'][status] += 1
+            if status == 'failed':
+                print(f"❌ {name} mut: {message}")
+    engine.close()
+    stats.report("ESM-2 ")
+    
+    wt, mut = counts['wt'], counts['mut']
+    return (wt['generated'] + wt['linked'] + wt['skipped'], wt['failed'], wt['generated'], wt['linked'],
+            mut['generated'] + mut['linked'] + mut['skipped'], mut['failed'], mut['generated'])
+
+def process_with_shards(names):
+    """
+    WT和mut直接写入打包分片，条目名为 <样本名>/<wt|mut>，相同序列只推理一次
+    局部窗口模式下先写完WT，再从分片读回WT嵌入生成近似的mut条目
+    """
+    sides = ('wt', 'mut') if MUT_EMBEDDING_MODE == "exact" else ('wt',)
+    pairs = []
+    for side in sides:
+        for name in names:
+            clean_name = name.replace(' ', '_')
+            pairs.append((sample_feature_name(clean_name, side), f'{DATA_DIR}/{clean_name}/{side}_data/result.fasta'))
+    
+    counts = {'wt': defaultdict(int), 'mut': defaultdict(int)}
+    stats = BatchStats()
+    engine = get_inference_engine()
+    with ShardWriter(ESM2_SHARD_DIR, dtype=ESM2_SHARD_DTYPE) as writer:
+        results = embed_into_shards(engine, pairs, writer, max_tokens=ESM2_MAX_TOKENS, stats=stats)
+        for entry_name, status, message in tqdm(results, total=len(pairs), desc="写入esm2分片"):
+            side = entry_name.rsplit('/', 1)[-1]
+            counts[side][status] += 1
+            if status == 'failed':
+                print(f"❌ {entry_name}: {message}")
+    
+    if MUT_EMBEDDING_MODE == "local-window":
+        with ShardWriter(ESM2_SHARD_DIR, dtype=ESM2_SHARD_DTYPE) as writer:
+            results = iter_mut_local_window_shards(names, engine, writer)
+            for name, status, message in tqdm(results, total=len(names), desc="局部窗口mut分片"):
+                counts['mut'][status] += 1
+                if status == 'failed':
+                    print(f"❌ {name} mut: {message}")
+    engine.close()
+    stats.report("ESM-2 ")
+    
+    wt, mut = counts['wt'], counts['mut']
+    return (wt['generated'] + wt['linked'] + wt['skipped'], wt['failed'], wt['generated'], wt['linked'],
+            mut['generated'] + mut['linked'] + mut['skipped'], mut['failed'], mut['generated'])
+
 def process_mut_individual(name):
     """处理单个mut蛋白质（必须单独运行）"""
     clean_name = name.replace(' ', '_')
@@ -163,8 +361,7 @@ def process_mut_individual(name):
         return False, 0
     
     # 生成esm2.pt
-    cmd = f"python {GEOSTAB_DIR}/generate_features/esm2_embedding.py --fasta_file {fasta_file} --saved_folder {mut_folder}"
-    if not run_command(cmd, f"生成 {name} 的mut esm2.pt"):
+    if not generate_esm2(fasta_file, mut_folder, f"生成 {name} 的mut esm2.pt"):
         return False, 0
     
     print(f"✅ 生成 {name}: {esm_file}")
@@ -196,38 +393,56 @@ def main():
     mut_error_count = 0
     mut_generated = 0
     
-    # 处理WT特征（按PDB分组）
-    print("\n🔍 开始处理WT特征...")
-    print("=" * 80)
+    if USE_INPROCESS_ENGINE and ESM2_SHARD_DIR:
+        print(f"\n🔍 处理WT和mut特征，写入分片: {ESM2_SHARD_DIR}")
+        print("=" * 80)
+        (wt_success_count, wt_error_count, wt_generated, wt_copied,
+         mut_success_count, mut_error_count, mut_generated) = process_with_shards(names)
+    elif USE_INPROCESS_ENGINE and USE_EMBEDDING_STORE:
+        # WT和mut统一按序列内容去重，样本目录链接到存储
+        print("\n🔍 按序列内容去重处理WT和mut特征...")
+        print("=" * 80)
+        (wt_success_count, wt_error_count, wt_generated, wt_copied,
+         mut_success_count, mut_error_count, mut_generated) = process_with_embedding_store(names)
+    else:
+        # 组批预生成缺失的esm2.pt，后续循环只负责复制和统计
+        if USE_INPROCESS_ENGINE and USE_BATCHED_INFERENCE:
+            print("\n🔍 组批生成缺失的esm2.pt...")
+            print("=" * 80)
+            precompute_esm2_batched(pdb_groups, names)
     
-    for pdb_id, pdb_names in tqdm(pdb_groups.items(), desc="处理WT PDB组"):
-        try:
-            success, generated, copied = process_wt_pdb_group(pdb_id, pdb_names)
-            if success:
-                wt_success_count += len(pdb_names)
-                wt_generated += generated
-                wt_copied += copied
-            else:
+        # 处理WT特征（按PDB分组）
+        print("\n🔍 开始处理WT特征...")
+        print("=" * 80)
+    
+        for pdb_id, pdb_names in tqdm(pdb_groups.items(), desc="处理WT PDB组"):
+            try:
+                success, generated, copied = process_wt_pdb_group(pdb_id, pdb_names)
+                if success:
+                    wt_success_count += len(pdb_names)
+                    wt_generated += generated
+                    wt_copied += copied
+                else:
+                    wt_error_count += len(pdb_names)
+            except Exception as e:
                 wt_error_count += len(pdb_names)
-        except Exception as e:
-            wt_error_count += len(pdb_names)
-            print(f"❌ PDB {pdb_id} 处理出错: {e}")
+                print(f"❌ PDB {pdb_id} 处理出错: {e}")
     
-    # 处理mut特征（每个单独运行）
-    print("\n🔍 开始处理mut特征...")
-    print("=" * 80)
+        # 处理mut特征（每个单独运行）
+        print("\n🔍 开始处理mut特征...")
+        print("=" * 80)
     
-    for name in tqdm(names, desc="处理mut特征"):
-        try:
-            success, generated = process_mut_individual(name)
-            if success:
-                mut_success_count += 1
-                mut_generated += generated
-            else:
+        for name in tqdm(names, desc="处理mut特征"):
+            try:
+                success, generated = process_mut_individual(name)
+                if success:
+                    mut_success_count += 1
+                    mut_generated += generated
+                else:
+                    mut_error_count += 1
+            except Exception as e:
                 mut_error_count += 1
-        except Exception as e:
-            mut_error_count += 1
-            print(f"❌ {name} 处理出错: {e}")
+                print(f"❌ {name} 处理出错: {e}")
     
     # 输出统计结果
     print("\n" + "=" * 80)
@@ -237,7 +452,7 @@ def main():
     print(f"  ✅ 成功处理: {wt_success_count}")
     print(f"  ❌ 处理失败: {wt_error_count}")
     print(f"  🔄 新生成esm2.pt: {wt_generated}")
-    print(f"  📋 复制esm2.pt: {wt_copied}")
+    print(f"  📋 复制/链接esm2.pt: {wt_copied}")
     print()
     print("mut特征处理:")
     print(f"  ✅ 成功处理: {mut_success_count}")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+FoldX替身，用于没有FoldX授权的环境中测量流程本身的开销
+接受与 foldx_20251231 相同的 --command=RepairPDB / BuildModel 参数，每次调用先睡眠 FAKE_FOLDX_LATENCY 秒，
+再写出同名的输出文件：<stem>_Repair.pdb；<stem>_<k>_<run>.pdb、WT_<stem>_<k>_<run>.pdb（突变残基改名）、
+Dif_/Raw_/Average_<stem>.fxout；能量由突变行和运行序号决定，可复现
+"""
+
+import hashlib
+import os
+import re
+import stat
+import sys
+import time
+
+from synthetic_data import THREE_LETTER
+
+FOLDX_NAME = "foldx_20251231"
+LATENCY_ENV = "FAKE_FOLDX_LATENCY"
+DEFAULT_LATENCY = 0.05
+FXOUT_HEADER = (
+    "FoldX 5.1 (fake)\n"
+    "PDB file analysed: {pdb}\n"
+    "Output type: BuildModel\n"
+    "-------------------------------\n"
+)
+FXOUT_COLUMNS = "Pdb\tSD\ttotal energy\tBackbone Hbond\tSideChain Hbond\tVan der Waals\tElectrostatics"
+MUTATION_PATTERN = re.compile(r'^([A-Z])([A-Za-z0-9])(-?\d+)([A-Z])$')
+
+
+def parse_args(argv):
+    args = {}
+    for arg in argv:
+        if arg.startswith('--') and '=' in arg:
+            key, value = arg[2:].split('=', 1)
+            args[key] = value
+    return args
+
+
+def fake_energy(line, run, offset=0.0):
+    """由突变行和运行序号确定的伪ddG"""
+    digest = hashlib.sha256(f"{line}\n{run}".encode()).digest()
+    return offset + (int.from_bytes(digest[:4], 'big') / 0xFFFFFFFF) * 6.0 - 2.0
+
+
+def mutate_lines(pdb_lines, line):
+    """把突变行中每个位点的残基名改为突变后的氨基酸"""
+    targets = {}
+    for mutation in line.rstrip(';').split(','):
+        match = MUTATION_PATTERN.match(mutation.strip())
+        if match:
+            _, chain, position, mut_aa = match.groups()
+            targets[(chain, int(position))] = THREE_LETTER.get(mut_aa, 'UNK')
+    for pdb_line in pdb_lines:
+        if pdb_line.startswith(("ATOM  ", "HETATM")) and len(pdb_line) >= 26:
+            key = (pdb_line[21], int(pdb_line[22:26]))
+            if key in targets:
+                pdb_line = pdb_line[:17] + targets[key] + pdb_line[20:]
+        yield pdb_line
+
+
+def repair(args):
+    pdb = args['pdb']
+    with open(os.path.join(args['pdb-dir'], pdb), 'r') as f:
+        lines = f.readlines()
+    with open(os.path.join(args['output-dir'], f"{pdb[:-len('.pdb')]}_Repair.pdb"), 'w') as f:
+        f.writelines(lines)
+        f.write("REMARK   1 REPAIRED BY FAKE FOLDX\n")
+
+
+def build_model(args):
+    pdb = args['pdb']
+    stem = pdb[:-len('.pdb')]
+    out_dir = args['output-dir']
+    number_of_runs = int(args.get('numberOfRuns', 1))
+    with open(os.path.join(args['pdb-dir'], pdb), 'r') as f:
+        pdb_lines = f.readlines()
+    with open(args['mutant-file'], 'r') as f:
+        mutation_lines = [line.strip() for line in f if line.strip()]
+
+    dif_rows, raw_rows = [], []
+    for index, line in enumerate(mutation_lines, start=1):
+        mutant_lines = list(mutate_lines(pdb_lines, line))
+        for run in range(number_of_runs):
+            mutant_name = f"{stem}_{index}_{run}.pdb"
+            with open(os.path.join(out_dir, mutant_name), 'w') as f:
+                f.writelines(mutant_lines)
+            with open(os.path.join(out_dir, f"WT_{mutant_name}"), 'w') as f:
+                f.writelines(pdb_lines)
+            ddg = fake_energy(line, run)
+            terms = f"{ddg / 3:.4f}\t{ddg / 5:.4f}\t{ddg / 2:.4f}\t{ddg / 7:.4f}"
+            dif_rows.append(f"{mutant_name}\t0\t{ddg:.4f}\t{terms}")
+            raw_rows.append(f"{mutant_name}\t0\t{ddg - 100:.4f}\t{terms}")
+            raw_rows.append(f"WT_{mutant_name}\t0\t-100.0000\t0\t0\t0\t0")
+
+    header = FXOUT_HEADER.format(pdb=pdb) + FXOUT_COLUMNS + "\n"
+    for prefix, rows in (("Dif", dif_rows), ("Raw", raw_rows)):
+        with open(os.path.join(out_dir, f"{prefix}_{stem}.fxout"), 'w') as f:
+            f.write(header + ''.join(f"{row}\n" for row in rows))
+    with open(os.path.join(out_dir, f"Average_{stem}.fxout"), 'w') as f:
+        f.write(header)
+
+
+def install_fake_foldx(geostab_dir):
+    """在 <geostab_dir>/foldx/ 下放一个调用本脚本的 foldx_20251231，返回其路径"""
+    foldx_dir = os.path.join(geostab_dir, "foldx")
+    os.makedirs(foldx_dir, exist_ok=True)
+    launcher = os.path.join(foldx_dir, FOLDX_NAME)
+    with open(launcher, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" "$@"\n')
+    os.chmod(launcher, os.stat(launcher).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return launcher
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    command = args.get('command')
+    if command not in ('RepairPDB', 'BuildModel'):
+        print(f"fake foldx: unsupported command {command}", file=sys.stderr)
+        return 1
+    time.sleep(float(os.environ.get(LATENCY_ENV, DEFAULT_LATENCY)))
+    if command == 'RepairPDB':
+        repair(args)
+    else:
+        build_model(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+GeoStab特征脚本替身，用于没有GeoStab代码的环境中测量co-pair-multiprocess.py本身的开销
+在 <geostab_dir>/generate_features/ 下放与GeoStab同名、同参数的 coordinate.py（--pdb_file --saved_folder）
+和 pair.py（--coordinate_file --saved_folder）两个click命令，既能被进程内导入，也能作为子进程运行；
+每次调用先睡眠 FAKE_GEOSTAB_LATENCY 秒，再写出主链N/CA/C坐标和CA距离矩阵
+"""
+
+import os
+import time
+
+import click
+import torch
+
+LATENCY_ENV = "FAKE_GEOSTAB_LATENCY"
+DEFAULT_LATENCY = 0.0
+BACKBONE_ATOMS = ("N", "CA", "C")
+LAUNCHER = (
+    "import sys\n"
+    "sys.path.insert(0, {benchmark_dir!r})\n"
+    "from fake_geostab import {command} as main\n"
+    "\n"
+    "if __name__ == \"__main__\":\n"
+    "    main()\n"
+)
+
+
+def sleep_latency():
+    time.sleep(float(os.environ.get(LATENCY_ENV, DEFAULT_LATENCY)))
+
+
+def read_backbone_coordinates(pdb_file):
+    """按残基出现顺序读取N/CA/C坐标，返回 [L, 3, 3]；缺原子或没有残基时报错"""
+    residues = {}
+    with open(pdb_file, 'r') as f:
+        for line in f:
+            if not line.startswith("ATOM  ") or line[12:16].strip() not in BACKBONE_ATOMS:
+                continue
+            key = (line[21], line[22:27])
+            xyz = [float(line[30:38]), float(line[38:46]), float(line[46:54])]
+            residues.setdefault(key, {})[line[12:16].strip()] = xyz
+    if not residues:
+        raise ValueError(f"{pdb_file} 中没有主链原子")
+    missing = [key for key, atoms in residues.items() if len(atoms) != len(BACKBONE_ATOMS)]
+    if missing:
+        raise ValueError(f"{pdb_file} 中 {len(missing)} 个残基缺少主链原子")
+    return torch.tensor([[atoms[name] for name in BACKBONE_ATOMS] for atoms in residues.values()])
+
+
+@click.command()
+@click.option("--pdb_file", required=True, type=str)
+@click.option("--saved_folder", required=True, type=str)
+def coordinate(pdb_file, saved_folder):
+    sleep_latency()
+    torch.save(read_backbone_coordinates(pdb_file), os.path.join(saved_folder, "coordinate.pt"))
+
+
+@click.command()
+@click.option("--coordinate_file", required=True, type=str)
+@click.option("--saved_folder", required=True, type=str)
+def pair(coordinate_file, saved_folder):
+    sleep_latency()
+    ca = torch.load(coordinate_file)[:, 1]
+    torch.save(torch.cdist(ca, ca), os.path.join(saved_folder, "pair.pt"))
+
+
+def install_fake_geostab(geostab_dir):
+    """在 <geostab_dir>/generate_features/ 下放调用本模块的 coordinate.py 和 pair.py，返回该目录"""
+    feature_dir = os.path.join(geostab_dir, "generate_features")
+    os.makedirs(feature_dir, exist_ok=True)
+    benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+    for command in ("coordinate", "pair"):
+        with open(os.path.join(feature_dir, f"{command}.py"), 'w') as f:
+            f.write(LAUNCHER.format(benchmark_dir=benchmark_dir, command=command))
+    return feature_dir
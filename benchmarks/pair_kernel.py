@@ -0,0 +1,121 @@
+"""
+pair_local.pt 批量kernel基准
+在不同长度和批大小下对比逐文件生成（每个结构单独 write_pair_features，可选每个结构一个子进程跑 pair_features.py）
+与 write_pair_features_batched 的耗时，并检查两者输出逐位一致
+两边算的都是 pair_features.py 的实验性 pair_local.pt；逐文件基线是本模块按结构逐个运行，
+不是流程当前用GeoStab pair.py生成pair.pt的路径，结果不代表pair.pt的生成耗时
+"""
+
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import pandas as pd
+import torch
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from pair_features import DEFAULT_MAX_PAIRS, LOCAL_PAIR_NAME, write_pair_features, write_pair_features_batched  # noqa: E402
+from synthetic_data import backbone_pdb_lines, random_sequence  # noqa: E402
+
+# 每个批次内的长度在 L×(1-LENGTH_JITTER) ~ L 之间随机，保证padding和mask真正起作用
+LENGTH_JITTER = 0.1
+
+
+def write_structures(out_dir, length, count, rng):
+    """写出count个长度约为length的理想螺旋PDB，返回 [(pdb_file, 逐文件输出, 批量输出)]"""
+    jobs = []
+    for index in range(count):
+        sample_length = rng.randint(max(1, int(length * (1 - LENGTH_JITTER))), length)
+        sample_dir = os.path.join(out_dir, f"s{index:04d}")
+        for sub in ("per_file", "batched"):
+            os.makedirs(os.path.join(sample_dir, sub), exist_ok=True)
+        pdb_file = os.path.join(sample_dir, "relaxed.pdb")
+        with open(pdb_file, 'w') as f:
+            f.writelines(backbone_pdb_lines(random_sequence(sample_length, rng)))
+        jobs.append((pdb_file, os.path.join(sample_dir, "per_file", LOCAL_PAIR_NAME),
+                     os.path.join(sample_dir, "batched", LOCAL_PAIR_NAME)))
+    return jobs
+
+
+def run_per_file(jobs, subprocess_mode):
+    start = time.time()
+    for pdb_file, out_file, _ in jobs:
+        if subprocess_mode:
+            subprocess.run([sys.executable, os.path.join(REPO_DIR, "pair_features.py"), "--pdb_file", pdb_file,
+                            "--saved_folder", os.path.dirname(out_file)], check=True, capture_output=True)
+        else:
+            write_pair_features(pdb_file, out_file)
+    return time.time() - start
+
+
+def run_batched(jobs, max_pairs):
+    start = time.time()
+    failed = [item for item in write_pair_features_batched([(pdb, out) for pdb, _, out in jobs], max_pairs)
+              if item[2] != 'generated']
+    if failed:
+        raise RuntimeError(f"批量生成失败: {failed[:3]}")
+    return time.time() - start
+
+
+def max_difference(jobs):
+    """逐文件与批量输出的最大绝对误差"""
+    return max((torch.load(per_file) - torch.load(batched)).abs().max().item() for _, per_file, batched in jobs)
+
+
+def benchmark_pair_kernel(lengths, batch_sizes, max_pairs=DEFAULT_MAX_PAIRS, subprocess_mode=False, seed=0):
+    rng = random.Random(seed)
+    results = []
+    for length in lengths:
+        for batch_size in batch_sizes:
+            with tempfile.TemporaryDirectory(prefix="pair-bench-") as work_dir:
+                jobs = write_structures(work_dir, length, batch_size, rng)
+                per_file_time = run_per_file(jobs, subprocess_mode)
+                batched_time = run_batched(jobs, max_pairs)
+                results.append({
+                    'length': length,
+                    'batch_size': batch_size,
+                    'per_file_seconds': per_file_time,
+                    'batched_seconds': batched_time,
+                    'speedup': per_file_time / batched_time if batched_time > 0 else float('inf'),
+                    'max_abs_diff': max_difference(jobs),
+                })
+    return pd.DataFrame(results)
+
+
+@click.command()
+@click.option("--lengths", default="64,128,256,512", type=str, help="逗号分隔的结构长度")
+@click.option("--batch_sizes", default="1,8,32", type=str, help="逗号分隔的结构数")
+@click.option("--max_pairs", default=DEFAULT_MAX_PAIRS, type=int, help="批量模式每批最多的残基对数")
+@click.option("--subprocess", "subprocess_mode", is_flag=True, help="逐文件基线每个结构起一个子进程运行pair_features.py")
+@click.option("--seed", default=0, type=int, help="随机种子")
+@click.option("--output_file", default=None, type=str, help="结果表保存路径（CSV）")
+def main(lengths, batch_sizes, max_pairs, subprocess_mode, seed, output_file):
+    """
+    逐文件 vs 批量 pair_local.pt 生成的耗时对比（两边都是pair_features.py，不涉及GeoStab的pair.py/pair.pt）
+
+    使用方法：
+    python benchmarks/pair_kernel.py --lengths 128,512 --batch_sizes 8,64
+    python benchmarks/pair_kernel.py --subprocess --lengths 256 --batch_sizes 16
+    """
+    table = benchmark_pair_kernel([int(x) for x in lengths.split(',') if x.strip()],
+                                  [int(x) for x in batch_sizes.split(',') if x.strip()],
+                                  max_pairs, subprocess_mode, seed)
+    print("\n" + "=" * 80)
+    print(f"📊 {LOCAL_PAIR_NAME} (pair_features.py) 逐文件{'（子进程）' if subprocess_mode else ''} vs 批量:")
+    print("=" * 80)
+    print(f"ℹ️ 逐文件基线是pair_features.py按结构逐个运行，不是GeoStab pair.py生成pair.pt的当前路径")
+    print(table.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    if output_file:
+        table.to_csv(output_file, index=False)
+        print(f"📁 输出: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
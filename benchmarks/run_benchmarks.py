@@ -0,0 +1,308 @@
+"""
+端到端流程基准
+在合成数据集上依次计时各阶段（FoldX用fake_foldx.py替身，GeoStab特征脚本用fake_geostab.py替身，ESM用随机权重的小模型），结果写成JSON，
+可以用 --compare 与之前某次提交的结果对比，超过容差的变慢标记为回退
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import importlib.util
+
+import click
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from fake_foldx import LATENCY_ENV, install_fake_foldx  # noqa: E402
+from fake_geostab import LATENCY_ENV as GEOSTAB_LATENCY_ENV, install_fake_geostab  # noqa: E402
+from synthetic_data import write_dataset  # noqa: E402
+from tiny_esm import write_tiny_esm2  # noqa: E402
+
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+STAGES = ('foldx_per_sample', 'foldx_parallel', 'foldx_parallel_cached', 'renumber', 'co_pair', 'co_pair_subprocess',
+          'esm2_embed')
+
+
+def git_commit():
+    """当前提交的短哈希，不在git仓库中时返回 'unknown'"""
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True)
+        return result.stdout.strip() or 'unknown'
+    except OSError:
+        return 'unknown'
+
+
+def stage_result(seconds, items, **extra):
+    return {
+        'seconds': round(seconds, 4),
+        'items': items,
+        'items_per_second': round(items / seconds, 4) if seconds > 0 else None,
+        **extra,
+    }
+
+
+def sample_dirs_of(data_dir):
+    return sorted(path for path in Path(data_dir).glob("rcsb_*") if path.is_dir())
+
+
+def reset_samples(data_dir, pristine_dir):
+    """
+    恢复未编号的原始WT结构并删除编号时保存的原始副本（逐样本基线与并行流程都从未编号的relaxed.pdb开始），
+    删除上一阶段生成的突变体PDB和FoldX临时目录，让每个FoldX阶段从同样的起点开始
+    """
+    for sample_dir in sample_dirs_of(data_dir):
+        shutil.copyfile(Path(pristine_dir) / sample_dir.name / "relaxed.pdb", sample_dir / "wt_data" / "relaxed.pdb")
+        (sample_dir / "wt_data" / "relaxed.original.pdb").unlink(missing_ok=True)
+        mut_folder = sample_dir / "mut_data"
+        (mut_folder / "relaxed_repair.pdb").unlink(missing_ok=True)
+        shutil.rmtree(mut_folder / "foldx_tmp", ignore_errors=True)
+
+
+def snapshot_wt(data_dir, pristine_dir):
+    for sample_dir in sample_dirs_of(data_dir):
+        os.makedirs(Path(pristine_dir) / sample_dir.name, exist_ok=True)
+        shutil.copyfile(sample_dir / "wt_data" / "relaxed.pdb", Path(pristine_dir) / sample_dir.name / "relaxed.pdb")
+
+
+def bench_foldx_per_sample(data_dir, pristine_dir, geostab_dir, limit):
+    """原始方式：每个样本一个foldx.py进程，各自RepairPDB + BuildModel，不用任何缓存"""
+    reset_samples(data_dir, pristine_dir)
+    samples = sample_dirs_of(data_dir)[:limit]
+    start = time.time()
+    failed = 0
+    for sample_dir in samples:
+        result = subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, "foldx.py"), "--sample_dir", str(sample_dir),
+             "--geostab_dir", geostab_dir, "--repair_cache_dir", "", "--result_cache_dir", "", "--energy_file", ""],
+            capture_output=True, text=True)
+        if result.returncode != 0 or not (sample_dir / "mut_data" / "relaxed_repair.pdb").exists():
+            failed += 1
+    return stage_result(time.time() - start, len(samples), failed=failed)
+
+
+def bench_foldx_parallel(data_dir, pristine_dir, geostab_dir, cache_dir, num_workers):
+    """foldx_parallel：按母结构组批、RepairPDB缓存、进程池并发；cache_dir 已被之前的阶段填充时即为全部命中缓存的重跑"""
+    from foldx_batch import group_samples
+    from foldx_parallel import run_parallel
+
+    reset_samples(data_dir, pristine_dir)
+    software_foldx = Path(geostab_dir) / "foldx" / "foldx_20251231"
+    groups, _ = group_samples(sample_dirs_of(data_dir), force=True)
+    start = time.time()
+    counts = {}
+    for _, status, _ in run_parallel(software_foldx, groups, num_workers,
+                                     repair_cache_dir=os.path.join(cache_dir, "repair"),
+                                     energy_file=os.path.join(cache_dir, "foldx_energies.csv"),
+                                     result_cache_dir=os.path.join(cache_dir, "result")):
+        counts[status] = counts.get(status, 0) + 1
+    items = sum(counts.values())
+    return stage_result(time.time() - start, items, failed=counts.get('failed', 0), cached=counts.get('cached', 0))
+
+
+def bench_renumber(data_dir):
+    """pdb_renumber：对每个样本的WT和突变体PDB的未编号副本重新编号"""
+    from pdb_renumber import RENUMBER_MARKER, renumber_pdb
+
+    work_dir = tempfile.mkdtemp(prefix='renumber-')
+    try:
+        copies = []
+        for index, sample_dir in enumerate(sample_dirs_of(data_dir)):
+            for pdb_file in (sample_dir / "wt_data" / "relaxed.pdb", sample_dir / "mut_data" / "relaxed_repair.pdb"):
+                if not pdb_file.exists():
+                    continue
+                copy = os.path.join(work_dir, f"{index}-{pdb_file.name}")
+                with open(pdb_file, 'r') as src, open(copy, 'w') as dst:
+                    dst.writelines(line for line in src if not line.startswith(RENUMBER_MARKER))
+                copies.append(copy)
+        start = time.time()
+        for copy in copies:
+            renumber_pdb(copy)
+        return stage_result(time.time() - start, len(copies))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def load_co_pair(geostab_dir, data_dir):
+    """按文件路径导入co-pair-multiprocess.py（文件名带连字符），并指向替身GeoStab和合成数据集"""
+    spec = importlib.util.spec_from_file_location("co_pair", os.path.join(REPO_DIR, "co-pair-multiprocess.py"))
+    module = importlib.util.module_from_spec(spec)
+    # 进程池按模块名pickle任务函数
+    sys.modules["co_pair"] = module
+    spec.loader.exec_module(module)
+    module.GEOSTAB_DIR = str(geostab_dir)
+    module.DATA_DIR = str(data_dir)
+    return module
+
+
+def bench_co_pair(data_dir, geostab_dir, num_workers, in_process=True):
+    """
+    co-pair-multiprocess：WT（按结构去重）和mut的coordinate.pt/pair.pt；in_process=False 时每个样本起子进程跑特征脚本
+    没有FoldX阶段产出的突变体PDB时用WT结构代替，每次运行前删除已有特征，保证两种方式做同样多的工作
+    """
+    co_pair = load_co_pair(geostab_dir, data_dir)
+    samples = sample_dirs_of(data_dir)
+    for sample_dir in samples:
+        mut_pdb = sample_dir / "mut_data" / "relaxed_repair.pdb"
+        if not mut_pdb.exists():
+            shutil.copyfile(sample_dir / "wt_data" / "relaxed.pdb", mut_pdb)
+        for side in ("wt_data", "mut_data"):
+            for artifact in ("coordinate.pt", "pair.pt"):
+                (sample_dir / side / artifact).unlink(missing_ok=True)
+    names = [sample_dir.name for sample_dir in samples]
+    seconds, failed = {}, 0
+    for side in ("wt", "mut"):
+        start = time.time()
+        _, _, errors = co_pair.process_with_processes(names, side, num_workers, in_process)
+        seconds[side] = round(time.time() - start, 4)
+        failed += errors
+    return stage_result(sum(seconds.values()), 2 * len(names), failed=failed,
+                        wt_seconds=seconds['wt'], mut_seconds=seconds['mut'])
+
+
+def bench_esm2_embed(data_dir, model_dir, max_tokens):
+    """随机权重的小ESM-2，按token预算组批嵌入全部WT和突变体FASTA"""
+    from esm_batching import BatchStats
+    from esm_engine import Esm2EmbeddingEngine
+
+    engine = Esm2EmbeddingEngine(model_name=write_tiny_esm2(model_dir))
+    pairs = []
+    for sample_dir in sample_dirs_of(data_dir):
+        for side in ("wt", "mut"):
+            pairs.append((f"{sample_dir.name}:{side}", str(sample_dir / f"{side}_data" / "result.fasta")))
+    stats = BatchStats()
+    start = time.time()
+    counts = {}
+    for _, status, _ in engine.run_batched(pairs, output_name="esm2-bench.pt", max_tokens=max_tokens,
+                                           skip_existing=False, stats=stats):
+        counts[status] = counts.get(status, 0) + 1
+    return stage_result(time.time() - start, len(pairs), failed=counts.get('failed', 0))
+
+
+def compare_results(baseline, current, tolerance=0.1):
+    """逐阶段比较耗时，返回 [(阶段, 基线秒数, 当前秒数, 比值, 是否回退), ...]"""
+    rows = []
+    for stage, result in current['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base or not base.get('seconds') or result.get('error'):
+            continue
+        ratio = result['seconds'] / base['seconds']
+        rows.append((stage, base['seconds'], result['seconds'], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+@click.command()
+@click.option("--stages", default=','.join(STAGES), type=str, help=f"逗号分隔的阶段: {','.join(STAGES)}")
+@click.option("--work_dir", default=None, type=str, help="工作目录（默认临时目录，结束后删除）")
+@click.option("--num_structures", default=4, type=int, help="合成数据集的WT结构数")
+@click.option("--mutations_per_structure", default=8, type=int, help="每个结构的突变数")
+@click.option("--min_length", default=80, type=int, help="最短序列长度")
+@click.option("--max_length", default=160, type=int, help="最长序列长度")
+@click.option("--seed", default=0, type=int, help="随机种子")
+@click.option("--foldx_latency", default=0.05, type=float, help="fake FoldX每次调用的延迟（秒）")
+@click.option("--geostab_latency", default=0.0, type=float, help="GeoStab特征脚本替身每次调用的延迟（秒）")
+@click.option("--per_sample_limit", default=8, type=int, help="foldx_per_sample阶段最多处理的样本数")
+@click.option("--num_workers", default=4, type=int, help="foldx_parallel和co_pair的并发数")
+@click.option("--max_tokens", default=4096, type=int, help="ESM组批的token预算")
+@click.option("--output", default=None, type=str, help="结果JSON路径（默认 benchmarks/results/<时间>-<提交>.json）")
+@click.option("--compare", "baseline_file", default=None, type=str, help="与之前的结果JSON对比")
+@click.option("--tolerance", default=0.1, type=float, help="变慢超过该比例视为回退")
+def main(stages, work_dir, num_structures, mutations_per_structure, min_length, max_length, seed, foldx_latency,
+         geostab_latency, per_sample_limit, num_workers, max_tokens, output, baseline_file, tolerance):
+    """
+    在合成数据上计时各流程阶段，不需要FoldX授权、GeoStab和预训练权重
+
+    使用方法：
+    python benchmarks/run_benchmarks.py --num_structures 8 --mutations_per_structure 16
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/20260101-000000-abc1234.json
+    """
+    stages = [stage.strip() for stage in stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise click.BadParameter(f"未知阶段: {unknown}，可选: {STAGES}")
+
+    keep_work_dir = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='geostab-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    os.environ[LATENCY_ENV] = str(foldx_latency)
+    os.environ[GEOSTAB_LATENCY_ENV] = str(geostab_latency)
+    commit = git_commit()
+    print(f"📁 工作目录: {work_dir}")
+    print(f"🔖 提交: {commit}")
+
+    try:
+        start = time.time()
+        data_dir, _ = write_dataset(work_dir, num_structures, mutations_per_structure, min_length, max_length, seed)
+        num_samples = len(sample_dirs_of(data_dir))
+        geostab_dir = os.path.join(work_dir, "GeoStab")
+        install_fake_foldx(geostab_dir)
+        install_fake_geostab(geostab_dir)
+        cache_dir = os.path.join(work_dir, "cache")
+        pristine_dir = os.path.join(work_dir, "pristine")
+        snapshot_wt(data_dir, pristine_dir)
+        report = {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': {
+                'num_structures': num_structures,
+                'mutations_per_structure': mutations_per_structure,
+                'num_samples': num_samples,
+                'min_length': min_length,
+                'max_length': max_length,
+                'seed': seed,
+                'foldx_latency': foldx_latency,
+                'geostab_latency': geostab_latency,
+                'num_workers': num_workers,
+                'max_tokens': max_tokens,
+                'cpu_count': os.cpu_count(),
+            },
+            'stages': {'dataset': stage_result(time.time() - start, num_samples)},
+        }
+
+        runners = {
+            'foldx_per_sample': lambda: bench_foldx_per_sample(data_dir, pristine_dir, geostab_dir, per_sample_limit),
+            'foldx_parallel': lambda: bench_foldx_parallel(data_dir, pristine_dir, geostab_dir,
+                                                           os.path.join(cache_dir, "cold"), num_workers),
+            'foldx_parallel_cached': lambda: bench_foldx_parallel(data_dir, pristine_dir, geostab_dir,
+                                                                  os.path.join(cache_dir, "cold"), num_workers),
+            'renumber': lambda: bench_renumber(data_dir),
+            'co_pair': lambda: bench_co_pair(data_dir, geostab_dir, num_workers),
+            'co_pair_subprocess': lambda: bench_co_pair(data_dir, geostab_dir, num_workers, in_process=False),
+            'esm2_embed': lambda: bench_esm2_embed(data_dir, os.path.join(work_dir, "models"), max_tokens),
+        }
+        for stage in stages:
+            print(f"⏱️  {stage} ...")
+            try:
+                report['stages'][stage] = runners[stage]()
+            except Exception as e:
+                report['stages'][stage] = {'error': f"{type(e).__name__}: {e}"}
+            print(f"   {report['stages'][stage]}")
+    finally:
+        if not keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"💾 结果已保存: {output}")
+
+    if baseline_file:
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)
+        print(f"\n📊 对比 {baseline.get('commit', '?')} → {commit}:")
+        for stage, base_seconds, seconds, ratio, regressed in compare_results(baseline, report, tolerance):
+            flag = "❌ 回退" if regressed else "✅"
+            print(f"   {stage:<24} {base_seconds:>9.3f}s → {seconds:>9.3f}s  ×{ratio:.2f}  {flag}")
+
+
+if __name__ == "__main__":
+    main()
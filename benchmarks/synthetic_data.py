@@ -0,0 +1,118 @@
+"""
+合成基准数据集
+随机序列 + 理想α螺旋的主链PDB（只有N/CA/C/O），按与 ddG_train 相同的目录结构写出：
+<out>/ddG_train/rcsb_{PDB}_{链}_{突变}_7_25/{wt_data,mut_data}/result.fasta、wt_data/relaxed.pdb、
+mut_data/individual_list.txt，以及 name/wt_seq/mut_seq/ddG 四列的CSV；同一PDB的所有样本共用完全相同的WT结构
+"""
+
+import math
+import os
+import random
+
+import click
+import pandas as pd
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+THREE_LETTER = {
+    'A': 'ALA', 'C': 'CYS', 'D': 'ASP', 'E': 'GLU', 'F': 'PHE', 'G': 'GLY', 'H': 'HIS', 'I': 'ILE', 'K': 'LYS',
+    'L': 'LEU', 'M': 'MET', 'N': 'ASN', 'P': 'PRO', 'Q': 'GLN', 'R': 'ARG', 'S': 'SER', 'T': 'THR', 'V': 'VAL',
+    'W': 'TRP', 'Y': 'TYR',
+}
+# 理想α螺旋：每残基旋转100°、上升1.5Å；(原子, 半径Å, 相对CA的角度偏移°, 相对CA的高度偏移Å)
+HELIX_ATOMS = (('N', 1.55, -28.0, -0.85), ('CA', 2.30, 0.0, 0.0), ('C', 1.65, 30.0, 0.75), ('O', 1.90, 45.0, 1.95))
+CSV_NAME = "S_synthetic.csv"
+
+
+def random_sequence(length, rng):
+    return ''.join(rng.choice(AMINO_ACIDS) for _ in range(length))
+
+
+def atom_line(serial, atom, resname, chain, resseq, x, y, z):
+    """PDB固定列格式的ATOM记录"""
+    return (f"ATOM  {serial:>5} {f' {atom}':<4} {resname:>3} {chain}{resseq:>4}    "
+            f"{x:>8.3f}{y:>8.3f}{z:>8.3f}{1.0:>6.2f}{0.0:>6.2f}          {atom[0]:>2}\n")
+
+
+def backbone_pdb_lines(seq, chain='A'):
+    """理想螺旋上的主链原子，残基从1开始编号"""
+    lines = []
+    serial = 1
+    for index, aa in enumerate(seq):
+        theta = math.radians(100.0 * index)
+        rise = 1.5 * index
+        for atom, radius, offset, dz in HELIX_ATOMS:
+            angle = theta + math.radians(offset)
+            lines.append(atom_line(serial, atom, THREE_LETTER[aa], chain, index + 1,
+                                   radius * math.cos(angle), radius * math.sin(angle), rise + dz))
+            serial += 1
+    lines.append(f"TER   {serial:>5}      {THREE_LETTER[seq[-1]]:>3} {chain}{len(seq):>4}\n")
+    lines.append("END\n")
+    return lines
+
+
+def write_fasta(fasta_file, name, seq):
+    with open(fasta_file, 'w') as f:
+        f.write(f">{name}\n{seq}\n")
+
+
+def write_dataset(out_dir, num_structures=4, mutations_per_structure=8, min_length=80, max_length=160, seed=0):
+    """
+    生成合成数据集，返回 (样本根目录, CSV路径)
+    每个结构随机取长度，在不同位点各做一个点突变
+    """
+    rng = random.Random(seed)
+    data_dir = os.path.join(out_dir, "ddG_train")
+    os.makedirs(data_dir, exist_ok=True)
+    records = []
+    for structure in range(num_structures):
+        pdb_id = f"9{structure:03d}"
+        chain = 'A'
+        length = rng.randint(min_length, max_length)
+        wt_seq = random_sequence(length, rng)
+        wt_pdb = ''.join(backbone_pdb_lines(wt_seq, chain))
+        positions = rng.sample(range(1, length + 1), min(mutations_per_structure, length))
+        for position in positions:
+            wt_aa = wt_seq[position - 1]
+            mut_aa = rng.choice([aa for aa in AMINO_ACIDS if aa != wt_aa])
+            mut_seq = wt_seq[:position - 1] + mut_aa + wt_seq[position:]
+            name = f"rcsb_{pdb_id}_{chain}_{wt_aa}{position}{mut_aa}_7_25"
+
+            sample_dir = os.path.join(data_dir, name)
+            wt_folder = os.path.join(sample_dir, "wt_data")
+            mut_folder = os.path.join(sample_dir, "mut_data")
+            os.makedirs(wt_folder, exist_ok=True)
+            os.makedirs(mut_folder, exist_ok=True)
+            write_fasta(os.path.join(wt_folder, "result.fasta"), name, wt_seq)
+            write_fasta(os.path.join(mut_folder, "result.fasta"), name, mut_seq)
+            with open(os.path.join(wt_folder, "relaxed.pdb"), 'w') as f:
+                f.write(wt_pdb)
+            with open(os.path.join(mut_folder, "individual_list.txt"), 'w') as f:
+                f.write(f"{wt_aa}{chain}{position}{mut_aa};\n")
+            records.append({'name': name, 'wt_seq': wt_seq, 'mut_seq': mut_seq, 'ddG': round(rng.gauss(0.8, 1.5), 2)})
+
+    csv_file = os.path.join(out_dir, CSV_NAME)
+    pd.DataFrame(records).to_csv(csv_file, index=False)
+    return data_dir, csv_file
+
+
+@click.command()
+@click.option("--out_dir", required=True, type=str, help="输出目录")
+@click.option("--num_structures", default=4, type=int, help="WT结构数")
+@click.option("--mutations_per_structure", default=8, type=int, help="每个结构的突变数")
+@click.option("--min_length", default=80, type=int, help="最短序列长度")
+@click.option("--max_length", default=160, type=int, help="最长序列长度")
+@click.option("--seed", default=0, type=int, help="随机种子")
+def main(out_dir, num_structures, mutations_per_structure, min_length, max_length, seed):
+    """
+    生成合成的ddG样本目录和CSV
+
+    使用方法：
+    python benchmarks/synthetic_data.py --out_dir /tmp/bench --num_structures 10 --mutations_per_structure 20
+    """
+    data_dir, csv_file = write_dataset(out_dir, num_structures, mutations_per_structure, min_length, max_length, seed)
+    print(f"✅ 样本目录: {data_dir}")
+    print(f"✅ CSV: {csv_file}")
+
+
+if __name__ == "__main__":
+    main()
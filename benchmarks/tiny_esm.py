@@ -0,0 +1,75 @@
+"""
+随机权重的小型ESM模型，用于基准中替代650M的预训练权重
+write_tiny_esm2 写出fair-esm可直接加载的本地检查点（esm2_*.pt + 接触回归权重），
+write_tiny_hf_esm 写出与ESM-1v相同格式的HuggingFace模型目录；结构与真实模型一致，只是层数和维度很小
+"""
+
+import argparse
+import os
+
+import torch
+
+# fair-esm检查点的cfg是argparse.Namespace，torch.load默认weights_only时需要放行
+torch.serialization.add_safe_globals([argparse.Namespace])
+
+TINY_NUM_LAYERS = 2
+TINY_EMBED_DIM = 32
+TINY_ATTENTION_HEADS = 4
+
+
+def write_tiny_esm2(out_dir, num_layers=TINY_NUM_LAYERS, embed_dim=TINY_EMBED_DIM,
+                    attention_heads=TINY_ATTENTION_HEADS, seed=0):
+    """写出随机权重的ESM-2检查点，返回路径（可作为 Esm2EmbeddingEngine 的 model_name）"""
+    import esm
+
+    model_path = os.path.join(out_dir, f"esm2_t{num_layers}_{embed_dim}_tiny.pt")
+    if os.path.exists(model_path):
+        return model_path
+    os.makedirs(out_dir, exist_ok=True)
+    torch.manual_seed(seed)
+    alphabet = esm.data.Alphabet.from_architecture("ESM-1b")
+    model = esm.model.esm2.ESM2(num_layers=num_layers, embed_dim=embed_dim, attention_heads=attention_heads,
+                                alphabet=alphabet, token_dropout=True)
+    state_dict = {f"encoder.{name}": param for name, param in model.state_dict().items()}
+    regression = {name: state_dict.pop(name) for name in list(state_dict) if 'contact_head.regression' in name}
+    cfg = argparse.Namespace(encoder_layers=num_layers, encoder_embed_dim=embed_dim,
+                             encoder_attention_heads=attention_heads, token_dropout=True)
+    torch.save({'cfg': {'model': cfg}, 'model': state_dict}, model_path)
+    torch.save({'model': regression}, model_path[:-len('.pt')] + "-contact-regression.pt")
+    return model_path
+
+
+def write_tiny_hf_esm(model_dir, num_layers=TINY_NUM_LAYERS, hidden_size=TINY_EMBED_DIM,
+                      attention_heads=TINY_ATTENTION_HEADS, seed=0):
+    """写出随机权重的HuggingFace ESM目录（pytorch_model.bin，与 HfEsmEmbeddingEngine 的加载方式一致），返回目录"""
+    import esm
+    from transformers import EsmConfig, EsmForMaskedLM, EsmTokenizer
+
+    if os.path.exists(os.path.join(model_dir, "pytorch_model.bin")):
+        return model_dir
+    os.makedirs(model_dir, exist_ok=True)
+    alphabet = esm.data.Alphabet.from_architecture("ESM-1b")
+    vocab_file = os.path.join(model_dir, "vocab.txt")
+    with open(vocab_file, 'w') as f:
+        f.write(''.join(f"{token}\n" for token in alphabet.all_toks))
+    tokenizer = EsmTokenizer(vocab_file)
+
+    torch.manual_seed(seed)
+    config = EsmConfig(
+        vocab_size=len(alphabet.all_toks),
+        hidden_size=hidden_size,
+        num_hidden_layers=num_layers,
+        num_attention_heads=attention_heads,
+        intermediate_size=hidden_size * 2,
+        max_position_embeddings=1026,
+        pad_token_id=alphabet.padding_idx,
+        mask_token_id=alphabet.mask_idx,
+        position_embedding_type='absolute',
+        token_dropout=True,
+        emb_layer_norm_before=False,
+    )
+    model = EsmForMaskedLM(config)
+    model.config.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    torch.save(model.state_dict(), os.path.join(model_dir, "pytorch_model.bin"))
+    return model_dir
@@ -4,9 +4,12 @@
 支持并行处理WT和mut特征生成，使用进程池提高性能
 """
 
+import importlib.util
 import os
+import shutil
 import sys
 import subprocess
+import tempfile
 import multiprocessing as mp
 import time
 from concurrent.futures import ProcessPoolExecutor, as_completed
@@ -15,30 +18,38 @@ import argparse
 from typing import Tuple, Dict, Any
 import signal
 
+from embedding_store import link_file
+from foldx_repair_cache import file_sha256
+from pair_features import DELTA_TOLERANCE, LOCAL_PAIR_NAME, write_pair_features
+from pipeline_io import check_file_exists, load_names_from_csv
+
 # 配置路径
 GEOSTAB_DIR = "/home/corp/xingqiao.lin/code/GeoStab"
 DATA_DIR = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train"
 CSV_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754.csv"
+TMPFS_DIR = "/dev/shm"
 
-def check_file_exists(file_path, min_size=1):
-    """检查文件是否存在且大小大于min_size字节"""
-    return os.path.exists(file_path) and os.path.getsize(file_path) > min_size
+# 工作进程内导入一次的GeoStab特征脚本（见 init_feature_worker），为空时用子进程
+_FEATURE_MODULES = {}
+_SCRATCH_ROOT = None
+# 是否额外生成实验性的pair_local.pt（pair_features.py，mut在WT上增量重算）；下游模型读的pair.pt始终由GeoStab生成
+_LOCAL_PAIR = False
+_DELTA_TOLERANCE = DELTA_TOLERANCE
 
-def validate_pdb_file(pdb_file):
-    """验证PDB文件是否可以被coordinate.py正确处理"""
-    try:
-        # 尝试运行coordinate.py来测试PDB文件
-        test_cmd = f"python {GEOSTAB_DIR}/generate_features/coordinate.py --pdb_file {pdb_file} --saved_folder /tmp"
-        result = subprocess.run(test_cmd, shell=True, capture_output=True, text=True, timeout=60)
-        
-        if result.returncode == 0:
-            return True, "PDB文件格式正确"
-        else:
-            return False, f"PDB文件处理失败: {result.stderr.strip()}"
-    except subprocess.TimeoutExpired:
-        return False, "PDB文件验证超时"
-    except Exception as e:
-        return False, f"PDB文件验证出错: {e}"
+def is_up_to_date(target, source):
+    """target存在、非空，且不比source旧"""
+    return check_file_exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+
+def outdated_features(folder, pdb_file, local_pair=False):
+    """
+    返回 (need_coordinate, need_pair, need_local_pair)：coordinate.pt比PDB旧或pair.pt比coordinate.pt旧时需要重新生成；
+    local_pair 时pair_local.pt比PDB旧也需要重新生成
+    """
+    coord_file = f'{folder}/coordinate.pt'
+    need_coordinate = not is_up_to_date(coord_file, pdb_file)
+    need_pair = need_coordinate or not is_up_to_date(f'{folder}/pair.pt', coord_file)
+    need_local_pair = local_pair and not is_up_to_date(f'{folder}/{LOCAL_PAIR_NAME}', pdb_file)
+    return need_coordinate, need_pair, need_local_pair
 
 def run_command(cmd, description="", process_id=None):
     """运行命令并处理错误"""
@@ -67,164 +78,231 @@ def run_command(cmd, description="", process_id=None):
         print(f"❌ {process_prefix}{description} 出错: {e}")
         return False
 
-def load_names_from_csv(csv_file):
-    """从CSV文件加载蛋白质名称"""
-    names = []
+def load_feature_module(name, geostab_dir=GEOSTAB_DIR):
+    """按文件路径导入GeoStab的 generate_features/<name>.py"""
+    path = f"{geostab_dir}/generate_features/{name}.py"
+    spec = importlib.util.spec_from_file_location(f"geostab_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def init_feature_worker(geostab_dir=GEOSTAB_DIR, scratch_root=None, in_process=True, local_pair=False,
+                        delta_tolerance=DELTA_TOLERANCE):
+    """
+    进程池初始化：每个工作进程只导入一次coordinate.py和pair.py（连同torch），之后的任务直接调用；
+    导入失败时该进程回退到子进程方式
+    """
+    global _SCRATCH_ROOT, _LOCAL_PAIR, _DELTA_TOLERANCE
+    _SCRATCH_ROOT = scratch_root
+    _LOCAL_PAIR = local_pair
+    _DELTA_TOLERANCE = delta_tolerance
+    _FEATURE_MODULES.clear()
+    if not in_process:
+        return
+    for path in (geostab_dir, f"{geostab_dir}/generate_features"):
+        if path not in sys.path:
+            sys.path.insert(0, path)
     try:
-        with open(csv_file, 'r') as f:
-            lines = f.readlines()
-        
-        # 跳过标题行，提取第一列（name列）
-        for line in lines[1:]:
-            if line.strip():
-                name = line.split(',')[0].strip()
-                names.append(name)
-        
-        return names
+        _FEATURE_MODULES['coordinate'] = load_feature_module('coordinate', geostab_dir)
+        _FEATURE_MODULES['pair'] = load_feature_module('pair', geostab_dir)
     except Exception as e:
-        print(f"❌ 读取CSV文件失败: {e}")
-        return []
+        print(f"⚠️ 无法在进程内导入GeoStab特征脚本，回退到子进程: {e}")
+        _FEATURE_MODULES.clear()
 
-def process_wt_features(args):
-    """处理单个蛋白质的WT特征（用于多进程）"""
-    name, clean_name, process_id = args
+def call_feature_main(module, **options):
+    """
+    在当前进程中执行特征脚本的命令行入口：click命令直接调用其回调函数，
+    否则临时替换sys.argv调用main()
+    """
+    main = module.main
+    if hasattr(main, 'callback'):
+        main.callback(**options)
+        return
+    old_argv = sys.argv
+    sys.argv = [module.__file__] + [f"--{key}={value}" for key, value in options.items()]
+    try:
+        main()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"{os.path.basename(module.__file__)} 退出码 {e.code}")
+    finally:
+        sys.argv = old_argv
+
+def move_file_atomic(source, target):
+    """移动到目标目录：先复制为同目录临时文件再替换（临时目录可能在tmpfs上，不能直接rename）"""
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.pt', dir=os.path.dirname(target))
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    os.unlink(source)
+
+def generate_features_in_process(pdb_file, saved_folder, need_coordinate=True, need_pair=True):
+    """
+    进程内生成coordinate.pt和pair.pt：两步都在私有临时目录中进行（pair直接读临时目录里的coordinate.pt），
+    全部成功后才移入saved_folder；返回 (是否成功, 错误信息)
+    coordinate.py解析PDB失败即视为PDB无效
+    """
+    scratch = tempfile.mkdtemp(prefix='features-', dir=_SCRATCH_ROOT)
+    try:
+        coord_file = os.path.join(saved_folder, 'coordinate.pt')
+        if need_coordinate:
+            try:
+                call_feature_main(_FEATURE_MODULES['coordinate'], pdb_file=pdb_file, saved_folder=scratch)
+            except Exception as e:
+                return False, f"PDB文件处理失败: {type(e).__name__}: {e}"
+            coord_file = os.path.join(scratch, 'coordinate.pt')
+            if not check_file_exists(coord_file):
+                return False, "coordinate.pt文件未创建"
+        if need_pair:
+            call_feature_main(_FEATURE_MODULES['pair'], coordinate_file=coord_file, saved_folder=scratch)
+            if not check_file_exists(os.path.join(scratch, 'pair.pt')):
+                return False, "pair.pt文件未创建"
+        for artifact in ('coordinate.pt', 'pair.pt'):
+            if os.path.exists(os.path.join(scratch, artifact)):
+                move_file_atomic(os.path.join(scratch, artifact), os.path.join(saved_folder, artifact))
+        return True, ""
+    except Exception as e:
+        return False, f"进程内特征生成出错: {type(e).__name__}: {e}"
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def generate_features_subprocess(name, folder, pdb_file, label, process_id, need_coordinate=True, need_pair=True):
+    """子进程方式：依次运行coordinate.py和pair.py，返回 (是否成功, 错误信息)"""
+    process_prefix = f"[P{process_id}] " if process_id is not None else ""
+    coord_file = f'{folder}/coordinate.pt'
+    if need_coordinate:
+        cmd = f"python {GEOSTAB_DIR}/generate_features/coordinate.py --pdb_file {pdb_file} --saved_folder {folder}"
+        if not run_command(cmd, f"生成 {name} 的{label}coordinate.pt", process_id):
+            return False, f"{label}PDB文件处理失败: coordinate.py执行失败"
+        # 验证文件是否真正生成成功
+        if not check_file_exists(coord_file):
+            print(f"❌ {process_prefix}{name} {label}coordinate.pt 生成失败：文件未创建")
+            return False, f"{label}coordinate.pt文件未创建"
+        print(f"✅ {process_prefix}{name} {label}coordinate.pt 生成成功")
+    if need_pair:
+        cmd = f"python {GEOSTAB_DIR}/generate_features/pair.py --coordinate_file {coord_file} --saved_folder {folder}"
+        if not run_command(cmd, f"生成 {name} 的{label}pair特征", process_id):
+            return False, f"{label}pair特征生成命令失败"
+    return True, ""
+
+def generate_local_pair(name, clean_name, pdb_file, folder, side, process_id):
+    """
+    用pair_features额外生成实验性的pair_local.pt（不替代pair.pt）；mut侧以同一样本的WT结构和pair_local.pt为参照，
+    只重算主链移动过的残基
+    返回 (是否成功, 错误信息)
+    """
+    process_prefix = f"[P{process_id}] " if process_id is not None else ""
     wt_folder = f'{DATA_DIR}/{clean_name}/wt_data'
+    wt_pdb_file, wt_pair_file = ((f'{wt_folder}/relaxed.pdb', f'{wt_folder}/{LOCAL_PAIR_NAME}') if side == 'mut'
+                                 else (None, None))
+    try:
+        recomputed = write_pair_features(pdb_file, f'{folder}/{LOCAL_PAIR_NAME}', wt_pdb_file, wt_pair_file,
+                                         _DELTA_TOLERANCE)
+    except Exception as e:
+        print(f"❌ {process_prefix}{name} {side} {LOCAL_PAIR_NAME}生成失败: {e}")
+        return False, f"{LOCAL_PAIR_NAME}生成失败: {type(e).__name__}: {e}"
+    print(f"✅ {process_prefix}{name} {side} {LOCAL_PAIR_NAME} 生成成功（重算 {recomputed} 个残基）")
+    return True, ""
+
+def process_side_features(name, clean_name, process_id, side):
+    """处理单个蛋白质一侧（wt / mut）的coordinate.pt、pair.pt，以及开启时的pair_local.pt"""
+    folder = f'{DATA_DIR}/{clean_name}/{side}_data'
+    label = '' if side == 'wt' else 'mut '
     process_prefix = f"[P{process_id}] " if process_id is not None else ""
     
     # 检查必要文件
-    fasta_file = f'{wt_folder}/result.fasta'
-    pdb_file = f'{wt_folder}/relaxed.pdb'
+    fasta_file = f'{folder}/result.fasta'
+    pdb_file = f'{folder}/relaxed.pdb' if side == 'wt' else f'{folder}/relaxed_repair.pdb'
     
     if not check_file_exists(fasta_file):
-        print(f"⚠️ {process_prefix}跳过 {name}: FASTA文件不存在")
-        return name, 'wt', False, "FASTA文件不存在"
+        print(f"⚠️ {process_prefix}跳过 {name}: {label}FASTA文件不存在")
+        return name, side, False, f"{label}FASTA文件不存在"
     
     if not check_file_exists(pdb_file):
-        print(f"⚠️ {process_prefix}跳过 {name}: PDB文件不存在")
-        return name, 'wt', False, "PDB文件不存在"
-    
-    # 验证PDB文件是否可以被正确处理
-    is_valid, error_msg = validate_pdb_file(pdb_file)
-    if not is_valid:
-        print(f"⚠️ {process_prefix}跳过 {name}: PDB文件验证失败 - {error_msg}")
-        return name, 'wt', False, f"PDB文件验证失败: {error_msg}"
-    
-    success = True
-    error_msg = ""
-    
-    # 1. 生成coordinate.pt
-    coord_file = f'{wt_folder}/coordinate.pt'
-    coord_generated = False
-    if not check_file_exists(coord_file):
-        cmd = f"python {GEOSTAB_DIR}/generate_features/coordinate.py --pdb_file {pdb_file} --saved_folder {wt_folder}"
-        if run_command(cmd, f"生成 {name} 的coordinate.pt", process_id):
-            # 验证文件是否真正生成成功
-            if check_file_exists(coord_file):
-                coord_generated = True
-                print(f"✅ {process_prefix}{name} coordinate.pt 生成成功")
+        print(f"⚠️ {process_prefix}跳过 {name}: {label}PDB文件不存在")
+        return name, side, False, f"{label}PDB文件不存在"
+    
+    # 输出比输入新时直接跳过；否则生成本身就是对PDB的校验，解析失败即视为无效，不再单独跑一遍coordinate.py
+    need_coordinate, need_pair, need_local_pair = outdated_features(folder, pdb_file, _LOCAL_PAIR)
+    if not (need_coordinate or need_pair or need_local_pair):
+        print(f"⏭️ {process_prefix}{name} {label}特征已是最新，跳过")
+        return name, side, True, "成功"
+    if need_pair and not need_coordinate:
+        print(f"⏭️ {process_prefix}{name} {label}coordinate.pt 已是最新，只生成pair.pt")
+    
+    success, error_msg = True, ""
+    if need_pair:
+        if _FEATURE_MODULES:
+            success, error_msg = generate_features_in_process(pdb_file, folder, need_coordinate, need_pair)
+            if success:
+                print(f"✅ {process_prefix}{name} {label}{'coordinate.pt/' if need_coordinate else ''}pair.pt 生成成功")
             else:
-                print(f"❌ {process_prefix}{name} coordinate.pt 生成失败：文件未创建")
-                success = False
-                error_msg = "coordinate.pt文件未创建"
-        else:
-            success = False
-            error_msg = "coordinate.pt生成命令失败"
-    else:
-        print(f"⏭️ {process_prefix}{name} coordinate.pt 已存在，跳过")
-        coord_generated = True
-    
-    # 2. 生成pair特征
-    pair_file = f'{wt_folder}/pair.pt'
-    if not check_file_exists(pair_file):
-        # 检查coordinate.pt是否存在，因为pair.py需要它
-        if coord_generated or check_file_exists(coord_file):
-            cmd = f"python {GEOSTAB_DIR}/generate_features/pair.py --coordinate_file {coord_file} --saved_folder {wt_folder}"
-            if not run_command(cmd, f"生成 {name} 的pair特征", process_id):
-                success = False
-                error_msg = "pair特征生成命令失败"
+                print(f"❌ {process_prefix}{name} {label}特征生成失败: {error_msg}")
         else:
-            print(f"⚠️ {process_prefix}{name}: coordinate.pt不存在，无法生成pair特征")
-            success = False
-            error_msg = "coordinate.pt不存在"
-    else:
-        print(f"⏭️ {process_prefix}{name} pair.pt 已存在，跳过")
+            success, error_msg = generate_features_subprocess(name, folder, pdb_file, label, process_id,
+                                                              need_coordinate, need_pair)
+    
+    # 实验性的pair_local.pt在pair.pt之外额外生成，下游模型的输入不受影响
+    if success and need_local_pair:
+        success, error_msg = generate_local_pair(name, clean_name, pdb_file, folder, side, process_id)
     
     if success:
-        return name, 'wt', True, "成功"
+        return name, side, True, "成功"
     else:
-        return name, 'wt', False, error_msg
+        return name, side, False, error_msg
+
+def process_wt_features(args):
+    """处理单个蛋白质的WT特征（用于多进程）"""
+    name, clean_name, process_id = args
+    return process_side_features(name, clean_name, process_id, 'wt')
 
 def process_mut_features(args):
     """处理单个蛋白质的mut特征（用于多进程）"""
     name, clean_name, process_id = args
-    mut_folder = f'{DATA_DIR}/{clean_name}/mut_data'
-    process_prefix = f"[P{process_id}] " if process_id is not None else ""
-    
-    # 检查必要文件
-    fasta_file = f'{mut_folder}/result.fasta'
-    pdb_file = f'{mut_folder}/relaxed_repair.pdb'
-    
-    if not check_file_exists(fasta_file):
-        print(f"⚠️ {process_prefix}跳过 {name}: mut FASTA文件不存在")
-        return name, 'mut', False, "mut FASTA文件不存在"
-    
-    if not check_file_exists(pdb_file):
-        print(f"⚠️ {process_prefix}跳过 {name}: mut PDB文件不存在")
-        return name, 'mut', False, "mut PDB文件不存在"
-    
-    # 验证PDB文件是否可以被正确处理
-    is_valid, error_msg = validate_pdb_file(pdb_file)
-    if not is_valid:
-        print(f"⚠️ {process_prefix}跳过 {name}: mut PDB文件验证失败 - {error_msg}")
-        return name, 'mut', False, f"mut PDB文件验证失败: {error_msg}"
-    
-    success = True
-    error_msg = ""
-    
-    # 1. 生成coordinate.pt
-    coord_file = f'{mut_folder}/coordinate.pt'
-    coord_generated = False
-    if not check_file_exists(coord_file):
-        cmd = f"python {GEOSTAB_DIR}/generate_features/coordinate.py --pdb_file {pdb_file} --saved_folder {mut_folder}"
-        if run_command(cmd, f"生成 {name} 的mut coordinate.pt", process_id):
-            # 验证文件是否真正生成成功
-            if check_file_exists(coord_file):
-                coord_generated = True
-                print(f"✅ {process_prefix}{name} mut coordinate.pt 生成成功")
-            else:
-                print(f"❌ {process_prefix}{name} mut coordinate.pt 生成失败：文件未创建")
-                success = False
-                error_msg = "mut coordinate.pt文件未创建"
-        else:
-            success = False
-            error_msg = "mut coordinate.pt生成命令失败"
-    else:
-        print(f"⏭️ {process_prefix}{name} mut coordinate.pt 已存在，跳过")
-        coord_generated = True
-    
-    # 2. 生成pair特征
-    pair_file = f'{mut_folder}/pair.pt'
-    if not check_file_exists(pair_file):
-        # 检查coordinate.pt是否存在，因为pair.py需要它
-        if coord_generated or check_file_exists(coord_file):
-            cmd = f"python {GEOSTAB_DIR}/generate_features/pair.py --coordinate_file {coord_file} --saved_folder {mut_folder}"
-            if not run_command(cmd, f"生成 {name} 的mut pair特征", process_id):
-                success = False
-                error_msg = "mut pair特征生成命令失败"
-        else:
-            print(f"⚠️ {process_prefix}{name}: mut coordinate.pt不存在，无法生成pair特征")
-            success = False
-            error_msg = "mut coordinate.pt不存在"
-    else:
-        print(f"⏭️ {process_prefix}{name} mut pair.pt 已存在，跳过")
-    
-    if success:
-        return name, 'mut', True, "成功"
-    else:
-        return name, 'mut', False, error_msg
+    return process_side_features(name, clean_name, process_id, 'mut')
+
+def group_wt_tasks(tasks, local_pair=False):
+    """
+    按wt_data/relaxed.pdb的内容哈希分组WT任务（同一PDB的所有突变体共用同一结构），返回 [(代表任务, 其余成员任务)]
+    特征已是最新的成员优先作代表；PDB缺失或无法读取的任务各自成组，照常走单样本流程报告原因
+    """
+    groups = {}
+    for task in tasks:
+        _, clean_name, _ = task
+        pdb_file = f'{DATA_DIR}/{clean_name}/wt_data/relaxed.pdb'
+        try:
+            key = file_sha256(pdb_file) if check_file_exists(pdb_file) else None
+        except OSError:
+            key = None
+        groups.setdefault(key or ('single', clean_name), []).append(task)
+    
+    grouped = []
+    for members in groups.values():
+        members.sort(key=lambda task: any(outdated_features(f'{DATA_DIR}/{task[1]}/wt_data',
+                                                            f'{DATA_DIR}/{task[1]}/wt_data/relaxed.pdb', local_pair)))
+        grouped.append((members[0], members[1:]))
+    return grouped
 
-def process_with_processes(names, process_type, max_workers=4):
-    """使用多进程处理蛋白质列表"""
+def link_wt_features(source_name, target_name, local_pair=False):
+    """把代表样本的WT coordinate.pt、pair.pt（及pair_local.pt）链接到同组成员（硬链接，跨文件系统时退回软链接/复制）"""
+    for artifact in ('coordinate.pt', 'pair.pt') + ((LOCAL_PAIR_NAME,) if local_pair else ()):
+        source_file = f'{DATA_DIR}/{source_name}/wt_data/{artifact}'
+        target_file = f'{DATA_DIR}/{target_name}/wt_data/{artifact}'
+        if os.path.exists(target_file) and os.path.samefile(source_file, target_file):
+            continue
+        link_file(source_file, target_file)
+
+def process_with_processes(names, process_type, max_workers=4, in_process=True, scratch_root=None, dedup_wt=True,
+                           local_pair=False, delta_tolerance=DELTA_TOLERANCE):
+    """
+    使用多进程处理蛋白质列表；in_process 时每个工作进程只导入一次特征脚本，不再为每个样本启动解释器
+    dedup_wt 时WT按结构内容去重：每个唯一的relaxed.pdb只计算一次，结果链接到同组其余样本
+    local_pair 时在pair.pt之外额外生成实验性的pair_local.pt，mut的pair_local.pt在WT的pair_local.pt上增量重算
+    """
     print(f"\n🔍 开始处理{process_type.upper()}特征...")
     print("=" * 80)
     
@@ -235,42 +313,62 @@ def process_with_processes(names, process_type, max_workers=4):
         process_id = i % max_workers + 1
         tasks.append((name, clean_name, process_id))
     
+    if process_type == 'wt' and dedup_wt:
+        groups = group_wt_tasks(tasks, local_pair)
+        print(f"🧬 {len(tasks)} 个样本共 {len(groups)} 个唯一WT结构")
+    else:
+        groups = [(task, []) for task in tasks]
+    
     # 统计变量
     success_count = 0
     skip_count = 0
     error_count = 0
     
+    def record(name, proc_type, success, message):
+        nonlocal success_count, skip_count, error_count
+        if success:
+            success_count += 1
+            print(f"✅ {name} {proc_type}特征生成完成")
+        elif "出错" in message or "失败" in message:
+            error_count += 1
+            print(f"❌ {name} {proc_type}处理出错: {message}")
+        else:
+            skip_count += 1
+            print(f"⏭️ {name} {proc_type}跳过: {message}")
+    
     # 选择处理函数
     process_func = process_wt_features if process_type == 'wt' else process_mut_features
     
     # 使用ProcessPoolExecutor进行多进程处理
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有任务
-        future_to_task = {executor.submit(process_func, task): task for task in tasks}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_feature_worker,
+                             initargs=(GEOSTAB_DIR, scratch_root, in_process, local_pair,
+                                       delta_tolerance)) as executor:
+        # 每组只提交代表样本
+        future_to_group = {executor.submit(process_func, task): (task, members) for task, members in groups}
         
         # 使用tqdm显示进度
         with tqdm(total=len(tasks), desc=f"生成{process_type.upper()}特征") as pbar:
-            for future in as_completed(future_to_task):
+            for future in as_completed(future_to_group):
+                task, members = future_to_group[future]
                 try:
                     name, proc_type, success, message = future.result()
-                    
+                except Exception as e:
+                    name, proc_type, success, message = task[0], process_type, False, f"任务执行出错: {e}"
+                record(name, proc_type, success, message)
+                
+                # 同组成员共享代表样本的结果
+                for member_name, member_clean_name, _ in members:
                     if success:
-                        success_count += 1
-                        print(f"✅ {name} {proc_type}特征生成完成")
+                        try:
+                            link_wt_features(task[1], member_clean_name, local_pair)
+                            print(f"🔗 {member_name} wt特征链接自 {name}")
+                            record(member_name, proc_type, True, "成功")
+                        except OSError as e:
+                            record(member_name, proc_type, False, f"链接WT特征失败: {e}")
                     else:
-                        if "出错" in message or "失败" in message:
-                            error_count += 1
-                            print(f"❌ {name} {proc_type}处理出错: {message}")
-                        else:
-                            skip_count += 1
-                            print(f"⏭️ {name} {proc_type}跳过: {message}")
-                    
-                    pbar.update(1)
-                    
-                except Exception as e:
-                    error_count += 1
-                    print(f"❌ 任务执行出错: {e}")
-                    pbar.update(1)
+                        record(member_name, proc_type, False, message)
+                
+                pbar.update(1 + len(members))
     
     return success_count, skip_count, error_count
 
@@ -293,6 +391,16 @@ def main():
     parser.add_argument('--process_all', action='store_true', help='处理所有特征 (WT和mut)')
     parser.add_argument('--batch_size', type=int, default=100, 
                        help='批处理大小 (默认: 100)')
+    parser.add_argument('--subprocess', action='store_true',
+                       help='每个样本用子进程运行coordinate.py/pair.py (旧方式)')
+    parser.add_argument('--no_wt_dedup', action='store_true',
+                       help='不按结构去重，逐个样本生成WT特征')
+    parser.add_argument('--local_pair', action='store_true',
+                       help='实验性：在pair.pt之外额外生成pair_local.pt (pair_features.py，mut增量重算；下游模型不读取)')
+    parser.add_argument('--delta_tolerance', type=float, default=DELTA_TOLERANCE,
+                       help=f'pair_local.pt判定残基移动的主链位移阈值Å (默认: {DELTA_TOLERANCE})')
+    parser.add_argument('--scratch_dir', type=str, default=TMPFS_DIR if os.path.isdir(TMPFS_DIR) else None,
+                       help=f'进程内生成时的临时目录 (默认: {TMPFS_DIR})')
     
     args = parser.parse_args()
     
@@ -329,13 +437,15 @@ def main():
     # 处理WT特征
     if args.process_wt or args.process_all:
         wt_success_count, wt_skip_count, wt_error_count = process_with_processes(
-            names, 'wt', args.max_workers
+            names, 'wt', args.max_workers, not args.subprocess, args.scratch_dir,
+            not args.no_wt_dedup, args.local_pair, args.delta_tolerance
         )
     
     # 处理mut特征
     if args.process_mut or args.process_all:
         mut_success_count, mut_skip_count, mut_error_count = process_with_processes(
-            names, 'mut', args.max_workers
+            names, 'mut', args.max_workers, not args.subprocess, args.scratch_dir,
+            local_pair=args.local_pair, delta_tolerance=args.delta_tolerance
         )
     
     end_time = time.time()
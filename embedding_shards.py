@@ -0,0 +1,286 @@
+"""
+打包的内存映射嵌入分片
+把成千上万个小的 esm2.pt / esm1v-{i}.pt 打包成连续的 float16/float32 数据块 + 偏移索引，
+读取时内存映射，直接得到零拷贝的张量视图
+
+目录结构:
+    <shard_dir>/meta.json          {"dtype": "float16"}
+    <shard_dir>/shard-00000.bin    连续存放的 [L, D] 数组
+    <shard_dir>/index.jsonl        每行 {"name", "shard", "offset", "length", "dim", "key"}
+"""
+
+import json
+import os
+from pathlib import Path
+
+import click
+import numpy as np
+import torch
+from tqdm import tqdm
+
+from embedding_store import sequence_key
+from esm_batching import DEFAULT_MAX_TOKENS, BatchStats, make_token_batches
+from esm_engine import check_file_exists, read_fasta_sequence
+
+SUPPORTED_DTYPES = ('float16', 'float32')
+DEFAULT_MAX_SHARD_BYTES = 2 * 1024 ** 3
+
+
+def shard_file(shard_dir, shard_id):
+    return os.path.join(shard_dir, f"shard-{shard_id:05d}.bin")
+
+
+def load_shard_index(shard_dir):
+    """读取index.jsonl，返回 name -> 索引项；同名的后写入覆盖先写入"""
+    index = {}
+    index_file = os.path.join(shard_dir, "index.jsonl")
+    if not os.path.exists(index_file):
+        return index
+    with open(index_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # 写到一半被中断的最后一行
+                continue
+            index[entry['name']] = entry
+    return index
+
+
+class ShardWriter:
+    """向分片目录追加嵌入，可中断后继续追加"""
+
+    def __init__(self, shard_dir, dtype='float16', max_shard_bytes=DEFAULT_MAX_SHARD_BYTES):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"不支持的dtype: {dtype}，可选: {SUPPORTED_DTYPES}")
+        os.makedirs(shard_dir, exist_ok=True)
+        self.shard_dir = shard_dir
+        self.max_shard_bytes = max_shard_bytes
+
+        meta_file = os.path.join(shard_dir, "meta.json")
+        if os.path.exists(meta_file):
+            with open(meta_file, 'r') as f:
+                existing_dtype = json.load(f)['dtype']
+            if existing_dtype != dtype:
+                raise ValueError(f"分片目录已使用 {existing_dtype}，不能以 {dtype} 追加")
+        else:
+            with open(meta_file, 'w') as f:
+                json.dump({'dtype': dtype}, f)
+        self.dtype = np.dtype(dtype)
+
+        self.index = load_shard_index(shard_dir)
+        # 相同内容（key）只存一份，后续同key的名字直接指向已有偏移
+        self.key_to_entry = {entry['key']: entry for entry in self.index.values() if entry.get('key')}
+
+        self.shard_id = max((entry['shard'] for entry in self.index.values()), default=0)
+        self._bin = open(shard_file(shard_dir, self.shard_id), 'ab')
+        self._index_file = open(os.path.join(shard_dir, "index.jsonl"), 'a')
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def _write_entry(self, entry):
+        self._index_file.write(json.dumps(entry) + '\n')
+        self._index_file.flush()
+        self.index[entry['name']] = entry
+        if entry.get('key'):
+            self.key_to_entry.setdefault(entry['key'], entry)
+
+    def append(self, name, tensor, key=None):
+        """追加一个 [L, D] 张量；key相同的内容只写一次"""
+        if key is not None and key in self.key_to_entry:
+            entry = dict(self.key_to_entry[key], name=name)
+            self._write_entry(entry)
+            return entry
+
+        array = np.ascontiguousarray(tensor.detach().cpu().float().numpy().astype(self.dtype))
+        if array.ndim != 2:
+            raise ValueError(f"{name}: 只支持 [L, D] 张量，实际形状 {array.shape}")
+
+        # 当前分片写满后切换到新分片
+        if self._bin.tell() > 0 and self._bin.tell() + array.nbytes > self.max_shard_bytes:
+            self._bin.close()
+            self.shard_id += 1
+            self._bin = open(shard_file(self.shard_dir, self.shard_id), 'ab')
+
+        offset = self._bin.tell() // self.dtype.itemsize
+        self._bin.write(array.tobytes())
+        # 数据先落盘，再写索引，中断时最多留下无索引的尾部数据
+        self._bin.flush()
+        entry = {
+            'name': name,
+            'shard': self.shard_id,
+            'offset': offset,
+            'length': int(array.shape[0]),
+            'dim': int(array.shape[1]),
+            'key': key,
+        }
+        self._write_entry(entry)
+        return entry
+
+    def close(self):
+        self._bin.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """内存映射读取分片，get返回零拷贝的张量视图"""
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, "meta.json"), 'r') as f:
+            self.dtype = np.dtype(json.load(f)['dtype'])
+        self.index = load_shard_index(shard_dir)
+        self._maps = {}
+
+    def _map(self, shard_id):
+        if shard_id not in self._maps:
+            # 写时复制映射：不会改动文件，torch也能直接包装为张量
+            self._maps[shard_id] = np.memmap(shard_file(self.shard_dir, shard_id), dtype=self.dtype, mode='c')
+        return self._maps[shard_id]
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return list(self.index.keys())
+
+    def get(self, name):
+        """返回 [L, D] 张量视图（与映射共享内存）"""
+        entry = self.index[name]
+        start = entry['offset']
+        end = start + entry['length'] * entry['dim']
+        view = self._map(entry['shard'])[start:end].reshape(entry['length'], entry['dim'])
+        return torch.from_numpy(view)
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+
+def sample_feature_name(clean_name, side):
+    """分片中的条目名：<样本名>/<wt|mut>"""
+    return f"{clean_name}/{side}"
+
+
+def convert_pt_tree(data_dir, shard_dir, feature_file="esm2.pt", dtype='float16', sides=('wt', 'mut')):
+    """把 DATA_DIR/<name>/{wt,mut}_data/<feature_file> 打包成分片，已打包的条目跳过"""
+    data_dir = Path(data_dir)
+    sample_dirs = sorted(p for p in data_dir.iterdir() if p.is_dir())
+
+    converted_count = 0
+    skip_count = 0
+    missing_count = 0
+    error_count = 0
+    with ShardWriter(shard_dir, dtype=dtype) as writer:
+        for sample_dir in tqdm(sample_dirs, desc=f"打包{feature_file}"):
+            for side in sides:
+                name = sample_feature_name(sample_dir.name, side)
+                pt_file = sample_dir / f"{side}_data" / feature_file
+                if name in writer:
+                    skip_count += 1
+                    continue
+                if not check_file_exists(str(pt_file)):
+                    missing_count += 1
+                    continue
+                try:
+                    # 硬链接到内容寻址存储的文件共享inode，用inode做key避免重复写入
+                    stat = pt_file.stat()
+                    key = f"inode:{stat.st_dev}:{stat.st_ino}" if stat.st_nlink > 1 else None
+                    writer.append(name, torch.load(pt_file, map_location='cpu'), key=key)
+                    converted_count += 1
+                except Exception as e:
+                    error_count += 1
+                    print(f"❌ {pt_file}: {e}")
+    return converted_count, skip_count, missing_count, error_count
+
+
+def embed_into_shards(engine, pairs, writer, max_tokens=DEFAULT_MAX_TOKENS, stats=None):
+    """
+    ESM引擎直接追加写入分片：(name, fasta_file) 中已在分片里的跳过，相同序列只推理一次
+    逐条产出 (name, status, message)，status 为 'generated' / 'linked' / 'skipped' / 'failed'
+    """
+    groups = {}
+    for name, fasta_file in pairs:
+        if name in writer:
+            yield name, 'skipped', name
+            continue
+        if not check_file_exists(fasta_file):
+            yield name, 'failed', f"找不到FASTA文件: {fasta_file}"
+            continue
+        try:
+            seq = read_fasta_sequence(fasta_file)
+        except Exception as e:
+            yield name, 'failed', f"读取FASTA出错: {e}"
+            continue
+        key = sequence_key(engine.model_id, engine.layer, seq)
+        groups.setdefault(key, (seq, []))[1].append(name)
+
+    # 分片中已有相同内容的序列直接指向已有偏移
+    missing = []
+    for key, (seq, members) in groups.items():
+        if key in writer.key_to_entry:
+            for name in members:
+                writer.append(name, None, key=key)
+                yield name, 'linked', name
+        else:
+            missing.append((key, seq, members))
+
+    stats = stats if stats is not None else BatchStats()
+    batches = make_token_batches(missing, max_tokens, length_fn=lambda item: len(item[1]))
+    for index, reps_list in engine.embed_batches([[seq for _, seq, _ in batch] for batch in batches], stats):
+        batch = batches[index]
+        if isinstance(reps_list, Exception):
+            for _, _, members in batch:
+                for name in members:
+                    yield name, 'failed', f"组批推理出错: {reps_list}"
+            continue
+
+        for (key, _, members), reps in zip(batch, reps_list):
+            writer.append(members[0], reps, key=key)
+            yield members[0], 'generated', members[0]
+            for name in members[1:]:
+                writer.append(name, None, key=key)
+                yield name, 'linked', name
+
+
+@click.command()
+@click.option("--data_dir", default="/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train", type=str, help="样本根目录")
+@click.option("--shard_dir", required=True, type=str, help="分片输出目录")
+@click.option("--feature_file", default="esm2.pt", type=str, help="要打包的特征文件名，如esm2.pt、esm1v-1.pt")
+@click.option("--dtype", default="float16", type=click.Choice(SUPPORTED_DTYPES), help="分片中的数据类型")
+def main(data_dir, shard_dir, feature_file, dtype):
+    """
+    把现有的逐样本 .pt 特征打包成内存映射分片
+
+    使用方法：
+    python embedding_shards.py --shard_dir /path/to/shards/esm2 --feature_file esm2.pt
+    """
+    if not os.path.exists(data_dir):
+        print(f"❌ 错误: 目录不存在: {data_dir}")
+        return
+
+    print(f"📁 样本目录: {data_dir}")
+    print(f"📦 分片目录: {shard_dir} ({dtype})")
+    converted_count, skip_count, missing_count, error_count = convert_pt_tree(data_dir, shard_dir, feature_file, dtype)
+
+    print(f"\n🎉 打包完成！")
+    print(f"✅ 打包: {converted_count}")
+    print(f"⏭️  已存在: {skip_count}")
+    print(f"⚠️  缺少{feature_file}: {missing_count}")
+    print(f"❌ 错误: {error_count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+按序列内容寻址的嵌入存储
+键为 SHA-256(模型ID, 层, 序列)，相同序列只计算一次，样本目录通过硬链接/软链接指向存储中的文件，
+替代按PDB ID去重后再 shutil.copy2 到每个 wt_data 目录的做法
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import torch
+
+from esm_batching import DEFAULT_MAX_TOKENS, BatchStats, make_token_batches
+from esm_engine import check_file_exists, read_fasta_sequence, save_tensor_atomic
+
+EMBEDDING_STORE_DIR = "/home/corp/xingqiao.lin/code/GeoStab/data/embedding_store"
+
+# 链接方式依次尝试：硬链接（同一文件系统） → 软链接 → 复制
+LINK_MODES = ('hardlink', 'symlink', 'copy')
+
+
+def sequence_key(model_id, layer, seq):
+    """计算 (模型ID, 层, 序列) 的SHA-256键"""
+    content = f"{model_id}\0{layer}\0{seq}".encode()
+    return hashlib.sha256(content).hexdigest()
+
+
+def link_file(source_file, target_file, mode='hardlink'):
+    """
+    将target_file指向source_file，按 mode 及其后的方式依次尝试
+    返回实际使用的方式
+    """
+    os.makedirs(os.path.dirname(target_file) or '.', exist_ok=True)
+    last_error = None
+    for link_mode in LINK_MODES[LINK_MODES.index(mode):]:
+        # 先在同目录下建临时链接再替换，避免中途失败留下半个文件
+        tmp_dir = tempfile.mkdtemp(prefix='.link-', dir=os.path.dirname(target_file) or '.')
+        tmp_file = os.path.join(tmp_dir, os.path.basename(target_file))
+        try:
+            if link_mode == 'hardlink':
+                os.link(source_file, tmp_file)
+            elif link_mode == 'symlink':
+                os.symlink(os.path.abspath(source_file), tmp_file)
+            else:
+                shutil.copy2(source_file, tmp_file)
+            os.replace(tmp_file, target_file)
+            return link_mode
+        except OSError as e:
+            last_error = e
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    raise last_error
+
+
+class EmbeddingStore:
+    """内容寻址的嵌入存储：<root>/<key前两位>/<key>/<output_name>"""
+
+    def __init__(self, root=EMBEDDING_STORE_DIR, link_mode='hardlink'):
+        self.root = root
+        self.link_mode = link_mode
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key, output_name):
+        # 文件名保持与样本目录中的一致（torch.save会把文件名写进归档）
+        return os.path.join(self.root, key[:2], key, output_name)
+
+    def contains(self, key, output_name):
+        return check_file_exists(self.path_for(key, output_name))
+
+    def lookup(self, model_id, layer, seq, output_name):
+        """查询某条序列的嵌入文件路径，不存在时返回None"""
+        path = self.path_for(sequence_key(model_id, layer, seq), output_name)
+        return path if check_file_exists(path) else None
+
+    def put(self, key, tensor, output_name):
+        """写入嵌入，返回存储中的路径"""
+        path = self.path_for(key, output_name)
+        save_tensor_atomic(tensor, path)
+        return path
+
+    def load(self, key, output_name):
+        return torch.load(self.path_for(key, output_name))
+
+    def link_into(self, key, output_name, target_file):
+        """让样本目录中的target_file指向存储中的文件，返回实际使用的链接方式"""
+        return link_file(self.path_for(key, output_name), target_file, self.link_mode)
+
+
+def embed_into_store(engine, pairs, store, output_name=None, max_tokens=DEFAULT_MAX_TOKENS, skip_existing=True, stats=None):
+    """
+    为 (sample, fasta_file) 迭代器生成嵌入：相同序列只推理一次，结果写入存储后链接到每个样本目录
+    逐条产出 (sample, status, message)，status 为 'generated' / 'linked' / 'skipped' / 'failed'
+    """
+    output_name = output_name or engine.output_name
+
+    # 按序列键分组：key -> (seq, [(sample, target_file), ...])
+    groups = {}
+    for sample, fasta_file in pairs:
+        target_file = os.path.join(os.path.dirname(fasta_file), output_name)
+
+        if skip_existing and check_file_exists(target_file):
+            yield sample, 'skipped', target_file
+            continue
+
+        if not check_file_exists(fasta_file):
+            yield sample, 'failed', f"找不到FASTA文件: {fasta_file}"
+            continue
+
+        try:
+            seq = read_fasta_sequence(fasta_file)
+        except Exception as e:
+            yield sample, 'failed', f"读取FASTA出错: {e}"
+            continue
+
+        key = sequence_key(engine.model_id, engine.layer, seq)
+        groups.setdefault(key, (seq, []))[1].append((sample, target_file))
+
+    def link_members(key, members, status):
+        for sample, target_file in members:
+            try:
+                store.link_into(key, output_name, target_file)
+                yield sample, status, target_file
+            except OSError as e:
+                yield sample, 'failed', f"链接{output_name}失败: {e}"
+
+    # 已在存储中的序列直接链接
+    missing = []
+    for key, (seq, members) in groups.items():
+        if store.contains(key, output_name):
+            yield from link_members(key, members, 'linked')
+        else:
+            missing.append((key, seq, members))
+
+    # 缺失的唯一序列组批推理，每组第一个样本记为generated，其余为linked
+    stats = stats if stats is not None else BatchStats()
+    batches = make_token_batches(missing, max_tokens, length_fn=lambda item: len(item[1]))
+    for index, reps_list in engine.embed_batches([[seq for _, seq, _ in batch] for batch in batches], stats):
+        batch = batches[index]
+        if isinstance(reps_list, Exception):
+            for _, _, members in batch:
+                for sample, _ in members:
+                    yield sample, 'failed', f"组批推理出错: {reps_list}"
+            continue
+
+        for (key, _, members), reps in zip(batch, reps_list):
+            try:
+                store.put(key, reps, output_name)
+            except Exception as e:
+                for sample, _ in members:
+                    yield sample, 'failed', f"写入存储出错: {e}"
+                continue
+            yield from link_members(key, members[:1], 'generated')
+            yield from link_members(key, members[1:], 'linked')
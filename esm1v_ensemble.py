@@ -0,0 +1,157 @@
+"""
+ESM-1v 五模型集成特征生成
+交换循环顺序：加载模型i一次 → 全数据集所有唯一的WT/mut序列依次流过 → 写出 esm1v-{i}.pt → 释放 → 模型i+1
+峰值内存只有一个模型；结果按 (模型, 序列) 写入内容寻址存储，中断后重跑不会重复已完成的模型和序列
+"""
+
+import gc
+import json
+import os
+from collections import defaultdict
+
+import click
+from tqdm import tqdm
+
+from embedding_store import EMBEDDING_STORE_DIR, EmbeddingStore, embed_into_store
+from esm_batching import DEFAULT_MAX_TOKENS, BatchStats
+from esm_chunking import ChunkedEmbeddingEngine
+from esm_engine import INFERENCE_BACKENDS, HfEsmEmbeddingEngine, backend_model_id, esm1v_model_dir
+from esm_shared_pool import SharedModelPool
+from pipeline_io import load_names_from_csv
+
+DATA_DIR = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train"
+CSV_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754.csv"
+
+
+class LazyEsm1vEngine:
+    """
+    延迟加载的ESM-1v引擎：缓存键所需的 model_id / layer 直接从config.json读取，
+    只有真正存在缺失序列时才加载权重，已完成的模型重跑时不会被加载
+    """
+
+    def __init__(self, model_index, device="cpu", num_workers=1, backend='fp32'):
+        self.model_dir = esm1v_model_dir(model_index)
+        self.output_name = f"esm1v-{model_index}.pt"
+        self.device = device
+        self.num_workers = num_workers
+        self.backend = backend
+        with open(os.path.join(self.model_dir, "config.json"), 'r') as f:
+            config = json.load(f)
+        self.model_id = backend_model_id(os.path.basename(os.path.normpath(self.model_dir)), backend)
+        self.layer = config['num_hidden_layers']
+        self._engine = None
+
+    @property
+    def loaded(self):
+        return self._engine is not None
+
+    def _get_engine(self):
+        if self._engine is None:
+            # 超过1022个残基的序列分块嵌入后拼接，而不是报错或被截断
+            engine = ChunkedEmbeddingEngine(HfEsmEmbeddingEngine(self.model_dir, self.output_name, self.device, self.backend))
+            if self.num_workers > 1:
+                engine = SharedModelPool(engine, self.num_workers)
+            self._engine = engine
+        return self._engine
+
+    def embed_batch(self, seqs):
+        return self._get_engine().embed_batch(seqs)
+
+    def embed_sequence(self, seq):
+        return self._get_engine().embed_sequence(seq)
+
+    def embed_batches(self, batches, stats=None):
+        batches = list(batches)
+        if not batches:
+            return iter(())
+        return self._get_engine().embed_batches(batches, stats)
+
+    def close(self):
+        """释放模型，保证同一时间只驻留一个模型"""
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+            gc.collect()
+
+
+def build_sample_pairs(names, data_dir=DATA_DIR, sides=('wt', 'mut')):
+    """所有样本的 ((name, side), fasta_file) 列表"""
+    pairs = []
+    for side in sides:
+        for name in names:
+            clean_name = name.replace(' ', '_')
+            pairs.append(((name, side), f'{data_dir}/{clean_name}/{side}_data/result.fasta'))
+    return pairs
+
+
+def run_esm1v_ensemble(names, model_indices=(1, 2, 3, 4, 5), data_dir=DATA_DIR, store_dir=EMBEDDING_STORE_DIR,
+                       sides=('wt', 'mut'), max_tokens=DEFAULT_MAX_TOKENS, device="cpu", num_workers=1, backend='fp32'):
+    """依次用每个ESM-1v模型处理全部样本，返回 {模型序号: {side: {status: 数量}}}"""
+    store = EmbeddingStore(store_dir)
+    pairs = build_sample_pairs(names, data_dir, sides)
+    summary = {}
+
+    for model_index in model_indices:
+        print(f"\n🔍 ESM-1v 模型 {model_index} (共 {len(model_indices)} 个)")
+        print("=" * 80)
+        engine = LazyEsm1vEngine(model_index, device, num_workers, backend)
+        counts = {side: defaultdict(int) for side in sides}
+        stats = BatchStats()
+        try:
+            results = embed_into_store(engine, pairs, store, max_tokens=max_tokens, stats=stats)
+            for (name, side), status, message in tqdm(results, total=len(pairs), desc=f"esm1v-{model_index}"):
+                counts[side][status] += 1
+                if status == 'failed':
+                    print(f"❌ {name} {side}: {message}")
+        finally:
+            was_loaded = engine.loaded
+            engine.close()
+
+        if was_loaded:
+            stats.report(f"ESM-1v-{model_index} ")
+        else:
+            print(f"⏭️ 模型 {model_index} 的所有序列已在存储中，未加载模型")
+        summary[model_index] = counts
+
+    return summary
+
+
+@click.command()
+@click.option("--csv_file", default=CSV_FILE, type=str, help="包含name列的数据集CSV")
+@click.option("--data_dir", default=DATA_DIR, type=str, help="样本根目录")
+@click.option("--store_dir", default=EMBEDDING_STORE_DIR, type=str, help="内容寻址嵌入存储目录")
+@click.option("--models", default="1,2,3,4,5", type=str, help="要运行的ESM-1v模型序号，逗号分隔")
+@click.option("--sides", default="wt,mut", type=str, help="处理wt和/或mut")
+@click.option("--max_tokens", default=DEFAULT_MAX_TOKENS, type=int, help="每批最多token数（含padding）")
+@click.option("--num_workers", default=1, type=int, help="共享权重的CPU推理进程数")
+@click.option("--device", default="cpu", type=str, help="cpu 或 cuda")
+@click.option("--backend", default="fp32", type=click.Choice(INFERENCE_BACKENDS), help="推理后端")
+def main(csv_file, data_dir, store_dir, models, sides, max_tokens, num_workers, device, backend):
+    """
+    ESM-1v 1-5 集成特征生成（每个模型只加载一次）
+
+    使用方法：
+    python esm1v_ensemble.py --models 1,2,3,4,5 --num_workers 8
+    """
+    names = load_names_from_csv(csv_file)
+    if not names:
+        print(f"❌ 没有可处理的样本: {csv_file}")
+        return
+
+    model_indices = [int(i) for i in models.split(',') if i.strip()]
+    side_list = tuple(side.strip() for side in sides.split(',') if side.strip())
+    print(f"🚀 ESM-1v集成: 模型 {model_indices}, {len(names)} 个样本, {side_list}")
+
+    summary = run_esm1v_ensemble(names, model_indices, data_dir, store_dir, side_list, max_tokens, device, num_workers, backend)
+
+    print("\n" + "=" * 80)
+    print("📊 处理完成统计:")
+    print("=" * 80)
+    for model_index, counts in summary.items():
+        for side, side_counts in counts.items():
+            print(f"esm1v-{model_index} {side}: ✅ 生成 {side_counts['generated']}  🔗 链接 {side_counts['linked']}  "
+                  f"⏭️ 跳过 {side_counts['skipped']}  ❌ 失败 {side_counts['failed']}")
+
+
+if __name__ == "__main__":
+    main()
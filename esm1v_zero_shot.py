@@ -0,0 +1,206 @@
+"""
+ESM-1v 零样本 ddG 打分（wt-marginal / masked-marginal）
+每个唯一的WT序列只做一次前向（masked-marginal 为每个突变位点一次遮盖前向），
+对组内每个突变输出 log p(mut) − log p(wt)（多点突变按位点相加），整个CSV写成一张列式表，
+替代对 ~8.7k 个突变序列逐条前向
+"""
+
+import gc
+import re
+from collections import defaultdict
+
+import click
+import pandas as pd
+from tqdm import tqdm
+
+from esm_batching import DEFAULT_MAX_TOKENS, make_token_batches
+from esm_chunking import ESM_MAX_RESIDUES
+from esm_engine import INFERENCE_BACKENDS, HfEsmEmbeddingEngine, esm1v_model_dir
+from generate_individual_lists import locate_mutation_indices, mutation_line, parse_mutations_from_name
+
+CSV_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754.csv"
+SCORING_MODES = ('wt-marginal', 'masked-marginal')
+
+
+def extract_pdb_id(name):
+    """从蛋白质名称中提取PDB ID"""
+    # 格式: rcsb_1ABC_A_... -> 1ABC
+    match = re.match(r'rcsb_([A-Z0-9]+)_', name)
+    return match.group(1) if match else None
+
+
+def collect_mutations(train):
+    """
+    解析CSV中每一行的突变，按WT序列分组
+    返回 (groups, rows)：groups 为 wt_seq -> [行号, ...]；rows 为每行的解析结果（无法解析时含error）
+    """
+    groups = defaultdict(list)
+    rows = []
+    for row_idx, row in enumerate(train.itertuples(index=False)):
+        name = row.name.replace(' ', '_')
+        record = {'name': row.name, 'pdb_id': extract_pdb_id(name)}
+        mutations = parse_mutations_from_name(name)
+        if mutations is None:
+            record['error'] = "无法从名称解析突变信息"
+            rows.append(record)
+            continue
+
+        seq_indices = locate_mutation_indices(row.wt_seq, mutations, getattr(row, 'mut_seq', None))
+        record.update({'mutation': mutation_line(mutations).rstrip(';'), 'num_mutations': len(mutations)})
+        if len(mutations) == 1:
+            chain_id, position, wt_aa, mut_aa = mutations[0]
+            record.update({'chain': chain_id, 'position': position, 'wt_aa': wt_aa, 'mut_aa': mut_aa,
+                           'seq_index': seq_indices[0] if seq_indices else None})
+        if seq_indices is None:
+            record['error'] = f"wt_seq中找不到 {record['mutation']}"
+        else:
+            record['sites'] = [(index, m.wt_aa, m.mut_aa) for index, m in zip(seq_indices, mutations)]
+            groups[row.wt_seq].append(row_idx)
+        rows.append(record)
+    return groups, rows
+
+
+def site_score(engine, log_probs_by_index, sites):
+    """各位点 log p(mut) − log p(wt) 之和（多点突变按加性模型）"""
+    score = 0.0
+    for seq_index, wt_aa, mut_aa in sites:
+        wt_id, mut_id = engine.token_ids(wt_aa + mut_aa)
+        position_log_probs = log_probs_by_index[seq_index]
+        score += (position_log_probs[mut_id] - position_log_probs[wt_id]).item()
+    return score
+
+
+def score_with_model(engine, groups, rows, mode='wt-marginal', max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    用一个模型为所有突变打分，返回 (行号 -> 分数, 行号 -> 错误信息)
+    超过ESM位置上限的WT序列直接跳过（对数概率不能像嵌入那样分块拼接）；单个WT组出错只影响该组的行
+    """
+    scores = {}
+    errors = {}
+
+    def fail(wt_seq, message):
+        for row_idx in groups[wt_seq]:
+            errors[row_idx] = message
+
+    wt_seqs = []
+    for wt_seq in groups:
+        if len(wt_seq) > ESM_MAX_RESIDUES:
+            fail(wt_seq, f"WT序列长度 {len(wt_seq)} 超过ESM-1v上限 {ESM_MAX_RESIDUES}，跳过")
+        else:
+            wt_seqs.append(wt_seq)
+    if errors:
+        print(f"⚠️ {len(groups) - len(wt_seqs)} 条WT序列超过 {ESM_MAX_RESIDUES} 个残基，已跳过")
+
+    def score_group(wt_seq, log_probs):
+        for row_idx in groups[wt_seq]:
+            scores[row_idx] = site_score(engine, log_probs, rows[row_idx]['sites'])
+
+    if mode == 'wt-marginal':
+        # 每个唯一WT序列一次前向，WT序列之间再按token预算组批；整批出错时逐条重试，只把真正出错的组记为失败
+        for batch in tqdm(make_token_batches(wt_seqs, max_tokens), desc="wt-marginal"):
+            try:
+                results = list(zip(batch, engine.log_probs_batch(batch)))
+            except Exception:
+                results = []
+                for wt_seq in batch:
+                    try:
+                        results.append((wt_seq, engine.log_probs_batch([wt_seq])[0]))
+                    except Exception as e:
+                        fail(wt_seq, f"打分出错: {type(e).__name__}: {e}")
+            for wt_seq, log_probs in results:
+                try:
+                    score_group(wt_seq, log_probs)
+                except Exception as e:
+                    fail(wt_seq, f"打分出错: {type(e).__name__}: {e}")
+    else:
+        # 每个唯一WT序列的每个突变位点各遮盖一次
+        for wt_seq in tqdm(wt_seqs, desc="masked-marginal"):
+            try:
+                positions = sorted({site[0] for row_idx in groups[wt_seq] for site in rows[row_idx]['sites']})
+                score_group(wt_seq, engine.masked_log_probs(wt_seq, positions, max_tokens))
+            except Exception as e:
+                fail(wt_seq, f"打分出错: {type(e).__name__}: {e}")
+    # 出错组中可能已有部分行写入分数，以错误为准
+    for row_idx in errors:
+        scores.pop(row_idx, None)
+    return scores, errors
+
+
+def run_zero_shot(train, model_indices=(1,), mode='wt-marginal', max_tokens=DEFAULT_MAX_TOKENS, device="cpu", backend='fp32'):
+    """
+    对CSV中的全部突变打分，返回列式表：
+    name, pdb_id, mutation, num_mutations, chain, position, wt_aa, mut_aa, seq_index（单点突变）, esm1v_{i}_{mode}..., esm1v_mean_{mode}, error
+    """
+    if mode not in SCORING_MODES:
+        raise ValueError(f"不支持的打分模式: {mode}，可选: {SCORING_MODES}")
+
+    groups, rows = collect_mutations(train)
+    num_mutations = sum(len(v) for v in groups.values())
+    print(f"📊 {len(rows)} 行, 可打分突变 {num_mutations} 个, 唯一WT序列 {len(groups)} 条")
+
+    table = pd.DataFrame([{k: v for k, v in row.items() if k != 'sites'} for row in rows])
+    for column in ('position', 'seq_index'):
+        if column in table:
+            table[column] = table[column].astype('Int64')
+    score_columns = []
+    for model_index in model_indices:
+        print(f"\n🔍 ESM-1v 模型 {model_index}: {mode}")
+        engine = HfEsmEmbeddingEngine(esm1v_model_dir(model_index), device=device, backend=backend)
+        scores, errors = score_with_model(engine, groups, rows, mode, max_tokens)
+        column = f"esm1v_{model_index}_{mode.replace('-', '_')}"
+        table[column] = pd.Series(scores, dtype='float64')
+        if errors:
+            print(f"❌ 模型 {model_index}: {len(errors)} 个突变打分失败")
+            if 'error' not in table:
+                table['error'] = pd.Series(dtype='object')
+            for row_idx, message in errors.items():
+                previous = table.at[row_idx, 'error']
+                message = f"esm1v_{model_index}: {message}"
+                table.at[row_idx, 'error'] = message if pd.isna(previous) else f"{previous}; {message}"
+        score_columns.append(column)
+        # 同一时间只驻留一个模型
+        del engine
+        gc.collect()
+
+    if len(score_columns) > 1:
+        table[f"esm1v_mean_{mode.replace('-', '_')}"] = table[score_columns].mean(axis=1)
+    return table
+
+
+def save_table(table, output_file):
+    """按扩展名保存为Parquet或CSV"""
+    if output_file.endswith('.parquet'):
+        table.to_parquet(output_file, index=False)
+    else:
+        table.to_csv(output_file, index=False)
+
+
+@click.command()
+@click.option("--csv_file", default=CSV_FILE, type=str, help="包含name、wt_seq、mut_seq列的数据集CSV")
+@click.option("--output_file", required=True, type=str, help="输出表（.csv 或 .parquet）")
+@click.option("--mode", default="wt-marginal", type=click.Choice(SCORING_MODES), help="打分模式")
+@click.option("--models", default="1", type=str, help="ESM-1v模型序号，逗号分隔，如 1,2,3,4,5")
+@click.option("--max_tokens", default=DEFAULT_MAX_TOKENS, type=int, help="每批最多token数")
+@click.option("--device", default="cpu", type=str, help="cpu 或 cuda")
+@click.option("--backend", default="fp32", type=click.Choice(INFERENCE_BACKENDS), help="推理后端")
+def main(csv_file, output_file, mode, models, max_tokens, device, backend):
+    """
+    ESM-1v零样本ddG打分，每个唯一WT序列只前向一次
+
+    使用方法：
+    python esm1v_zero_shot.py --output_file esm1v_zero_shot.csv --models 1,2,3,4,5
+    """
+    train = pd.read_csv(csv_file, sep=',')
+    model_indices = [int(i) for i in models.split(',') if i.strip()]
+    table = run_zero_shot(train, model_indices, mode, max_tokens, device, backend)
+    save_table(table, output_file)
+
+    error_count = int(table['error'].notna().sum()) if 'error' in table else 0
+    print(f"\n🎉 打分完成！")
+    print(f"✅ 打分: {len(table) - error_count}")
+    print(f"❌ 无法打分: {error_count}")
+    print(f"📁 输出: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+ESM推理后端基准：fp32 / bf16 / int8 / compile
+每个后端在独立的spawn子进程中对同一组序列做嵌入（峰值RSS互不干扰），报告吞吐、加载后与推理后的峰值RSS，
+以及相对fp32的逐残基余弦、最大绝对误差和MSE；ESM-1v模型另外比较下游零样本ddG打分与fp32（以及实验ddG）的Spearman相关，
+据此选出不影响预测的最快后端
+"""
+
+import multiprocessing as mp
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import click
+import pandas as pd
+import torch
+
+from esm1v_zero_shot import collect_mutations, score_with_model
+from esm_batching import DEFAULT_MAX_TOKENS, make_token_batches
+from esm_engine import INFERENCE_BACKENDS, build_engine
+from esm_local_window import compare_embeddings
+
+CSV_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754.csv"
+
+
+def peak_rss_mb():
+    """当前进程的峰值RSS（MB，Linux下ru_maxrss单位为KB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def spearman(a, b):
+    """Spearman相关（秩的Pearson相关，不依赖scipy），按索引对齐并忽略缺失值"""
+    a, b = a.align(b, join='inner')
+    valid = a.notna() & b.notna()
+    return a[valid].rank().corr(b[valid].rank())
+
+
+def _run_backend(model, backend, seqs, mutations, max_tokens, device, num_threads, out_file, model_dir=None):
+    """
+    子进程中运行一个后端：加载、预热、组批嵌入全部序列，嵌入按seqs顺序保存到out_file
+    mutations 为 (groups, rows) 时顺带计算wt-marginal零样本打分，打分失败的行数记在统计字典的 score_errors
+    返回 (统计字典, 行号 -> 分数 或 None)
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    start = time.time()
+    engine = build_engine(model, backend, device, model_dir)
+    load_seconds = time.time() - start
+    load_rss = peak_rss_mb()
+
+    # 预热：compile后端第一次前向包含编译时间，不计入吞吐
+    start = time.time()
+    engine.embed_batch([seqs[0]])
+    warmup_seconds = time.time() - start
+
+    reps_by_seq = {}
+    start = time.time()
+    for batch in make_token_batches(list(seqs), max_tokens):
+        for seq, reps in zip(batch, engine.embed_batch(batch)):
+            reps_by_seq[seq] = reps
+    seconds = time.time() - start
+    torch.save([reps_by_seq[seq] for seq in seqs], out_file)
+
+    scores, errors = None, {}
+    if mutations is not None:
+        groups, rows = mutations
+        scores, errors = score_with_model(engine, groups, rows, 'wt-marginal', max_tokens)
+
+    num_tokens = sum(len(seq) for seq in seqs)
+    stats = {
+        'backend': backend,
+        'load_seconds': load_seconds,
+        'warmup_seconds': warmup_seconds,
+        'seconds': seconds,
+        'seqs_per_second': len(seqs) / seconds if seconds > 0 else float('inf'),
+        'tokens_per_second': num_tokens / seconds if seconds > 0 else float('inf'),
+        'load_rss_mb': load_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if mutations is not None:
+        stats['score_errors'] = len(errors)
+    return stats, scores
+
+
+def benchmark_backends(model, backends, train, limit=None, max_tokens=DEFAULT_MAX_TOKENS, device="cpu",
+                       num_threads=None, ddg_column="ddG", model_dir=None):
+    """
+    对每个后端跑一遍，返回每个后端一行的表；fp32总是先运行并作为参照
+    model_dir 覆盖ESM-1v的模型目录（见 esm_engine.build_engine）
+    """
+    subset = train.head(limit) if limit is not None else train
+    seqs = sorted(set(subset['wt_seq']) | set(subset['mut_seq']))
+    mutations = collect_mutations(subset) if model.startswith('esm1v-') else None
+    backends = ['fp32'] + [backend for backend in backends if backend != 'fp32']
+    print(f"📊 {model}: {len(seqs)} 条唯一序列, 后端 {backends}")
+
+    tmp_dir = tempfile.mkdtemp(prefix='esm-backends-')
+    ctx = mp.get_context('spawn')
+    results = []
+    reference = None
+    reference_scores = None
+    try:
+        for backend in backends:
+            print(f"\n🔍 后端: {backend}")
+            out_file = os.path.join(tmp_dir, f"{backend}.pt")
+            try:
+                with ctx.Pool(1) as pool:
+                    stats, scores = pool.apply(
+                        _run_backend, (model, backend, seqs, mutations, max_tokens, device, num_threads, out_file,
+                                       model_dir))
+            except Exception as e:
+                print(f"❌ {backend} 出错: {e}")
+                results.append({'backend': backend, 'error': f"{type(e).__name__}: {e}"})
+                continue
+
+            reps_list = torch.load(out_file)
+            os.remove(out_file)
+            if reference is None:
+                reference = reps_list
+                reference_scores = pd.Series(scores, dtype='float64') if scores is not None else None
+
+            cos_means, cos_mins, mses, max_abs = [], [], [], 0.0
+            for reps, ref in zip(reps_list, reference):
+                cos_mean, cos_min, mse = compare_embeddings(reps, ref)
+                cos_means.append(cos_mean)
+                cos_mins.append(cos_min)
+                mses.append(mse)
+                max_abs = max(max_abs, (reps - ref).abs().max().item())
+            stats.update({
+                'cosine_mean': sum(cos_means) / len(cos_means),
+                'cosine_min': min(cos_mins),
+                'mse_mean': sum(mses) / len(mses),
+                'max_abs_diff': max_abs,
+            })
+
+            if scores is not None:
+                score_series = pd.Series(scores, dtype='float64')
+                stats['ddg_spearman_vs_fp32'] = spearman(score_series, reference_scores)
+                if ddg_column in subset:
+                    measured = subset[ddg_column].reset_index(drop=True)
+                    stats['ddg_spearman_vs_measured'] = spearman(score_series, measured)
+            results.append(stats)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    table = pd.DataFrame(results)
+    if 'seqs_per_second' in table and table['backend'].eq('fp32').any():
+        fp32_rate = table.loc[table['backend'] == 'fp32', 'seqs_per_second'].iloc[0]
+        table['speedup'] = table['seqs_per_second'] / fp32_rate
+    return table
+
+
+@click.command()
+@click.option("--csv_file", default=CSV_FILE, type=str, help="包含name、wt_seq、mut_seq列的数据集CSV")
+@click.option("--model", default="esm2", type=str, help="esm2 或 esm1v-{1..5}")
+@click.option("--backends", default=",".join(INFERENCE_BACKENDS), type=str, help="要测试的后端，逗号分隔")
+@click.option("--limit", default=200, type=int, help="只取前N行")
+@click.option("--max_tokens", default=DEFAULT_MAX_TOKENS, type=int, help="每批最多token数")
+@click.option("--device", default="cpu", type=str, help="cpu 或 cuda")
+@click.option("--num_threads", default=None, type=int, help="每个后端进程的线程数（默认不设置）")
+@click.option("--ddg_column", default="ddG", type=str, help="实验ddG列名（存在时报告与零样本打分的相关性）")
+@click.option("--model_dir", default=None, type=str, help="ESM-1v本地模型目录（默认按 --model 的序号查找）")
+@click.option("--output_file", default=None, type=str, help="结果表保存路径（CSV）")
+def main(csv_file, model, backends, limit, max_tokens, device, num_threads, ddg_column, model_dir, output_file):
+    """
+    比较ESM推理后端的吞吐、峰值内存和精度
+
+    使用方法：
+    python esm_backend_benchmark.py --model esm1v-1 --backends fp32,bf16,int8 --limit 500
+    """
+    train = pd.read_csv(csv_file, sep=',')
+    backend_list = [b.strip() for b in backends.split(',') if b.strip()]
+    for backend in backend_list:
+        if backend not in INFERENCE_BACKENDS:
+            raise click.BadParameter(f"不支持的推理后端: {backend}，可选: {INFERENCE_BACKENDS}")
+    table = benchmark_backends(model, backend_list, train, limit, max_tokens, device, num_threads, ddg_column,
+                               model_dir)
+
+    print("\n" + "=" * 80)
+    print(f"📊 {model} 推理后端对比（参照: fp32）:")
+    print("=" * 80)
+    print(table.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    if output_file:
+        table.to_csv(output_file, index=False)
+        print(f"📁 输出: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+按token预算动态组批
+先按序列长度排序，再在不超过max_tokens（含padding和<cls>/<eos>）的前提下尽量多地装入序列
+"""
+
+import time
+
+# 默认每批最多的token数（batch_size × 最长序列长度）
+DEFAULT_MAX_TOKENS = 4096
+
+
+def make_token_batches(items, max_tokens=DEFAULT_MAX_TOKENS, length_fn=len, max_batch_size=None, special_tokens=2):
+    """
+    将items按长度分桶组批，返回批次列表（每个批次是items的子列表）
+    每批的代价按 批大小 × (最长长度 + special_tokens) 计算，超长的单条序列单独成批
+    """
+    ordered = sorted(items, key=length_fn)
+    batches = []
+    current = []
+    current_max = 0
+    for item in ordered:
+        length = length_fn(item) + special_tokens
+        new_max = max(current_max, length)
+        too_many_tokens = new_max * (len(current) + 1) > max_tokens
+        too_many_items = max_batch_size is not None and len(current) >= max_batch_size
+        if current and (too_many_tokens or too_many_items):
+            batches.append(current)
+            current = []
+            new_max = length
+        current.append(item)
+        current_max = new_max
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BatchStats:
+    """统计组批推理的吞吐和padding浪费"""
+
+    def __init__(self):
+        self.num_sequences = 0
+        self.num_batches = 0
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.elapsed = 0.0
+        self._start = None
+
+    def start(self):
+        self._start = time.time()
+
+    def stop(self, lengths, special_tokens=2):
+        """记录一个批次：lengths为该批每条序列的残基数"""
+        if self._start is not None:
+            self.elapsed += time.time() - self._start
+            self._start = None
+        self.record(lengths, special_tokens=special_tokens)
+
+    def record(self, lengths, elapsed=0.0, special_tokens=2):
+        """记录一个批次的序列长度和耗时（多进程时耗时按整体墙钟时间另行累加）"""
+        self.elapsed += elapsed
+        self.num_batches += 1
+        self.num_sequences += len(lengths)
+        self.real_tokens += sum(lengths) + special_tokens * len(lengths)
+        self.padded_tokens += (max(lengths) + special_tokens) * len(lengths)
+
+    @property
+    def sequences_per_second(self):
+        return self.num_sequences / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def padding_waste(self):
+        """padding token占全部计算token的比例"""
+        if self.padded_tokens == 0:
+            return 0.0
+        return 1.0 - self.real_tokens / self.padded_tokens
+
+    def report(self, description=""):
+        print(f"📊 {description}组批推理统计:")
+        print(f"  🧬 序列数: {self.num_sequences}  批次数: {self.num_batches}")
+        print(f"  ⚡ 速度: {self.sequences_per_second:.2f} 序列/秒 (推理耗时 {self.elapsed:.2f} 秒)")
+        print(f"  🧱 padding浪费: {self.padding_waste * 100:.1f}%")
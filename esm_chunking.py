@@ -0,0 +1,151 @@
+"""
+超长序列的滑动窗口分块嵌入
+ESM的位置上限为1022个残基（加<cls>/<eos>共1024个token），更长的序列按重叠窗口切块，
+各块与其它序列一起按token预算组批推理，再按 center-crop 或 linear-blend 规则拼回 [L, D]，
+峰值内存只取决于窗口大小而不是序列长度
+"""
+
+import torch
+
+from esm_batching import DEFAULT_MAX_TOKENS, make_token_batches
+from esm_engine import _EmbeddingEngine
+
+# ESM的最大残基数（1024个位置减去<cls>和<eos>）
+ESM_MAX_RESIDUES = 1022
+DEFAULT_CHUNK_OVERLAP = 256
+# center-crop: 重叠区从中点切开，各取离自己窗口边缘更远的一半；linear-blend: 重叠区按线性权重加权平均
+STITCH_MODES = ('center-crop', 'linear-blend')
+
+
+def chunk_spans(length, window=ESM_MAX_RESIDUES, overlap=DEFAULT_CHUNK_OVERLAP):
+    """
+    把长度为length的序列切成若干 [start, end) 窗口，相邻窗口至少重叠overlap个残基
+    最后一个窗口与序列末端对齐；不超过window的序列只有一个窗口
+    """
+    if overlap >= window:
+        raise ValueError(f"重叠长度 {overlap} 必须小于窗口大小 {window}")
+    if length <= window:
+        return [(0, length)]
+    step = window - overlap
+    spans = []
+    start = 0
+    while start + window < length:
+        spans.append((start, start + window))
+        start += step
+    spans.append((length - window, length))
+    return spans
+
+
+def _blend_weights(spans, index):
+    """第index个窗口的逐残基原始权重：与前后窗口重叠的部分线性升降，其余为1"""
+    start, end = spans[index]
+    weights = torch.ones(end - start)
+    if index > 0:
+        ramp = spans[index - 1][1] - start
+        weights[:ramp] = torch.arange(1, ramp + 1) / (ramp + 1)
+    if index < len(spans) - 1:
+        ramp = end - spans[index + 1][0]
+        weights[-ramp:] = torch.minimum(weights[-ramp:], torch.arange(ramp, 0, -1) / (ramp + 1))
+    return weights
+
+
+def blend_weights(spans, length):
+    """
+    各窗口归一化后的权重：每个位置上所有覆盖它的窗口权重之和为1
+    （overlap超过窗口一半时一个位置可能被三个窗口覆盖，原始线性权重之和不再是1）
+    """
+    raw = [_blend_weights(spans, index) for index in range(len(spans))]
+    weight_sum = torch.zeros(length)
+    for (start, end), weights in zip(spans, raw):
+        weight_sum[start:end] += weights
+    return [weights / weight_sum[start:end] for (start, end), weights in zip(spans, raw)]
+
+
+def stitch_chunks(chunk_reps, spans, length, mode='linear-blend'):
+    """把各窗口的 [end-start, D] 表示拼回 [length, D]"""
+    if mode not in STITCH_MODES:
+        raise ValueError(f"不支持的拼接方式: {mode}，可选: {STITCH_MODES}")
+    if len(spans) == 1:
+        return chunk_reps[0]
+
+    dim = chunk_reps[0].shape[-1]
+    if mode == 'center-crop':
+        reps = torch.empty(length, dim, dtype=chunk_reps[0].dtype)
+        lo = 0
+        for index, ((start, end), chunk) in enumerate(zip(spans, chunk_reps)):
+            hi = length if index == len(spans) - 1 else (spans[index + 1][0] + end) // 2
+            reps[lo:hi] = chunk[lo - start:hi - start]
+            lo = hi
+    else:
+        total = torch.zeros(length, dim, dtype=torch.float32)
+        for (start, end), chunk, weights in zip(spans, chunk_reps, blend_weights(spans, length)):
+            total[start:end] += chunk.float() * weights.unsqueeze(-1)
+        reps = total.to(chunk_reps[0].dtype)
+
+    if reps.shape[0] != length:
+        raise ValueError(f"拼接后长度 {reps.shape[0]} 与序列长度 {length} 不一致")
+    return reps
+
+
+class ChunkedEmbeddingEngine(_EmbeddingEngine):
+    """
+    包装一个嵌入引擎：每批序列先切成窗口，全部窗口再按token预算组批推理后拼回
+    不超过window的序列只有一个窗口，结果与原引擎完全相同，因此沿用原引擎的 model_id / layer 作为缓存键
+    可以再交给 SharedModelPool 做多进程推理
+    """
+
+    def __init__(self, engine, window=ESM_MAX_RESIDUES, overlap=DEFAULT_CHUNK_OVERLAP, stitch='linear-blend',
+                 max_tokens=DEFAULT_MAX_TOKENS):
+        if stitch not in STITCH_MODES:
+            raise ValueError(f"不支持的拼接方式: {stitch}，可选: {STITCH_MODES}")
+        chunk_spans(window + 1, window, overlap)  # 提前检查参数
+        self.engine = engine
+        self.window = window
+        self.overlap = overlap
+        self.stitch = stitch
+        self.max_tokens = max_tokens
+
+    @property
+    def model(self):
+        return self.engine.model
+
+    @property
+    def output_name(self):
+        return self.engine.output_name
+
+    @property
+    def model_id(self):
+        return self.engine.model_id
+
+    @property
+    def layer(self):
+        return self.engine.layer
+
+    @property
+    def backend(self):
+        return getattr(self.engine, 'backend', 'fp32')
+
+    def embed_batch(self, seqs):
+        """切块 → 按token预算组批推理（单批不超过 max(max_tokens, window+2) 个token）→ 拼回"""
+        spans_list = [chunk_spans(len(seq), self.window, self.overlap) for seq in seqs]
+        chunks = [(i, k, seqs[i][start:end]) for i, spans in enumerate(spans_list) for k, (start, end) in enumerate(spans)]
+
+        chunk_reps = {}
+        for batch in make_token_batches(chunks, self.max_tokens, length_fn=lambda chunk: len(chunk[2])):
+            for (i, k, _), reps in zip(batch, self.engine.embed_batch([chunk[2] for chunk in batch])):
+                chunk_reps[i, k] = reps
+
+        return [
+            stitch_chunks([chunk_reps[i, k] for k in range(len(spans))], spans, len(seq), self.stitch)
+            for i, (seq, spans) in enumerate(zip(seqs, spans_list))
+        ]
+
+    def extract_batch(self, seqs, layers=None, logits=False, contacts=False):
+        """不超过window的序列只有一个窗口，直接交给原引擎；logits和接触图不能分块拼接，更长的序列报错"""
+        too_long = [len(seq) for seq in seqs if len(seq) > self.window]
+        if too_long:
+            raise ValueError(f"{len(too_long)} 条序列超过窗口 {self.window}（最长 {max(too_long)}），extract_batch 不支持分块")
+        return self.engine.extract_batch(seqs, layers, logits, contacts)
+
+    def close(self):
+        self.engine.close()
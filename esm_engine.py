@@ -0,0 +1,413 @@
+"""
+常驻进程的ESM嵌入引擎（ESM-2 / ESM-1v）
+模型只加载一次，然后逐条或按token预算组批处理 (sample, fasta) 对，替代每条序列启动一次
+generate_features/esm2_embedding.py 子进程的做法
+"""
+
+import abc
+import contextlib
+import os
+import shutil
+import tempfile
+
+import torch
+
+from esm_batching import DEFAULT_MAX_TOKENS, BatchStats, make_token_batches
+from pipeline_io import check_file_exists
+
+# 与 generate_features/esm2_embedding.py 保持一致的模型配置
+ESM2_MODEL_NAME = "esm2_t33_650M_UR50D"
+ESM2_OUTPUT_NAME = "esm2.pt"
+
+# ESM-1v（HuggingFace格式）模型目录，_1 … _5
+ESM1V_BASE_DIR = "/home/corp/xingqiao.lin/.cache/huggingface/hub/facebook"
+ESM1V_MODEL_PREFIX = "esm1v_t33_650M_UR90S_"
+
+# 推理后端：fp32 原始精度；bf16 CPU autocast；int8 线性层动态量化；compile 用 torch.compile 编译
+# 所有后端输出相同格式（float32、[L, D]）的 esm2.pt / esm1v-{i}.pt，精度差异见 esm_backend_benchmark.py
+INFERENCE_BACKENDS = ('fp32', 'bf16', 'int8', 'compile')
+
+
+def read_fasta_sequence(fasta_file):
+    """读取FASTA文件中的第一条序列"""
+    seq_lines = []
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('>'):
+                if seq_lines:
+                    break
+                continue
+            if line:
+                seq_lines.append(line)
+    if not seq_lines:
+        raise ValueError(f"FASTA文件中没有序列: {fasta_file}")
+    return ''.join(seq_lines)
+
+
+def save_tensor_atomic(tensor, out_path):
+    """
+    原子地保存张量
+    torch.save 会把文件名写进归档内部，所以先在临时子目录里用同名文件保存再替换，
+    保证输出与直接 torch.save(tensor, out_path) 逐字节一致
+    """
+    out_dir = os.path.dirname(out_path) or '.'
+    os.makedirs(out_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=out_dir)
+    try:
+        tmp_path = os.path.join(tmp_dir, os.path.basename(out_path))
+        torch.save(tensor, tmp_path)
+        os.replace(tmp_path, out_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def prepare_model(model, backend='fp32', device="cpu"):
+    """按推理后端转换已加载（eval模式）的模型"""
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}，可选: {INFERENCE_BACKENDS}")
+    if backend == 'int8':
+        if torch.device(device).type != 'cpu':
+            raise ValueError("int8动态量化只支持CPU")
+        # 只量化编码器：接触图回归头直接读 regression.weight，量化后weight变成方法，前向会出错
+        linear_layers = {name for name, module in model.named_modules()
+                         if isinstance(module, torch.nn.Linear) and 'contact_head' not in name}
+        model = torch.ao.quantization.quantize_dynamic(model, linear_layers, dtype=torch.qint8)
+    elif backend == 'compile':
+        # 批次长度各不相同，按动态形状编译，避免每种padding长度重新编译
+        model = torch.compile(model, dynamic=True)
+    return model
+
+
+def backend_context(backend, device="cpu"):
+    """前向时使用的上下文：bf16为autocast，其余后端不需要"""
+    if backend == 'bf16':
+        return torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def backend_model_id(model_id, backend):
+    """非fp32后端的结果与fp32不逐位相同，缓存键中带上后端名，避免在存储中混用"""
+    return model_id if backend == 'fp32' else f"{model_id}@{backend}"
+
+
+class _EmbeddingEngine(abc.ABC):
+    """
+    嵌入引擎的公共部分，子类必须实现 embed_batch 和 extract_batch（缺少时构造即报错），
+    并设置默认输出文件名 output_name 以及用于缓存键的 model_id / layer
+    """
+
+    output_name = None
+    model_id = None
+    layer = None
+    backend = 'fp32'
+
+    @abc.abstractmethod
+    def embed_batch(self, seqs):
+        """对一批序列做一次带padding的前向，返回每条序列的 [L_i, D] 表示"""
+
+    def embed_sequence(self, seq):
+        """计算单条序列的最后一层表示，去掉<cls>和<eos> → [L, D]"""
+        return self.embed_batch([seq])[0]
+
+    @abc.abstractmethod
+    def extract_batch(self, seqs, layers=None, logits=False, contacts=False):
+        """
+        一次前向同时取出多种输出，每条序列返回一个字典：
+        'layer{l}' → [L_i, D]，'logits' → [L_i, V]，'contacts' → [L_i, L_i]
+        layers 为None时只取 self.layer
+        """
+
+    def close(self):
+        """释放推理资源；单进程引擎常驻复用，无需处理"""
+
+    def embed_batches(self, batches, stats=None):
+        """
+        依次推理多个批次（每个批次是序列列表），逐批产出 (批次下标, 表示列表)，
+        出错的批次产出 (批次下标, 异常)；多进程实现见 esm_shared_pool.SharedModelPool
+        """
+        for index, seqs in enumerate(batches):
+            try:
+                if stats is not None:
+                    stats.start()
+                reps_list = self.embed_batch(seqs)
+                if stats is not None:
+                    stats.stop([len(seq) for seq in seqs])
+                yield index, reps_list
+            except Exception as e:
+                yield index, e
+
+    def embed_fasta(self, fasta_file, saved_folder, output_name=None):
+        """为一个FASTA文件生成嵌入文件，返回输出路径"""
+        output_name = output_name or self.output_name
+        seq = read_fasta_sequence(fasta_file)
+        reps = self.embed_sequence(seq)
+        out_path = os.path.join(saved_folder, output_name)
+        save_tensor_atomic(reps, out_path)
+        return out_path
+
+    def _pending(self, pairs, output_name, skip_existing):
+        """过滤 (sample, fasta_file)：已存在的跳过，读不到序列的失败，其余待处理"""
+        for sample, fasta_file in pairs:
+            out_path = os.path.join(os.path.dirname(fasta_file), output_name)
+
+            if skip_existing and check_file_exists(out_path):
+                yield sample, 'skipped', out_path
+                continue
+
+            if not check_file_exists(fasta_file):
+                yield sample, 'failed', f"找不到FASTA文件: {fasta_file}"
+                continue
+
+            try:
+                yield sample, 'pending', (read_fasta_sequence(fasta_file), out_path)
+            except Exception as e:
+                yield sample, 'failed', f"读取FASTA出错: {e}"
+
+    def run(self, pairs, output_name=None, skip_existing=True):
+        """
+        逐条处理 (sample, fasta_file) 迭代器，输出写到FASTA所在目录
+        逐条产出 (sample, status, message)，status 为 'generated' / 'skipped' / 'failed'
+        """
+        output_name = output_name or self.output_name
+        for sample, status, payload in self._pending(pairs, output_name, skip_existing):
+            if status != 'pending':
+                yield sample, status, payload
+                continue
+
+            seq, out_path = payload
+            try:
+                save_tensor_atomic(self.embed_sequence(seq), out_path)
+                yield sample, 'generated', out_path
+            except Exception as e:
+                yield sample, 'failed', f"生成{output_name}出错: {e}"
+
+    def run_batched(self, pairs, output_name=None, max_tokens=DEFAULT_MAX_TOKENS, skip_existing=True, stats=None):
+        """
+        与 run 相同，但先收集全部待处理序列，按长度分桶、按token预算组批后再推理
+        stats 传入 BatchStats 时累计吞吐和padding浪费
+        """
+        output_name = output_name or self.output_name
+        pending = []
+        for sample, status, payload in self._pending(pairs, output_name, skip_existing):
+            if status == 'pending':
+                seq, out_path = payload
+                pending.append((sample, seq, out_path))
+            else:
+                yield sample, status, payload
+
+        stats = stats if stats is not None else BatchStats()
+        batches = make_token_batches(pending, max_tokens, length_fn=lambda item: len(item[1]))
+        for index, reps_list in self.embed_batches([[seq for _, seq, _ in batch] for batch in batches], stats):
+            batch = batches[index]
+            if isinstance(reps_list, Exception):
+                for sample, _, _ in batch:
+                    yield sample, 'failed', f"组批推理出错: {reps_list}"
+                continue
+
+            for (sample, _, out_path), reps in zip(batch, reps_list):
+                try:
+                    save_tensor_atomic(reps, out_path)
+                    yield sample, 'generated', out_path
+                except Exception as e:
+                    yield sample, 'failed', f"保存{output_name}出错: {e}"
+
+
+class Esm2EmbeddingEngine(_EmbeddingEngine):
+    """ESM-2嵌入引擎（fair-esm）：每个进程只加载一次模型权重"""
+
+    output_name = ESM2_OUTPUT_NAME
+
+    def __init__(self, model_name=ESM2_MODEL_NAME, repr_layer=None, device="cpu", backend='fp32'):
+        import esm
+
+        print(f"🔧 加载ESM-2模型: {model_name} ({backend})")
+        model, alphabet = esm.pretrained.load_model_and_alphabet(model_name)
+        self.model = prepare_model(model.eval().to(device), backend, device)
+        self.alphabet = alphabet
+        self.batch_converter = alphabet.get_batch_converter()
+        self.repr_layer = repr_layer if repr_layer is not None else model.num_layers
+        self.device = device
+        self.backend = backend
+        self.model_name = model_name
+        self.model_id = backend_model_id(model_name, backend)
+        self.layer = self.repr_layer
+
+    def embed_batch(self, seqs):
+        """padding位置由模型根据padding_idx自动mask，逐条切出 [i, 1:len+1]"""
+        _, _, tokens = self.batch_converter([(f"protein{i}", seq) for i, seq in enumerate(seqs)])
+        tokens = tokens.to(self.device)
+        with torch.no_grad(), backend_context(self.backend, self.device):
+            results = self.model(tokens, repr_layers=[self.repr_layer], return_contacts=False)
+        hidden = results["representations"][self.repr_layer].float()
+        return [hidden[i, 1:len(seq) + 1].cpu().clone() for i, seq in enumerate(seqs)]
+
+    def extract_batch(self, seqs, layers=None, logits=False, contacts=False):
+        """fair-esm的前向本身就同时返回各层表示、logits和接触图"""
+        layers = list(layers) if layers else [self.repr_layer]
+        _, _, tokens = self.batch_converter([(f"protein{i}", seq) for i, seq in enumerate(seqs)])
+        tokens = tokens.to(self.device)
+        with torch.no_grad(), backend_context(self.backend, self.device):
+            results = self.model(tokens, repr_layers=layers, return_contacts=contacts)
+
+        outputs = []
+        for i, seq in enumerate(seqs):
+            length = len(seq)
+            item = {f"layer{layer}": results["representations"][layer][i, 1:length + 1].float().cpu().clone()
+                    for layer in layers}
+            if logits:
+                item['logits'] = results["logits"][i, 1:length + 1].float().cpu().clone()
+            if contacts:
+                # 接触图已去掉<cls>/<eos>，padding部分在右下角
+                item['contacts'] = results["contacts"][i, :length, :length].float().cpu().clone()
+            outputs.append(item)
+        return outputs
+
+
+class HfEsmEmbeddingEngine(_EmbeddingEngine):
+    """HuggingFace格式的ESM嵌入引擎（test.py中的ESM-1v），取 hidden_states[-1]"""
+
+    def __init__(self, model_dir, output_name="esm1v-1.pt", device="cpu", backend='fp32'):
+        from transformers import AutoTokenizer, EsmForMaskedLM
+
+        print(f"🔧 加载ESM模型: {model_dir} ({backend})")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=False, local_files_only=True)
+        model = EsmForMaskedLM.from_pretrained(
+            model_dir,
+            local_files_only=True,
+            use_safetensors=False
+        ).eval().to(device)
+        self.layer = model.config.num_hidden_layers
+        self.model = prepare_model(model, backend, device)
+        self.output_name = output_name
+        self.device = device
+        self.backend = backend
+        self.model_dir = model_dir
+        self.model_id = backend_model_id(os.path.basename(os.path.normpath(model_dir)), backend)
+
+    def embed_batch(self, seqs):
+        """padding后用attention_mask屏蔽，逐条切出 [i, 1:len+1]"""
+        inputs = self.tokenizer(seqs, return_tensors="pt", add_special_tokens=True, padding=True)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with torch.no_grad(), backend_context(self.backend, self.device):
+            out = self.model(**inputs, output_hidden_states=True)
+        hidden = out.hidden_states[-1].float()
+        return [hidden[i, 1:len(seq) + 1].cpu().clone() for i, seq in enumerate(seqs)]
+
+    def extract_batch(self, seqs, layers=None, logits=False, contacts=False):
+        """
+        hidden_states[l] 为第l层的输出（0为嵌入层），与fair-esm的repr_layers编号一致；
+        接触图由同一次前向的注意力经contact_head得到，不再像predict_contacts那样额外前向一次
+        """
+        layers = list(layers) if layers else [self.layer]
+        inputs = self.tokenizer(seqs, return_tensors="pt", add_special_tokens=True, padding=True)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        attn_implementation = self.model.config._attn_implementation
+        try:
+            if contacts and attn_implementation != 'eager':
+                # sdpa不返回注意力权重；只在这次前向切换，引擎按进程缓存，之后的嵌入和打分仍用原来的实现
+                self.model.set_attn_implementation('eager')
+            with torch.no_grad(), backend_context(self.backend, self.device):
+                out = self.model(**inputs, output_hidden_states=True, output_attentions=contacts)
+                if contacts:
+                    mask = inputs['attention_mask']
+                    attentions = torch.stack(out.attentions, dim=1)
+                    attentions = attentions * mask[:, None, None, :, None] * mask[:, None, None, None, :]
+                    contact_maps = self.model.esm.contact_head(inputs['input_ids'], attentions)
+        finally:
+            if self.model.config._attn_implementation != attn_implementation:
+                self.model.set_attn_implementation(attn_implementation)
+
+        outputs = []
+        for i, seq in enumerate(seqs):
+            length = len(seq)
+            item = {f"layer{layer}": out.hidden_states[layer][i, 1:length + 1].float().cpu().clone()
+                    for layer in layers}
+            if logits:
+                item['logits'] = out.logits[i, 1:length + 1].float().cpu().clone()
+            if contacts:
+                item['contacts'] = contact_maps[i, :length, :length].float().cpu().clone()
+            outputs.append(item)
+        return outputs
+
+    def token_ids(self, residues):
+        """残基字符 → 词表id"""
+        return self.tokenizer.convert_tokens_to_ids(list(residues))
+
+    def log_probs_batch(self, seqs):
+        """一次带padding的前向，返回每条序列各残基位置的对数概率 [L_i, V]"""
+        inputs = self.tokenizer(seqs, return_tensors="pt", add_special_tokens=True, padding=True)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with torch.no_grad(), backend_context(self.backend, self.device):
+            logits = self.model(**inputs).logits
+        log_probs = torch.log_softmax(logits.float(), dim=-1)
+        return [log_probs[i, 1:len(seq) + 1].cpu() for i, seq in enumerate(seqs)]
+
+    def masked_log_probs(self, seq, positions, max_tokens=DEFAULT_MAX_TOKENS):
+        """
+        依次遮盖positions中的每个位置（0-based），返回 {位置: 遮盖后该位置的对数概率 [V]}
+        同一序列的不同遮盖版本长度相同，按token预算拼成批次
+        """
+        input_ids = self.tokenizer(seq, return_tensors="pt", add_special_tokens=True)["input_ids"][0]
+        per_batch = max(1, max_tokens // len(input_ids))
+        positions = list(positions)
+        result = {}
+        for start in range(0, len(positions), per_batch):
+            chunk = positions[start:start + per_batch]
+            batch_ids = input_ids.repeat(len(chunk), 1)
+            for row, pos in enumerate(chunk):
+                batch_ids[row, pos + 1] = self.tokenizer.mask_token_id
+            batch_ids = batch_ids.to(self.device)
+            with torch.no_grad(), backend_context(self.backend, self.device):
+                logits = self.model(input_ids=batch_ids, attention_mask=torch.ones_like(batch_ids)).logits
+            log_probs = torch.log_softmax(logits.float(), dim=-1)
+            for row, pos in enumerate(chunk):
+                result[pos] = log_probs[row, pos + 1].cpu()
+        return result
+
+
+def check_batched_consistency(engine, seqs, max_tokens=DEFAULT_MAX_TOKENS, atol=1e-4):
+    """比较组批推理与逐条推理的结果，返回 (是否一致, 最大绝对误差)"""
+    max_diff = 0.0
+    for batch in make_token_batches(list(seqs), max_tokens):
+        for seq, reps in zip(batch, engine.embed_batch(batch)):
+            single = engine.embed_sequence(seq)
+            if reps.shape != single.shape:
+                return False, float('inf')
+            max_diff = max(max_diff, (reps - single).abs().max().item())
+    return max_diff <= atol, max_diff
+
+
+def esm1v_model_dir(model_index):
+    """第model_index个ESM-1v模型（1-5）的目录"""
+    return os.path.join(ESM1V_BASE_DIR, f"{ESM1V_MODEL_PREFIX}{model_index}")
+
+
+def build_engine(model, backend='fp32', device="cpu", model_dir=None):
+    """model 为 "esm2" 或 "esm1v-{i}"（i为1-5）；model_dir 为ESM-1v的本地模型目录（默认 esm1v_model_dir(i)）"""
+    if model == 'esm2':
+        return Esm2EmbeddingEngine(device=device, backend=backend)
+    if model.startswith('esm1v-'):
+        model_index = int(model[len('esm1v-'):])
+        return HfEsmEmbeddingEngine(model_dir or esm1v_model_dir(model_index), f"esm1v-{model_index}.pt", device,
+                                    backend)
+    raise ValueError(f"不支持的模型: {model}，可选: esm2, esm1v-1 … esm1v-5")
+
+
+_ENGINES = {}
+
+
+def get_esm2_engine(model_name=ESM2_MODEL_NAME, repr_layer=None, device="cpu", backend='fp32'):
+    """获取（必要时创建）当前进程共享的引擎实例"""
+    key = (model_name, repr_layer, device, backend)
+    if key not in _ENGINES:
+        _ENGINES[key] = Esm2EmbeddingEngine(model_name, repr_layer, device, backend)
+    return _ENGINES[key]
+
+
+def get_hf_esm_engine(model_dir, output_name="esm1v-1.pt", device="cpu", backend='fp32'):
+    """获取（必要时创建）当前进程共享的HuggingFace ESM引擎实例"""
+    key = ('hf', model_dir, output_name, device, backend)
+    if key not in _ENGINES:
+        _ENGINES[key] = HfEsmEmbeddingEngine(model_dir, output_name, device, backend)
+    return _ENGINES[key]
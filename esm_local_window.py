@@ -0,0 +1,197 @@
+"""
+局部窗口近似的突变体嵌入
+点突变主要影响突变位点附近的表示：复用已缓存的WT嵌入，只对突变位点两侧 window 个残基的子序列重新嵌入，
+再把中心 splice 个残基拼回WT张量；多点突变的子序列覆盖所有位点，每个位点各拼回一段。附带基准测试，报告加速比以及与精确全长嵌入相比的逐残基余弦相似度和MSE
+"""
+
+import time
+
+import click
+import pandas as pd
+import torch
+from tqdm import tqdm
+
+from esm_batching import DEFAULT_MAX_TOKENS, make_token_batches
+from esm_engine import check_file_exists, get_esm2_engine, save_tensor_atomic
+from generate_individual_lists import locate_mutation_indices, parse_mutations_from_name
+
+CSV_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754.csv"
+
+# 默认重新嵌入突变位点两侧各64个残基，拼回两侧各16个残基
+DEFAULT_WINDOW = 64
+DEFAULT_SPLICE = 16
+
+
+def window_bounds(seq_len, seq_index, radius):
+    """以seq_index为中心、半径为radius的区间 [lo, hi)，在序列两端截断"""
+    return max(0, seq_index - radius), min(seq_len, seq_index + radius + 1)
+
+
+def plan_local_window(mut_seq, seq_index, window=DEFAULT_WINDOW, splice=DEFAULT_SPLICE):
+    """
+    返回 (子序列, 子序列起点, 拼接区间列表[(lo, hi), ...])
+    seq_index 可以是单个下标或多点突变的下标列表，子序列从最左位点的窗口起点到最右位点的窗口终点；
+    splice 不能超过 window，否则拼接区会用到子序列以外的残基
+    """
+    splice = min(splice, window)
+    seq_indices = [seq_index] if isinstance(seq_index, int) else sorted(seq_index)
+    sub_lo = window_bounds(len(mut_seq), seq_indices[0], window)[0]
+    sub_hi = window_bounds(len(mut_seq), seq_indices[-1], window)[1]
+    splice_ranges = [window_bounds(len(mut_seq), index, splice) for index in seq_indices]
+    return mut_seq[sub_lo:sub_hi], sub_lo, splice_ranges
+
+
+def splice_window(wt_reps, sub_reps, sub_lo, splice_ranges):
+    """把子序列嵌入中每个 [lo, hi) 对应的部分拼进WT嵌入的副本"""
+    reps = wt_reps.clone()
+    for lo, hi in splice_ranges:
+        reps[lo:hi] = sub_reps[lo - sub_lo:hi - sub_lo]
+    return reps
+
+
+def embed_mutants_local(engine, items, window=DEFAULT_WINDOW, splice=DEFAULT_SPLICE, max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    批量计算局部窗口近似的突变体嵌入
+    items: [(key, wt_reps, mut_seq, seq_index), ...]，wt_reps 与 mut_seq 等长，seq_index 可为下标列表
+    逐条产出 (key, 近似嵌入 或 异常)
+    """
+    plans = []
+    for key, wt_reps, mut_seq, seq_index in items:
+        if wt_reps.shape[0] != len(mut_seq):
+            yield key, ValueError(f"WT嵌入长度 {wt_reps.shape[0]} 与突变序列长度 {len(mut_seq)} 不一致")
+            continue
+        sub_seq, sub_lo, splice_ranges = plan_local_window(mut_seq, seq_index, window, splice)
+        plans.append((key, wt_reps, sub_seq, sub_lo, splice_ranges))
+
+    batches = make_token_batches(plans, max_tokens, length_fn=lambda plan: len(plan[2]))
+    for index, reps_list in engine.embed_batches([[plan[2] for plan in batch] for batch in batches]):
+        batch = batches[index]
+        if isinstance(reps_list, Exception):
+            for plan in batch:
+                yield plan[0], reps_list
+            continue
+        for (key, wt_reps, _, sub_lo, splice_ranges), sub_reps in zip(batch, reps_list):
+            yield key, splice_window(wt_reps, sub_reps, sub_lo, splice_ranges)
+
+
+def run_local_window(engine, samples, window=DEFAULT_WINDOW, splice=DEFAULT_SPLICE, max_tokens=DEFAULT_MAX_TOKENS, skip_existing=True):
+    """
+    为样本目录生成近似的mut嵌入
+    samples: [(sample, wt_emb_file, mut_seq, seq_index, out_file), ...]，seq_index 为下标或多点突变的下标列表，WT嵌入需已存在
+    逐条产出 (sample, status, message)
+    """
+    items = []
+    out_files = {}
+    for sample, wt_emb_file, mut_seq, seq_index, out_file in samples:
+        if skip_existing and check_file_exists(out_file):
+            yield sample, 'skipped', out_file
+            continue
+        if not check_file_exists(wt_emb_file):
+            yield sample, 'failed', f"WT嵌入不存在: {wt_emb_file}"
+            continue
+        items.append((sample, torch.load(wt_emb_file), mut_seq, seq_index))
+        out_files[sample] = out_file
+
+    for sample, reps in embed_mutants_local(engine, items, window, splice, max_tokens):
+        if isinstance(reps, Exception):
+            yield sample, 'failed', f"局部窗口嵌入出错: {reps}"
+            continue
+        save_tensor_atomic(reps, out_files[sample])
+        yield sample, 'generated', out_files[sample]
+
+
+def compare_embeddings(approx, exact):
+    """逐残基余弦相似度和MSE：返回 (平均余弦, 最小余弦, MSE)"""
+    cosine = torch.nn.functional.cosine_similarity(approx.float(), exact.float(), dim=-1)
+    mse = torch.mean((approx.float() - exact.float()) ** 2).item()
+    return cosine.mean().item(), cosine.min().item(), mse
+
+
+def benchmark_local_window(engine, train, windows=(16, 32, 64, 128), splice=DEFAULT_SPLICE, max_tokens=DEFAULT_MAX_TOKENS, limit=None):
+    """
+    在数据集上对比局部窗口近似与精确全长嵌入
+    返回每个window一行的表：加速比（不含WT嵌入时间）、逐残基余弦、MSE
+    """
+    samples = []
+    for row in train.itertuples(index=False):
+        mutations = parse_mutations_from_name(row.name.replace(' ', '_'))
+        if mutations is None:
+            continue
+        seq_indices = locate_mutation_indices(row.wt_seq, mutations, row.mut_seq)
+        if seq_indices is None or len(row.wt_seq) != len(row.mut_seq):
+            continue
+        samples.append((row.name, row.wt_seq, row.mut_seq, seq_indices))
+        if limit is not None and len(samples) >= limit:
+            break
+    print(f"📊 基准样本数: {len(samples)}")
+
+    # WT嵌入（局部窗口模式下视为已缓存，不计入时间）
+    wt_reps = {}
+    for batch in make_token_batches(sorted({s[1] for s in samples}), max_tokens):
+        for seq, reps in zip(batch, engine.embed_batch(batch)):
+            wt_reps[seq] = reps
+
+    # 精确路径：全长突变序列
+    start = time.time()
+    exact = {}
+    for batch in tqdm(make_token_batches(samples, max_tokens, length_fn=lambda s: len(s[2])), desc="精确嵌入"):
+        for sample, reps in zip(batch, engine.embed_batch([s[2] for s in batch])):
+            exact[sample[0]] = reps
+    exact_time = time.time() - start
+
+    results = []
+    for window in windows:
+        items = [(name, wt_reps[wt_seq], mut_seq, seq_index) for name, wt_seq, mut_seq, seq_index in samples]
+        start = time.time()
+        approx = dict(embed_mutants_local(engine, items, window, splice, max_tokens))
+        local_time = time.time() - start
+
+        cos_means, cos_mins, mses = [], [], []
+        for name, _, _, _ in samples:
+            cos_mean, cos_min, mse = compare_embeddings(approx[name], exact[name])
+            cos_means.append(cos_mean)
+            cos_mins.append(cos_min)
+            mses.append(mse)
+        results.append({
+            'window': window,
+            'splice': min(splice, window),
+            'exact_seconds': exact_time,
+            'local_seconds': local_time,
+            'speedup': exact_time / local_time if local_time > 0 else float('inf'),
+            'cosine_mean': sum(cos_means) / len(cos_means),
+            'cosine_min': min(cos_mins),
+            'mse_mean': sum(mses) / len(mses),
+            'mse_max': max(mses),
+        })
+    return pd.DataFrame(results)
+
+
+@click.command()
+@click.option("--csv_file", default=CSV_FILE, type=str, help="包含name、wt_seq、mut_seq列的数据集CSV")
+@click.option("--windows", default="16,32,64,128", type=str, help="要测试的窗口半径，逗号分隔")
+@click.option("--splice", default=DEFAULT_SPLICE, type=int, help="拼回WT嵌入的半径")
+@click.option("--max_tokens", default=DEFAULT_MAX_TOKENS, type=int, help="每批最多token数")
+@click.option("--limit", default=None, type=int, help="只取前N个样本")
+@click.option("--output_file", default=None, type=str, help="结果表保存路径（CSV）")
+def main(csv_file, windows, splice, max_tokens, limit, output_file):
+    """
+    局部窗口突变体嵌入的加速比与误差基准
+
+    使用方法：
+    python esm_local_window.py --windows 16,32,64 --limit 500
+    """
+    train = pd.read_csv(csv_file, sep=',')
+    window_list = [int(w) for w in windows.split(',') if w.strip()]
+    table = benchmark_local_window(get_esm2_engine(), train, window_list, splice, max_tokens, limit)
+
+    print("\n" + "=" * 80)
+    print("📊 局部窗口 vs 精确嵌入:")
+    print("=" * 80)
+    print(table.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    if output_file:
+        table.to_csv(output_file, index=False)
+        print(f"📁 输出: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+单次前向的多输出特征提取
+事先声明需要的输出（若干隐藏层、逐位置logits、可选的注意力接触图），每个模型对每条序列只前向一次，
+每种输出写成各自的文件，替代 esm2_embedding.py / esm1v_logits.py / test.py 中对同一序列的多次前向
+"""
+
+import os
+
+import click
+from tqdm import tqdm
+
+from esm1v_ensemble import DATA_DIR, build_sample_pairs
+from esm_batching import DEFAULT_MAX_TOKENS, BatchStats, make_token_batches
+from esm_engine import INFERENCE_BACKENDS, build_engine, read_fasta_sequence, save_tensor_atomic
+from pipeline_io import check_file_exists, load_names_from_csv
+
+CSV_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754.csv"
+
+
+def output_files(engine, layers=None, logits=False, contacts=False):
+    """
+    声明的输出 → 文件名，以 esm2.pt 为例：
+    最后一层仍写到 esm2.pt（与原有特征文件一致），其它层 esm2-layer{l}.pt，esm2-logits.pt，esm2-contacts.pt
+    """
+    stem = engine.output_name[:-len('.pt')] if engine.output_name.endswith('.pt') else engine.output_name
+    layers = list(layers) if layers else [engine.layer]
+    files = {}
+    for layer in layers:
+        files[f"layer{layer}"] = engine.output_name if layer == engine.layer else f"{stem}-layer{layer}.pt"
+    if logits:
+        files['logits'] = f"{stem}-logits.pt"
+    if contacts:
+        files['contacts'] = f"{stem}-contacts.pt"
+    return files
+
+
+def run_multi_output(engine, pairs, layers=None, logits=False, contacts=False, max_tokens=DEFAULT_MAX_TOKENS,
+                     skip_existing=True, stats=None):
+    """
+    处理 (sample, fasta_file)，所有输出写到FASTA所在目录
+    某个样本的全部输出都已存在时跳过，否则一次前向重新生成全部输出
+    逐条产出 (sample, status, message)
+    注意：接触图需要保留所有层的注意力，内存约为 层数 × 头数 × T²，开启时应相应调小max_tokens
+    """
+    layers = list(layers) if layers else [engine.layer]
+    files = output_files(engine, layers, logits, contacts)
+
+    pending = []
+    for sample, fasta_file in pairs:
+        out_dir = os.path.dirname(fasta_file)
+        if skip_existing and all(check_file_exists(os.path.join(out_dir, name)) for name in files.values()):
+            yield sample, 'skipped', out_dir
+            continue
+        if not check_file_exists(fasta_file):
+            yield sample, 'failed', f"找不到FASTA文件: {fasta_file}"
+            continue
+        try:
+            pending.append((sample, read_fasta_sequence(fasta_file), out_dir))
+        except Exception as e:
+            yield sample, 'failed', f"读取FASTA出错: {e}"
+
+    stats = stats if stats is not None else BatchStats()
+    for batch in make_token_batches(pending, max_tokens, length_fn=lambda item: len(item[1])):
+        seqs = [seq for _, seq, _ in batch]
+        try:
+            stats.start()
+            outputs = engine.extract_batch(seqs, layers, logits, contacts)
+            stats.stop([len(seq) for seq in seqs])
+        except Exception as e:
+            for sample, _, _ in batch:
+                yield sample, 'failed', f"组批推理出错: {e}"
+            continue
+
+        for (sample, _, out_dir), item in zip(batch, outputs):
+            try:
+                for key, name in files.items():
+                    save_tensor_atomic(item[key], os.path.join(out_dir, name))
+                yield sample, 'generated', out_dir
+            except Exception as e:
+                yield sample, 'failed', f"保存输出出错: {e}"
+
+
+@click.command()
+@click.option("--csv_file", default=CSV_FILE, type=str, help="包含name列的数据集CSV")
+@click.option("--data_dir", default=DATA_DIR, type=str, help="样本根目录")
+@click.option("--model", default="esm2", type=str, help="esm2 或 esm1v-{1..5}")
+@click.option("--layers", default="", type=str, help="要保存的隐藏层，逗号分隔（默认只保存最后一层）")
+@click.option("--logits/--no-logits", default=False, help="是否保存逐位置logits")
+@click.option("--contacts/--no-contacts", default=False, help="是否保存注意力接触图")
+@click.option("--sides", default="wt,mut", type=str, help="处理wt和/或mut")
+@click.option("--max_tokens", default=DEFAULT_MAX_TOKENS, type=int, help="每批最多token数（含padding）")
+@click.option("--backend", default="fp32", type=click.Choice(INFERENCE_BACKENDS), help="推理后端")
+@click.option("--device", default="cpu", type=str, help="cpu 或 cuda")
+def main(csv_file, data_dir, model, layers, logits, contacts, sides, max_tokens, backend, device):
+    """
+    一次前向生成多种ESM特征
+
+    使用方法：
+    python esm_multi_output.py --model esm2 --layers 24,30,33 --logits --contacts --max_tokens 2048
+    """
+    names = load_names_from_csv(csv_file)
+    if not names:
+        print(f"❌ 没有可处理的样本: {csv_file}")
+        return
+
+    engine = build_engine(model, backend, device)
+    layer_list = [int(layer) for layer in layers.split(',') if layer.strip()] or None
+    side_list = tuple(side.strip() for side in sides.split(',') if side.strip())
+    pairs = build_sample_pairs(names, data_dir, side_list)
+    files = output_files(engine, layer_list, logits, contacts)
+    print(f"🚀 {model}: {len(pairs)} 个样本, 输出 {list(files.values())}")
+
+    counts = {'generated': 0, 'skipped': 0, 'failed': 0}
+    stats = BatchStats()
+    results = run_multi_output(engine, pairs, layer_list, logits, contacts, max_tokens, stats=stats)
+    for (name, side), status, message in tqdm(results, total=len(pairs), desc=f"{model} 多输出"):
+        counts[status] += 1
+        if status == 'failed':
+            print(f"❌ {name} {side}: {message}")
+
+    print("\n" + "=" * 80)
+    print("📊 处理完成统计:")
+    print("=" * 80)
+    print(f"✅ 生成: {counts['generated']}")
+    print(f"⏭️ 跳过: {counts['skipped']}")
+    print(f"❌ 失败: {counts['failed']}")
+    stats.report(f"{model} ")
+
+
+if __name__ == "__main__":
+    main()
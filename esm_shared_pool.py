@@ -0,0 +1,120 @@
+"""
+共享内存权重的多进程CPU推理
+主进程只加载一次模型并放入共享内存，N个spawn出来的工作进程通过句柄映射同一份只读权重，
+每个进程设置 torch.set_num_threads，使 进程数 × 线程数 ≈ CPU核心数
+"""
+
+import multiprocessing as mp
+import time
+
+import torch
+import torch.multiprocessing as torch_mp
+
+# 工作进程内的引擎（由初始化函数设置）
+_WORKER_ENGINE = None
+
+
+def default_threads_per_worker(num_workers):
+    """按CPU核心数平均分配每个工作进程的线程数"""
+    return max(1, mp.cpu_count() // max(1, num_workers))
+
+
+def _init_worker(engine, num_threads):
+    """工作进程初始化：设置线程数，保存共享权重的引擎"""
+    global _WORKER_ENGINE
+    torch.set_num_threads(num_threads)
+    _WORKER_ENGINE = engine
+
+
+def _embed_batch_task(task):
+    """工作进程中推理一个批次，返回 (批次下标, 表示列表或错误信息, 耗时)"""
+    index, seqs = task
+    start = time.time()
+    try:
+        with torch.inference_mode():
+            reps_list = _WORKER_ENGINE.embed_batch(seqs)
+        # 以numpy数组按值传回，避免每个结果张量都占用一个共享内存文件描述符
+        return index, [reps.numpy() for reps in reps_list], time.time() - start
+    except Exception as e:
+        return index, f"{type(e).__name__}: {e}", time.time() - start
+
+
+class SharedModelPool:
+    """
+    包装一个已加载模型的引擎，在多个工作进程中并行推理
+    对外提供与引擎相同的 embed_batch / embed_batches / output_name / model_id / layer，
+    可直接传给 embed_into_store、embed_into_shards 等函数
+    """
+
+    def __init__(self, engine, num_workers, threads_per_worker=None):
+        if getattr(engine, 'backend', 'fp32') == 'int8':
+            # 量化后的打包权重无法通过共享内存句柄传给spawn出来的进程
+            raise ValueError("int8后端不支持多进程共享权重，请使用单进程引擎")
+        self.engine = engine
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(num_workers)
+
+        # 权重移入共享内存并冻结，工作进程拿到的是同一份物理内存
+        engine.model.eval()
+        for param in engine.model.parameters():
+            param.requires_grad_(False)
+        engine.model.share_memory()
+
+        print(f"🧵 启动 {num_workers} 个推理进程，每个进程 {self.threads_per_worker} 个线程")
+        ctx = torch_mp.get_context('spawn')
+        self._pool = ctx.Pool(
+            num_workers,
+            initializer=_init_worker,
+            initargs=(engine, self.threads_per_worker),
+        )
+
+    @property
+    def output_name(self):
+        return self.engine.output_name
+
+    @property
+    def model_id(self):
+        return self.engine.model_id
+
+    @property
+    def layer(self):
+        return self.engine.layer
+
+    def embed_batch(self, seqs):
+        index, reps_list, _ = self._pool.apply(_embed_batch_task, ((0, seqs),))
+        if isinstance(reps_list, str):
+            raise RuntimeError(reps_list)
+        return [torch.from_numpy(reps) for reps in reps_list]
+
+    def embed_sequence(self, seq):
+        return self.embed_batch([seq])[0]
+
+    def embed_batches(self, batches, stats=None):
+        """并行推理多个批次，按完成顺序产出 (批次下标, 表示列表或异常)"""
+        batches = list(batches)
+        start = time.time()
+        tasks = list(enumerate(batches))
+        for index, reps_list, _ in self._pool.imap_unordered(_embed_batch_task, tasks):
+            if isinstance(reps_list, str):
+                yield index, RuntimeError(reps_list)
+                continue
+            if stats is not None:
+                stats.record([len(seq) for seq in batches[index]])
+            yield index, [torch.from_numpy(reps) for reps in reps_list]
+        # 并行时吞吐按墙钟时间计算
+        if stats is not None:
+            stats.elapsed += time.time() - start
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.terminate()
+            self._pool.join()
@@ -1,8 +1,27 @@
 #通过foldx，把wild PDB 变为mut PDB
+import click
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+from foldx_energies import FOLDX_ENERGY_FILE, RUN_SELECTIONS, append_energy_rows, energy_rows, parse_build_energies, select_run
+from foldx_repair_cache import REPAIR_CACHE_DIR, RepairCache, file_sha256
+from foldx_result_cache import RESULT_CACHE_DIR, RESULT_CACHE_MAX_GB, ResultCache, normalize_mutation_line
+from pdb_renumber import original_pdb_path, renumber_pdb, source_pdb
+
+NUMBER_OF_RUNS = 3
+
+
 @click.command()
 @click.option("--sample_dir", required=True, type=str, help="样本目录路径（包含wt_data和mut_data）")
 @click.option("--geostab_dir", default="/home/corp/xingqiao.lin/code/GeoStab", type=str, help="GeoStab项目根目录")
-def main(sample_dir, geostab_dir):
+@click.option("--repair_cache_dir", default=REPAIR_CACHE_DIR, type=str, help="RepairPDB缓存目录（传空字符串则每个样本单独修复）")
+@click.option("--energy_file", default=FOLDX_ENERGY_FILE, type=str, help="FoldX能量表（CSV，传空字符串则不保存）")
+@click.option("--run_selection", default="first", type=click.Choice(RUN_SELECTIONS), help="取第0次运行或能量最低的运行")
+@click.option("--result_cache_dir", default=RESULT_CACHE_DIR, type=str, help="BuildModel结果缓存目录（传空字符串则不缓存）")
+@click.option("--result_cache_gb", default=RESULT_CACHE_MAX_GB, type=float, help="结果缓存的磁盘预算（GB），超出按LRU淘汰")
+def main(sample_dir, geostab_dir, repair_cache_dir, energy_file, run_selection, result_cache_dir, result_cache_gb):
     """
     为现有样本目录生成relaxed_repair.pdb文件
     
@@ -44,47 +63,58 @@ def main(sample_dir, geostab_dir):
         print(f"❌ 错误: FoldX可执行文件不存在或无执行权限: {software_foldx}")
         return
     
+    # FoldX的输入和缓存键用编号前的原始结构，与individual_list.txt中的PDB编号一致
+    source = source_pdb(wt_pdb)
+    if source is None:
+        print(f"❌ 错误: {wt_pdb} 已重新编号且没有原始结构 {original_pdb_path(wt_pdb)}，突变行的PDB编号无法对应")
+        return
+    
     print(f"📁 处理样本目录: {sample_dir}")
     print(f"🔧 使用FoldX: {software_foldx}")
     
     try:
-        # 1. 运行FoldX RepairPDB
+        # 1. 运行FoldX RepairPDB（同一WT结构只修复一次，结果按内容哈希缓存）
         print(f"🔧 运行FoldX RepairPDB...")
         foldx_tmp = mut_folder / "foldx_tmp"
         foldx_tmp.mkdir(exist_ok=True)
         
-        repair_cmd = [
-            str(software_foldx),
-            "--command=RepairPDB",
-            "--pdb=relaxed.pdb",
-            f"--pdb-dir={wt_folder}",
-            f"--output-dir={foldx_tmp}"
-        ]
-        
-        print(f"   命令: {' '.join(repair_cmd)}")
-        result = subprocess.run(repair_cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"❌ RepairPDB失败:")
-            print(f"   stdout: {result.stdout}")
-            print(f"   stderr: {result.stderr}")
-            return
-        
-        # 找到修复后的PDB
-        repaired_pdb = find_repaired_pdb(foldx_tmp)
-        if not repaired_pdb:
-            print(f"❌ 未找到修复后的PDB文件")
-            print(f"   foldx_tmp目录内容: {list(foldx_tmp.glob('*'))}")
-            return
+        if repair_cache_dir:
+            repaired_pdb, cache_hit = RepairCache(repair_cache_dir, software_foldx).get(source)
+            print(f"✅ {'命中' if cache_hit else '写入'}RepairPDB缓存: {repaired_pdb}")
+        else:
+            repaired_pdb = repair_in_sample(software_foldx, Path(source), foldx_tmp)
+            if not repaired_pdb:
+                return
         
-        print(f"✅ 找到修复后的PDB: {repaired_pdb}")
+        # 2. 查结果缓存：同一修复结构上的同一突变直接取缓存的突变体PDB和能量
+        mutation_lines = [line for line in individual_list.read_text().splitlines() if line.strip()]
+        mutation_line = normalize_mutation_line(mutation_lines[0]) if len(mutation_lines) == 1 else None
+        result_cache = ResultCache(result_cache_dir, result_cache_gb) if result_cache_dir and mutation_line else None
+        if result_cache is not None:
+            repaired_hash = file_sha256(repaired_pdb)
+            cached = result_cache.get(repaired_hash, mutation_line, NUMBER_OF_RUNS)
+            if cached is not None:
+                entry, run_energies = cached
+                energies = {(1, run): terms for run, terms in run_energies.items()}
+                run = select_run(energies, 1, run_selection)
+                final_mut_pdb = mut_folder / "relaxed_repair.pdb"
+                shutil.copy2(result_cache.mutant_pdb(entry, run), final_mut_pdb)
+                print(f"💾 命中BuildModel结果缓存: {entry}")
+                if energy_file and energies:
+                    append_energy_rows(energy_rows(sample_dir.name, mutation_line, 1, energies, run), energy_file)
+                renumber_pdb(wt_pdb, keep_original=True)
+                renumber_pdb(final_mut_pdb)
+                print(f"\n🎉 处理完成！")
+                print(f"   WT PDB: {wt_pdb}")
+                print(f"   MUT PDB: {final_mut_pdb}")
+                return
         
-        # 2. 复制修复后的PDB到mut_data目录
+        # 3. 复制修复后的PDB到mut_data目录（复制而不是链接，后面会被突变体覆盖）
         relaxed_repair_pdb = mut_folder / "relaxed_repair.pdb"
         shutil.copy2(repaired_pdb, relaxed_repair_pdb)
         print(f"✅ 复制到: {relaxed_repair_pdb}")
         
-        # 3. 运行FoldX BuildModel
+        # 4. 运行FoldX BuildModel
         print(f"🧬 运行FoldX BuildModel...")
         build_cmd = [
             str(software_foldx),
@@ -92,7 +122,7 @@ def main(sample_dir, geostab_dir):
             "--pdb=relaxed_repair.pdb",
             f"--pdb-dir={mut_folder}",
             f"--mutant-file={individual_list}",
-            "--numberOfRuns=3",
+            f"--numberOfRuns={NUMBER_OF_RUNS}",
             f"--output-dir={foldx_tmp}"
         ]
         
@@ -105,36 +135,44 @@ def main(sample_dir, geostab_dir):
             print(f"   stderr: {result.stderr}")
             return
         
-        # 4. 找到生成的突变体PDB
-        mut_pdb = find_mutant_pdb(foldx_tmp)
-        if not mut_pdb:
+        # 5. 解析能量输出，突变体PDB: 突变文件第1行、第0次（或能量最低的）运行
+        energies = {}
+        if energy_file or run_selection != 'first' or result_cache is not None:
+            try:
+                energies = parse_build_energies(foldx_tmp, "relaxed_repair")
+            except OSError as e:
+                print(f"⚠️  读取FoldX能量输出失败: {e}")
+        run = select_run(energies, 1, run_selection)
+        mut_pdb = foldx_tmp / mutant_pdb_name("relaxed_repair", 1, run)
+        if not mut_pdb.exists():
             print(f"❌ 未找到突变体PDB文件")
             print(f"   foldx_tmp目录内容: {list(foldx_tmp.glob('*'))}")
             return
         
         print(f"✅ 找到突变体PDB: {mut_pdb}")
+        if result_cache is not None:
+            mutant_pdbs = {r: foldx_tmp / mutant_pdb_name("relaxed_repair", 1, r) for r in range(NUMBER_OF_RUNS)}
+            if all(path.exists() for path in mutant_pdbs.values()):
+                run_energies = {r: terms for (k, r), terms in energies.items() if k == 1}
+                result_cache.put(repaired_hash, mutation_line, NUMBER_OF_RUNS, mutant_pdbs, run_energies)
+                removed, freed = result_cache.evict()
+                if removed:
+                    print(f"🧹 结果缓存淘汰 {removed} 个条目，释放 {freed / (1 << 20):.1f} MB")
         
-        # 5. 复制最终结果
+        # 6. 复制最终结果
         final_mut_pdb = mut_folder / "relaxed_repair.pdb"
         shutil.copy2(mut_pdb, final_mut_pdb)
         print(f"✅ 更新突变体PDB: {final_mut_pdb}")
+        if energy_file and energies:
+            mutation_line = mutation_line or individual_list.read_text().strip()
+            append_energy_rows(energy_rows(sample_dir.name, mutation_line, 1, energies, run), energy_file)
+            print(f"✅ 能量项已追加到: {energy_file}")
         
-        # 6. 重新编号残基序号
+        # 7. 重新编号残基序号（进程内流式处理，WT已编号时跳过）
         print(f"🔢 重新编号残基序号...")
-        pdb_utils_path = geostab_dir / "tools" / "pdb_utils.py"
-        if pdb_utils_path.exists():
-            # 使用项目中的pdb_utils.py
-            subprocess.run([
-                "python", str(pdb_utils_path), 
-                str(wt_pdb), str(wt_pdb), "0"
-            ])
-            subprocess.run([
-                "python", str(pdb_utils_path), 
-                str(final_mut_pdb), str(final_mut_pdb), "0"
-            ])
-            print(f"✅ 残基序号重新编号完成")
-        else:
-            print(f"⚠️  pdb_utils.py不存在，跳过重新编号")
+        wt_renumbered = renumber_pdb(wt_pdb, keep_original=True)
+        renumber_pdb(final_mut_pdb)
+        print(f"✅ 残基序号重新编号完成{'' if wt_renumbered else '（WT已编号，跳过）'}")
         
         print(f"\n🎉 处理完成！")
         print(f"   WT PDB: {wt_pdb}")
@@ -146,6 +184,36 @@ def main(sample_dir, geostab_dir):
         traceback.print_exc()
 
 
+def repair_in_sample(software_foldx, wt_pdb, foldx_tmp):
+    """不使用缓存时，在样本的foldx_tmp中修复wt_pdb，返回修复后的PDB（失败返回None）"""
+    repair_cmd = [
+        str(software_foldx),
+        "--command=RepairPDB",
+        f"--pdb={wt_pdb.name}",
+        f"--pdb-dir={wt_pdb.parent}",
+        f"--output-dir={foldx_tmp}"
+    ]
+    
+    print(f"   命令: {' '.join(repair_cmd)}")
+    result = subprocess.run(repair_cmd, capture_output=True, text=True)
+    
+    if result.returncode != 0:
+        print(f"❌ RepairPDB失败:")
+        print(f"   stdout: {result.stdout}")
+        print(f"   stderr: {result.stderr}")
+        return None
+    
+    # 找到修复后的PDB
+    repaired_pdb = find_repaired_pdb(foldx_tmp)
+    if not repaired_pdb:
+        print(f"❌ 未找到修复后的PDB文件")
+        print(f"   foldx_tmp目录内容: {list(foldx_tmp.glob('*'))}")
+        return None
+    
+    print(f"✅ 找到修复后的PDB: {repaired_pdb}")
+    return repaired_pdb
+
+
 def find_repaired_pdb(foldx_tmp_dir):
     """查找RepairPDB生成的文件"""
     for file in foldx_tmp_dir.glob("*_Repair.pdb"):
@@ -153,17 +221,9 @@ def find_repaired_pdb(foldx_tmp_dir):
     return None
 
 
-def find_mutant_pdb(foldx_tmp_dir):
-    """查找BuildModel生成的突变体文件"""
-    patterns = [
-        "*_1_*.pdb",
-        "*_1*.pdb"
-    ]
-    
-    for pattern in patterns:
-        for file in foldx_tmp_dir.glob(pattern):
-            return file
-    return None
+def mutant_pdb_name(pdb_stem, index, run=0):
+    """BuildModel的输出命名: 突变文件第index行（从1开始）第run次运行 → <pdb>_<index>_<run>.pdb"""
+    return f"{pdb_stem}_{index}_{run}.pdb"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+"""
+按母结构组批的FoldX BuildModel
+同一WT结构（wt_data/relaxed.pdb内容相同，即同一PDB ID）的所有样本的突变行写进一个多行突变文件，
+只运行一次BuildModel，再按行号把 relaxed_repair_<k>_<run>.pdb 精确分发到各样本的 mut_data/relaxed_repair.pdb，
+不再依赖 find_mutant_pdb 的通配匹配
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+
+import click
+
+from foldx import mutant_pdb_name
+from foldx_energies import FOLDX_ENERGY_FILE, RUN_SELECTIONS, append_energy_rows, energy_rows, parse_build_energies, select_run
+from foldx_repair_cache import REPAIR_CACHE_DIR, REPAIRED_NAME, RepairCache, file_sha256, repair_pdb
+from foldx_result_cache import RESULT_CACHE_DIR, RESULT_CACHE_MAX_GB, ResultCache, normalize_mutation_line
+from pdb_renumber import original_pdb_path, renumber_pdb, source_pdb
+
+GEOSTAB_DIR = "/home/corp/xingqiao.lin/code/GeoStab"
+DATA_DIR = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train"
+BUILD_PDB_NAME = "relaxed_repair.pdb"
+NUMBER_OF_RUNS = 3
+
+
+def read_mutation_line(individual_list):
+    """读取individual_list.txt的突变行，规范化为去掉空白、以;结尾的形式（如 IB121L;）"""
+    with open(individual_list, 'r') as f:
+        lines = [line.strip().replace(' ', '') for line in f if line.strip()]
+    if len(lines) != 1:
+        raise ValueError(f"individual_list.txt应只有一行突变，实际 {len(lines)} 行: {individual_list}")
+    return normalize_mutation_line(lines[0])
+
+
+def wt_source_pdb(sample_dir):
+    """样本的FoldX输入：编号前的原始WT结构（见pdb_renumber.source_pdb），无法还原时为None"""
+    return source_pdb(Path(sample_dir) / "wt_data" / "relaxed.pdb")
+
+
+def group_samples(sample_dirs, force=False):
+    """
+    按编号前的原始WT结构内容哈希分组（原地重新编号不会改变分组和缓存键）
+    返回 (groups, results)：groups 为 哈希 -> [(sample_dir, 突变行), ...]；
+    results 为无需处理的样本 [(sample_dir, status, message), ...]
+    """
+    groups = defaultdict(list)
+    results = []
+    for sample_dir in sample_dirs:
+        sample_dir = Path(sample_dir)
+        wt_pdb = sample_dir / "wt_data" / "relaxed.pdb"
+        individual_list = sample_dir / "mut_data" / "individual_list.txt"
+        final_mut_pdb = sample_dir / "mut_data" / BUILD_PDB_NAME
+
+        if final_mut_pdb.exists() and not force:
+            results.append((sample_dir, 'skipped', str(final_mut_pdb)))
+            continue
+        if not wt_pdb.exists():
+            results.append((sample_dir, 'failed', f"野生型PDB文件不存在: {wt_pdb}"))
+            continue
+        if not individual_list.exists():
+            results.append((sample_dir, 'failed', f"individual_list.txt文件不存在: {individual_list}"))
+            continue
+        source = wt_source_pdb(sample_dir)
+        if source is None:
+            results.append((sample_dir, 'failed', f"{wt_pdb} 已重新编号且没有原始结构 "
+                                                  f"{os.path.basename(original_pdb_path(wt_pdb))}，突变行的PDB编号无法对应"))
+            continue
+        try:
+            groups[file_sha256(source)].append((sample_dir, read_mutation_line(individual_list)))
+        except Exception as e:
+            results.append((sample_dir, 'failed', str(e)))
+    return groups, results
+
+
+def copy_file_atomic(source, target):
+    """复制到同目录的临时文件再替换，避免中断时留下半个PDB"""
+    target = Path(target)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.pdb', dir=target.parent)
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def run_build_model(software_foldx, repaired_pdb, lines, scratch_dir, number_of_runs=NUMBER_OF_RUNS, timeout=None):
+    """在scratch_dir中对多行突变文件运行一次BuildModel，成功返回None，失败返回错误信息"""
+    shutil.copyfile(repaired_pdb, os.path.join(scratch_dir, BUILD_PDB_NAME))
+    mutant_file = os.path.join(scratch_dir, "individual_list.txt")
+    with open(mutant_file, 'w') as f:
+        f.write(''.join(f"{line}\n" for line in lines))
+
+    build_cmd = [
+        str(software_foldx),
+        "--command=BuildModel",
+        f"--pdb={BUILD_PDB_NAME}",
+        f"--pdb-dir={scratch_dir}",
+        f"--mutant-file={mutant_file}",
+        f"--numberOfRuns={number_of_runs}",
+        f"--output-dir={scratch_dir}"
+    ]
+    try:
+        result = subprocess.run(build_cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return f"BuildModel超时（{timeout}秒）"
+    if result.returncode != 0:
+        return f"BuildModel失败: {result.stderr.strip() or result.stdout.strip()}"
+    return None
+
+
+def install_mutant_pdb(mut_pdb, sample_dir):
+    """把突变体PDB放到样本的 mut_data/relaxed_repair.pdb，并重新编号WT和突变体"""
+    final_mut_pdb = Path(sample_dir) / "mut_data" / BUILD_PDB_NAME
+    copy_file_atomic(mut_pdb, final_mut_pdb)
+    renumber_pdb(Path(sample_dir) / "wt_data" / "relaxed.pdb", keep_original=True)
+    renumber_pdb(final_mut_pdb)
+    return final_mut_pdb
+
+
+def build_group(software_foldx, repaired_pdb, samples, scratch_dir, number_of_runs=NUMBER_OF_RUNS, timeout=None,
+                energy_file=None, run_selection='first', result_cache=None):
+    """
+    对共享同一修复结构的样本运行一次BuildModel
+    samples: [(sample_dir, 突变行), ...]；相同的突变行只构建一次
+    energy_file 不为空时把各样本每次运行的能量项追加到该表；run_selection 为 'lowest' 时取能量最低的运行
+    result_cache 不为空时先查 (修复结构, 突变行) 的缓存，命中的样本不进入BuildModel，新构建的结果写回缓存
+    逐条产出 (sample_dir, status, message)
+    """
+    rows = []
+    pending = samples
+    if result_cache is not None:
+        repaired_hash = file_sha256(repaired_pdb)
+        pending = []
+        for sample_dir, line in samples:
+            cached = result_cache.get(repaired_hash, line, number_of_runs)
+            if cached is None:
+                pending.append((sample_dir, line))
+                continue
+            entry, run_energies = cached
+            energies = {(1, run): terms for run, terms in run_energies.items()}
+            run = select_run(energies, 1, run_selection)
+            install_mutant_pdb(result_cache.mutant_pdb(entry, run), sample_dir)
+            rows.extend(energy_rows(Path(sample_dir).name, line, 1, energies, run))
+            yield sample_dir, 'cached', entry
+
+    line_index = OrderedDict()
+    for _, line in pending:
+        line_index.setdefault(line, len(line_index) + 1)
+
+    error = None
+    if pending:
+        error = run_build_model(software_foldx, repaired_pdb, line_index, scratch_dir, number_of_runs, timeout)
+    if error:
+        for sample_dir, _ in pending:
+            yield sample_dir, 'failed', error
+        pending = []
+
+    stem = BUILD_PDB_NAME[:-len('.pdb')]
+    energies = {}
+    if pending and (energy_file or run_selection != 'first' or result_cache is not None):
+        try:
+            energies = parse_build_energies(scratch_dir, stem)
+        except OSError as e:
+            print(f"⚠️  读取FoldX能量输出失败: {e}")
+
+    if pending and result_cache is not None:
+        for line, index in line_index.items():
+            mutant_pdbs = {run: os.path.join(scratch_dir, mutant_pdb_name(stem, index, run))
+                           for run in range(number_of_runs)}
+            if all(os.path.exists(path) for path in mutant_pdbs.values()):
+                run_energies = {run: terms for (k, run), terms in energies.items() if k == index}
+                result_cache.put(repaired_hash, line, number_of_runs, mutant_pdbs, run_energies)
+
+    for sample_dir, line in pending:
+        index = line_index[line]
+        run = select_run(energies, index, run_selection)
+        mut_pdb = os.path.join(scratch_dir, mutant_pdb_name(stem, index, run))
+        if not os.path.exists(mut_pdb):
+            yield sample_dir, 'failed', f"未找到突变体PDB: {os.path.basename(mut_pdb)}"
+            continue
+        final_mut_pdb = install_mutant_pdb(mut_pdb, sample_dir)
+        rows.extend(energy_rows(Path(sample_dir).name, line, index, energies, run))
+        yield sample_dir, 'generated', str(final_mut_pdb)
+
+    if energy_file:
+        append_energy_rows(rows, energy_file)
+
+
+def run_group(software_foldx, wt_pdb, samples, repair_cache_dir=REPAIR_CACHE_DIR, number_of_runs=NUMBER_OF_RUNS,
+              timeout=None, scratch_root=None, energy_file=None, run_selection='first', result_cache_dir=None):
+    """
+    修复（repair_cache_dir 为空时在临时目录中修复，不写缓存）+ 组批BuildModel（可走结果缓存），
+    临时目录用完即删；返回 [(sample_dir, status, message), ...]
+    """
+    scratch_dir = tempfile.mkdtemp(prefix='foldx-', dir=scratch_root)
+    try:
+        if repair_cache_dir:
+            repaired_pdb, _ = RepairCache(repair_cache_dir, software_foldx).get(str(wt_pdb), timeout=timeout)
+        else:
+            repaired_pdb = os.path.join(scratch_dir, REPAIRED_NAME)
+            repair_pdb(software_foldx, str(wt_pdb), repaired_pdb, timeout)
+        result_cache = ResultCache(result_cache_dir) if result_cache_dir else None
+        return list(build_group(software_foldx, repaired_pdb, samples, scratch_dir, number_of_runs, timeout,
+                                energy_file, run_selection, result_cache))
+    except Exception as e:
+        return [(sample_dir, 'failed', f"{type(e).__name__}: {e}") for sample_dir, _ in samples]
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+@click.command()
+@click.option("--base_dir", default=DATA_DIR, type=str, help="样本根目录")
+@click.option("--pattern", default="rcsb_*", type=str, help="样本目录匹配模式")
+@click.option("--geostab_dir", default=GEOSTAB_DIR, type=str, help="GeoStab项目根目录")
+@click.option("--repair_cache_dir", default=REPAIR_CACHE_DIR, type=str, help="RepairPDB缓存目录（传空字符串则不缓存）")
+@click.option("--number_of_runs", default=NUMBER_OF_RUNS, type=int, help="BuildModel的numberOfRuns")
+@click.option("--timeout", default=None, type=int, help="每条FoldX命令的超时（秒）")
+@click.option("--scratch_dir", default=None, type=str, help="临时目录的父目录（默认系统临时目录）")
+@click.option("--energy_file", default=FOLDX_ENERGY_FILE, type=str, help="FoldX能量表（CSV，传空字符串则不保存）")
+@click.option("--run_selection", default="first", type=click.Choice(RUN_SELECTIONS), help="取第0次运行或能量最低的运行")
+@click.option("--result_cache_dir", default=RESULT_CACHE_DIR, type=str, help="BuildModel结果缓存目录（传空字符串则不缓存）")
+@click.option("--result_cache_gb", default=RESULT_CACHE_MAX_GB, type=float, help="结果缓存的磁盘预算（GB），超出按LRU淘汰")
+@click.option("--force", is_flag=True, help="重新生成已存在的relaxed_repair.pdb")
+def main(base_dir, pattern, geostab_dir, repair_cache_dir, number_of_runs, timeout, scratch_dir, energy_file,
+         run_selection, result_cache_dir, result_cache_gb, force):
+    """
+    按母结构组批运行FoldX BuildModel
+
+    使用方法：
+    python foldx_batch.py --base_dir /path/to/ddG_train --timeout 3600
+    """
+    software_foldx = Path(geostab_dir) / "foldx" / "foldx_20251231"
+    if not software_foldx.exists() or not os.access(str(software_foldx), os.X_OK):
+        print(f"❌ 错误: FoldX可执行文件不存在或无执行权限: {software_foldx}")
+        return
+
+    sample_dirs = sorted(path for path in Path(base_dir).glob(pattern) if path.is_dir())
+    groups, results = group_samples(sample_dirs, force)
+    print(f"📊 {len(sample_dirs)} 个样本, {len(groups)} 个母结构")
+
+    counts = defaultdict(int)
+    for sample_dir, status, message in results:
+        counts[status] += 1
+        if status == 'failed':
+            print(f"❌ {sample_dir.name}: {message}")
+
+    start = time.time()
+    for idx, samples in enumerate(groups.values()):
+        wt_pdb = wt_source_pdb(samples[0][0])
+        print(f"\n🧬 母结构 {idx + 1}/{len(groups)}: {samples[0][0].name} 等 {len(samples)} 个样本")
+        for sample_dir, status, message in run_group(software_foldx, wt_pdb, samples, repair_cache_dir,
+                                                     number_of_runs, timeout, scratch_dir, energy_file,
+                                                     run_selection, result_cache_dir):
+            counts[status] += 1
+            if status == 'failed':
+                print(f"❌ {sample_dir.name}: {message}")
+
+    if result_cache_dir:
+        removed, freed = ResultCache(result_cache_dir, result_cache_gb).evict()
+        if removed:
+            print(f"🧹 结果缓存淘汰 {removed} 个条目，释放 {freed / (1 << 20):.1f} MB")
+
+    print(f"\n🎉 处理完成！（{time.time() - start:.1f} 秒）")
+    print(f"✅ 成功: {counts['generated']}")
+    print(f"💾 缓存命中: {counts['cached']}")
+    print(f"⏭️  跳过: {counts['skipped']}")
+    print(f"❌ 失败: {counts['failed']}")
+
+
+if __name__ == "__main__":
+    main()
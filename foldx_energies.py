@@ -0,0 +1,129 @@
+"""
+FoldX BuildModel 能量输出解析
+解析 Dif_*.fxout（突变体 − WT 的各能量项）和 Raw_*.fxout（突变体/WT各自的总能量），
+按 (样本, 运行序号) 追加到一个紧凑的CSV表；可选用能量最低的一次运行代替第0次运行的结构
+"""
+
+import fcntl
+import os
+import re
+
+import pandas as pd
+
+FOLDX_ENERGY_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/foldx_energies.csv"
+# first: 与原流程一致取第0次运行；lowest: 取Dif总能量（ddG）最低的一次运行
+RUN_SELECTIONS = ('first', 'lowest')
+
+
+def normalize_column(name):
+    """FoldX列名 → 小写下划线，如 'total energy' → 'total_energy'"""
+    return re.sub(r'[^0-9a-z]+', '_', name.strip().lower()).strip('_')
+
+
+def parse_fxout(fxout_file):
+    """解析一个fxout表格：跳过说明头，从 'Pdb' 开头的列名行开始，返回 [{列名: 值}, ...]"""
+    rows = []
+    columns = None
+    with open(fxout_file, 'r') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if columns is None:
+                if line.startswith('Pdb\t'):
+                    columns = [normalize_column(name) for name in line.split('\t')]
+                continue
+            if not line.strip():
+                continue
+            values = line.split('\t')
+            row = {}
+            for column, value in zip(columns, values):
+                if column == 'pdb':
+                    row[column] = value.strip()
+                    continue
+                try:
+                    row[column] = float(value)
+                except ValueError:
+                    row[column] = value.strip()
+            rows.append(row)
+    return rows
+
+
+def parse_build_energies(output_dir, pdb_stem):
+    """
+    读取BuildModel输出目录中的 Dif_<stem>.fxout 和 Raw_<stem>.fxout
+    返回 {(突变行号k, 运行序号run): {'dif_total_energy': ..., ..., 'mut_total_energy': ..., 'wt_total_energy': ...}}
+    """
+    name_pattern = re.compile(rf'^(WT_)?{re.escape(pdb_stem)}_(\d+)_(\d+)\.pdb$')
+    energies = {}
+
+    dif_file = os.path.join(output_dir, f"Dif_{pdb_stem}.fxout")
+    for row in parse_fxout(dif_file):
+        match = name_pattern.match(row.get('pdb', ''))
+        if match is None or match.group(1):
+            continue
+        key = (int(match.group(2)), int(match.group(3)))
+        energies[key] = {f"dif_{column}": value for column, value in row.items() if column != 'pdb'}
+
+    raw_file = os.path.join(output_dir, f"Raw_{pdb_stem}.fxout")
+    if os.path.exists(raw_file):
+        for row in parse_fxout(raw_file):
+            match = name_pattern.match(row.get('pdb', ''))
+            if match is None:
+                continue
+            key = (int(match.group(2)), int(match.group(3)))
+            prefix = 'wt' if match.group(1) else 'mut'
+            energies.setdefault(key, {})[f"{prefix}_total_energy"] = row.get('total_energy')
+    return energies
+
+
+def select_run(energies, index, run_selection='first'):
+    """为突变文件第index行选择运行序号；没有能量记录时退回第0次运行"""
+    if run_selection not in RUN_SELECTIONS:
+        raise ValueError(f"不支持的运行选择方式: {run_selection}，可选: {RUN_SELECTIONS}")
+    runs = {run: terms for (k, run), terms in energies.items() if k == index}
+    if run_selection == 'first' or not runs:
+        return 0
+    return min(runs, key=lambda run: (runs[run].get('dif_total_energy', float('inf')), run))
+
+
+def energy_rows(sample, mutation_line, index, energies, selected_run):
+    """一个样本的全部运行 → 表格行"""
+    rows = []
+    for (k, run), terms in sorted(energies.items()):
+        if k != index:
+            continue
+        rows.append({
+            'name': sample,
+            'mutation': mutation_line,
+            'run': run,
+            'selected': run == selected_run,
+            **terms,
+        })
+    return rows
+
+
+def append_energy_rows(rows, energy_file=FOLDX_ENERGY_FILE):
+    """
+    加锁追加到CSV：文件不存在时按本批的列写表头，之后按已有表头对齐列
+    多个工作进程可以同时调用
+    """
+    if not rows:
+        return
+    os.makedirs(os.path.dirname(energy_file) or '.', exist_ok=True)
+    with open(energy_file, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        header = f.readline().rstrip('\n')
+        table = pd.DataFrame(rows)
+        if header:
+            table = table.reindex(columns=header.split(','))
+        f.seek(0, os.SEEK_END)
+        table.to_csv(f, index=False, header=not header, float_format='%.4f')
+
+
+def load_energy_table(energy_file=FOLDX_ENERGY_FILE, selected_only=False):
+    """读取能量表，重复运行的同一 (样本, 运行) 保留最后一次写入"""
+    table = pd.read_csv(energy_file)
+    table = table.drop_duplicates(subset=['name', 'run'], keep='last')
+    if selected_only:
+        table = table[table['selected']]
+    return table.reset_index(drop=True)
@@ -0,0 +1,125 @@
+"""
+数据集级的并行FoldX驱动
+样本按母结构分组（见foldx_batch.py），每组再按 max_group_size 切成若干任务，由进程池并发执行；
+每个任务有独立、用完即删的临时目录（可放在tmpfs上）和每条命令的超时，输出按行号精确选取，
+最后报告吞吐和失败数
+"""
+
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import click
+from tqdm import tqdm
+
+from foldx_batch import DATA_DIR, GEOSTAB_DIR, NUMBER_OF_RUNS, group_samples, run_group, wt_source_pdb
+from foldx_energies import FOLDX_ENERGY_FILE, RUN_SELECTIONS
+from foldx_result_cache import RESULT_CACHE_DIR, RESULT_CACHE_MAX_GB, ResultCache
+from foldx_repair_cache import REPAIR_CACHE_DIR
+
+TMPFS_DIR = "/dev/shm"
+
+
+def split_groups(groups, max_group_size=None):
+    """把每个母结构的样本切成不超过max_group_size的任务，返回 [(wt_pdb, samples), ...]"""
+    jobs = []
+    for samples in groups.values():
+        size = max_group_size or len(samples)
+        for start in range(0, len(samples), size):
+            chunk = samples[start:start + size]
+            jobs.append((wt_source_pdb(chunk[0][0]), chunk))
+    return jobs
+
+
+def run_parallel(software_foldx, groups, num_workers, max_group_size=None, repair_cache_dir=REPAIR_CACHE_DIR,
+                 number_of_runs=NUMBER_OF_RUNS, timeout=None, scratch_root=None, energy_file=None,
+                 run_selection='first', result_cache_dir=None):
+    """并发执行全部任务，按完成顺序逐条产出 (sample_dir, status, message)"""
+    jobs = split_groups(groups, max_group_size)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(run_group, software_foldx, wt_pdb, samples, repair_cache_dir, number_of_runs, timeout,
+                            scratch_root, energy_file, run_selection, result_cache_dir): samples
+            for wt_pdb, samples in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                yield from future.result()
+            except Exception as e:
+                for sample_dir, _ in futures[future]:
+                    yield sample_dir, 'failed', f"工作进程出错: {e}"
+
+
+@click.command()
+@click.option("--base_dir", default=DATA_DIR, type=str, help="样本根目录")
+@click.option("--pattern", default="rcsb_*", type=str, help="样本目录匹配模式")
+@click.option("--geostab_dir", default=GEOSTAB_DIR, type=str, help="GeoStab项目根目录")
+@click.option("--repair_cache_dir", default=REPAIR_CACHE_DIR, type=str, help="RepairPDB缓存目录（传空字符串则不缓存）")
+@click.option("--num_workers", default=os.cpu_count(), type=int, help="并发的FoldX任务数")
+@click.option("--max_group_size", default=None, type=int, help="每个BuildModel任务最多的样本数（1即逐样本运行）")
+@click.option("--number_of_runs", default=NUMBER_OF_RUNS, type=int, help="BuildModel的numberOfRuns")
+@click.option("--timeout", default=3600, type=int, help="每条FoldX命令的超时（秒）")
+@click.option("--scratch_dir", default=None, type=str, help="临时目录的父目录（默认系统临时目录）")
+@click.option("--tmpfs", is_flag=True, help=f"临时目录放在 {TMPFS_DIR}")
+@click.option("--energy_file", default=FOLDX_ENERGY_FILE, type=str, help="FoldX能量表（CSV，传空字符串则不保存）")
+@click.option("--run_selection", default="first", type=click.Choice(RUN_SELECTIONS), help="取第0次运行或能量最低的运行")
+@click.option("--result_cache_dir", default=RESULT_CACHE_DIR, type=str, help="BuildModel结果缓存目录（传空字符串则不缓存）")
+@click.option("--result_cache_gb", default=RESULT_CACHE_MAX_GB, type=float, help="结果缓存的磁盘预算（GB），超出按LRU淘汰")
+@click.option("--force", is_flag=True, help="重新生成已存在的relaxed_repair.pdb")
+def main(base_dir, pattern, geostab_dir, repair_cache_dir, num_workers, max_group_size, number_of_runs, timeout,
+         scratch_dir, tmpfs, energy_file, run_selection, result_cache_dir, result_cache_gb, force):
+    """
+    并行运行FoldX RepairPDB + BuildModel
+
+    使用方法：
+    python foldx_parallel.py --base_dir /path/to/ddG_train --num_workers 16 --max_group_size 50 --tmpfs
+    """
+    software_foldx = Path(geostab_dir) / "foldx" / "foldx_20251231"
+    if not software_foldx.exists() or not os.access(str(software_foldx), os.X_OK):
+        print(f"❌ 错误: FoldX可执行文件不存在或无执行权限: {software_foldx}")
+        return
+    if tmpfs:
+        scratch_dir = TMPFS_DIR
+
+    sample_dirs = sorted(path for path in Path(base_dir).glob(pattern) if path.is_dir())
+    groups, results = group_samples(sample_dirs, force)
+    num_pending = sum(len(samples) for samples in groups.values())
+    print(f"📊 {len(sample_dirs)} 个样本, {len(groups)} 个母结构, 待处理 {num_pending} 个")
+    print(f"🧵 {num_workers} 个并发任务, 临时目录: {scratch_dir or '系统默认'}, 超时 {timeout} 秒")
+
+    counts = defaultdict(int)
+    failures = []
+    for sample_dir, status, message in results:
+        counts[status] += 1
+        if status == 'failed':
+            failures.append((sample_dir.name, message))
+
+    start = time.time()
+    results = run_parallel(software_foldx, groups, num_workers, max_group_size, repair_cache_dir, number_of_runs,
+                           timeout, scratch_dir, energy_file, run_selection, result_cache_dir)
+    for sample_dir, status, message in tqdm(results, total=num_pending, desc="FoldX"):
+        counts[status] += 1
+        if status == 'failed':
+            failures.append((Path(sample_dir).name, message))
+    elapsed = time.time() - start
+    if result_cache_dir:
+        removed, freed = ResultCache(result_cache_dir, result_cache_gb).evict()
+        if removed:
+            print(f"🧹 结果缓存淘汰 {removed} 个条目，释放 {freed / (1 << 20):.1f} MB")
+
+    print("\n" + "=" * 80)
+    print("📊 处理完成统计:")
+    print("=" * 80)
+    print(f"✅ 成功: {counts['generated']}")
+    print(f"💾 缓存命中: {counts['cached']}")
+    print(f"⏭️  跳过: {counts['skipped']}")
+    print(f"❌ 失败: {counts['failed']}")
+    print(f"⚡ 吞吐: {(counts['generated'] + counts['cached']) / elapsed if elapsed > 0 else 0.0:.2f} 样本/秒 (耗时 {elapsed:.1f} 秒)")
+    for name, message in failures:
+        print(f"   ❌ {name}: {message}")
+
+
+if __name__ == "__main__":
+    main()
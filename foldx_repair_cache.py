@@ -0,0 +1,95 @@
+"""
+FoldX RepairPDB 缓存
+同一PDB ID的所有突变体共用完全相同的WT结构（test.py把同一个 {pdb_id}.pdb 分发到每个样本），
+按输入PDB的内容哈希只修复一次，修复结果保存在 <root>/<key[:2]>/<key>/relaxed_Repair.pdb，
+供所有样本的BuildModel使用；每个条目一把文件锁，并发的工作进程不会重复修复同一结构
+"""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+from pipeline_io import check_file_exists
+
+REPAIR_CACHE_DIR = "/home/corp/xingqiao.lin/code/GeoStab/data/foldx_repair_cache"
+# RepairPDB 对 --pdb=relaxed.pdb 的输出文件名
+REPAIR_INPUT_NAME = "relaxed.pdb"
+REPAIRED_NAME = "relaxed_Repair.pdb"
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RepairCache:
+    """按输入PDB内容寻址的RepairPDB结果缓存"""
+
+    def __init__(self, root=REPAIR_CACHE_DIR, foldx_exe=None):
+        self.root = str(root)
+        self.foldx_exe = str(foldx_exe) if foldx_exe is not None else None
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], key, REPAIRED_NAME)
+
+    def lookup(self, pdb_file):
+        """已修复时返回缓存中的路径，否则返回None"""
+        path = self.path_for(file_sha256(pdb_file))
+        return path if check_file_exists(path) else None
+
+    def get(self, pdb_file, timeout=None):
+        """
+        返回 (修复后的PDB路径, 是否命中缓存)
+        未命中时持有该条目的锁运行一次RepairPDB；等锁期间别的进程已修复完成则直接命中
+        """
+        key = file_sha256(pdb_file)
+        path = self.path_for(key)
+        if check_file_exists(path):
+            return path, True
+
+        entry_dir = os.path.dirname(path)
+        os.makedirs(entry_dir, exist_ok=True)
+        with open(os.path.join(entry_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if check_file_exists(path):
+                return path, True
+            self._repair(pdb_file, path, timeout)
+        return path, False
+
+    def _repair(self, pdb_file, out_path, timeout=None):
+        """在条目目录下的临时目录里运行RepairPDB，完成后原子地移入缓存"""
+        if self.foldx_exe is None:
+            raise RuntimeError("未指定FoldX可执行文件，无法运行RepairPDB")
+        repair_pdb(self.foldx_exe, pdb_file, out_path, timeout)
+
+
+def repair_pdb(foldx_exe, pdb_file, out_path, timeout=None):
+    """在out_path所在目录下的临时目录里运行RepairPDB，完成后原子地移到out_path（不经过缓存）"""
+    scratch = tempfile.mkdtemp(prefix='.repair-', dir=os.path.dirname(out_path))
+    try:
+        shutil.copyfile(pdb_file, os.path.join(scratch, REPAIR_INPUT_NAME))
+        repair_cmd = [
+            str(foldx_exe),
+            "--command=RepairPDB",
+            f"--pdb={REPAIR_INPUT_NAME}",
+            f"--pdb-dir={scratch}",
+            f"--output-dir={scratch}"
+        ]
+        print(f"   命令: {' '.join(repair_cmd)}")
+        result = subprocess.run(repair_cmd, capture_output=True, text=True, timeout=timeout)
+        if result.returncode != 0:
+            raise RuntimeError(f"RepairPDB失败: {result.stderr.strip() or result.stdout.strip()}")
+
+        repaired = os.path.join(scratch, REPAIRED_NAME)
+        if not check_file_exists(repaired):
+            raise RuntimeError(f"未找到修复后的PDB文件，临时目录内容: {sorted(os.listdir(scratch))}")
+        os.replace(repaired, out_path)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
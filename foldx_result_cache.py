@@ -0,0 +1,154 @@
+"""
+FoldX BuildModel 结果缓存
+键为 (修复后结构的内容哈希, 规范化的突变行如 IB121L;, numberOfRuns)，同一突变换了样本名或CSV重新切分后不再重跑FoldX；
+条目保存在 <root>/<key[:2]>/<key>/：每次运行的突变体PDB（mutant_<run>.pdb，未重新编号的FoldX原始输出）、
+energies.json（每次运行的能量项）和 meta.json；命中时更新条目时间戳，超出磁盘预算时按最久未使用淘汰
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from pipeline_io import check_file_exists
+
+RESULT_CACHE_DIR = "/home/corp/xingqiao.lin/code/GeoStab/data/foldx_result_cache"
+RESULT_CACHE_MAX_GB = 50
+ENERGIES_NAME = "energies.json"
+META_NAME = "meta.json"
+
+
+def normalize_mutation_line(line):
+    """
+    突变行规范化：去掉所有空白，以;结尾（与 generate_individual_lists.py 写出的格式一致）；
+    多点突变按 (链, 位置) 排序，同一组突变写法顺序不同时得到同一个缓存键
+    """
+    tokens = ''.join(line.split()).rstrip(';').split(',')
+    return ','.join(sorted(tokens, key=mutation_sort_key)) + ';'
+
+
+def mutation_sort_key(token):
+    """FoldX突变（如 IB121L）的排序键：(链, 位置)，无法解析的放在最后"""
+    match = re.match(r'^.(.)(-?\d+)', token)
+    return (0, match.group(1), int(match.group(2)), token) if match else (1, '', 0, token)
+
+
+def cached_pdb_name(run):
+    return f"mutant_{run}.pdb"
+
+
+class ResultCache:
+    """按 (修复结构, 突变行) 寻址的BuildModel结果缓存"""
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_gb=RESULT_CACHE_MAX_GB):
+        self.root = str(root)
+        self.max_bytes = int(max_gb * (1 << 30)) if max_gb else None
+
+    @staticmethod
+    def key_for(repaired_hash, mutation_line, number_of_runs):
+        text = f"{repaired_hash}\n{normalize_mutation_line(mutation_line)}\n{number_of_runs}"
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, repaired_hash, mutation_line, number_of_runs):
+        """
+        命中时返回 (条目目录, {run: 能量项})，否则返回None
+        命中会刷新条目的时间戳（LRU）
+        """
+        entry = self.entry_dir(self.key_for(repaired_hash, mutation_line, number_of_runs))
+        meta_file = os.path.join(entry, META_NAME)
+        try:
+            with open(os.path.join(entry, ENERGIES_NAME), 'r') as f:
+                energies = {int(run): terms for run, terms in json.load(f).items()}
+            if not all(check_file_exists(os.path.join(entry, cached_pdb_name(run))) for run in range(number_of_runs)):
+                return None
+            os.utime(meta_file)
+        except (OSError, ValueError):
+            # 条目不完整或正被淘汰
+            return None
+        return entry, energies
+
+    def mutant_pdb(self, entry, run=0):
+        return os.path.join(entry, cached_pdb_name(run))
+
+    def put(self, repaired_hash, mutation_line, number_of_runs, mutant_pdbs, energies):
+        """
+        写入一个条目：mutant_pdbs 为 {run: FoldX输出的突变体PDB}，energies 为 {run: 能量项}
+        先写到同目录的临时目录再整体改名，并发写入同一条目时保留先到的一份
+        """
+        key = self.key_for(repaired_hash, mutation_line, number_of_runs)
+        entry = self.entry_dir(key)
+        if os.path.exists(entry):
+            return entry
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        scratch = tempfile.mkdtemp(prefix='.put-', dir=os.path.dirname(entry))
+        try:
+            for run, pdb_file in mutant_pdbs.items():
+                shutil.copyfile(pdb_file, os.path.join(scratch, cached_pdb_name(run)))
+            with open(os.path.join(scratch, ENERGIES_NAME), 'w') as f:
+                json.dump({str(run): terms for run, terms in energies.items()}, f)
+            with open(os.path.join(scratch, META_NAME), 'w') as f:
+                json.dump({
+                    'repaired_hash': repaired_hash,
+                    'mutation': normalize_mutation_line(mutation_line),
+                    'number_of_runs': number_of_runs,
+                    'created': time.time(),
+                }, f)
+            os.rename(scratch, entry)
+        except OSError:
+            # 别的进程已写入同一条目
+            if not os.path.exists(entry):
+                raise
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        return entry
+
+    def entries(self):
+        """[(最近使用时间, 字节数, 条目目录), ...]"""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if not entry.is_dir() or entry.name.startswith('.'):
+                    continue
+                try:
+                    used = os.stat(os.path.join(entry.path, META_NAME)).st_mtime
+                    size = sum(item.stat().st_size for item in os.scandir(entry.path) if item.is_file())
+                except OSError:
+                    continue
+                entries.append((used, size, entry.path))
+        return entries
+
+    def evict(self, max_bytes=None):
+        """
+        超出磁盘预算时从最久未使用的条目开始删除，返回 (删除条目数, 释放字节数)
+        同一时刻只有一个进程做淘汰，其他进程直接跳过
+        """
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        if max_bytes is None or not os.path.isdir(self.root):
+            return 0, 0
+        with open(os.path.join(self.root, '.evict.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0, 0
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            removed, freed = 0, 0
+            for _, size, path in entries:
+                if total - freed <= max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+                freed += size
+        return removed, freed
+
@@ -1,37 +1,269 @@
 import click
+import hashlib
+import json
 import os
 from pathlib import Path
 import re
+from collections import defaultdict, namedtuple
 
+import pandas as pd
+
+CSV_FILE = "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754.csv"
+# 批量模式记录每个样本已写入内容的哈希，文件仍在且内容与清单一致的样本不再重写
+MANIFEST_NAME = ".individual_lists.json"
+
+
+# 名称中多点突变之间的分隔符，如 rcsb_1A0N_B_I121L+K130A_7_25
+# 名称同时是目录名和CSV的name列，不能用 ',' 和 '/'
+MUTATION_SEPARATORS = r'[+]'
+# 旧写法的分隔符：出现时整个名称视为无法解析，避免被宽松的单点规则误读成一个突变
+UNSAFE_SEPARATORS = r'[,:/]'
+# 单个突变: 首字符为WT残基，第一段数字为位置，末字符为突变残基（与原先单点解析规则一致）；
+# WT残基后可紧跟一个链字母（FoldX写法，如 KC130A），省略时用名称中的链
+MUTATION_TOKEN = r'^(?P<wt_aa>.)(?P<chain_id>[A-Za-z])?\D*(?P<position>\d+).*(?P<mut_aa>.)$'
+
+Mutation = namedtuple('Mutation', ['chain_id', 'position', 'wt_aa', 'mut_aa'])
+
+
+def parse_mutations_from_name(name):
+    """
+    从name中解析全部突变，返回按 (链, 位置) 排序的 Mutation 元组，无法解析时返回None
+    例如: rcsb_1A0N_B_I121L+K130A_7_25 -> (Mutation(B, 121, I, L), Mutation(B, 130, K, A))
+         rcsb_1A0N_B_I121L+KC130A_7_25 -> (Mutation(B, 121, I, L), Mutation(C, 130, K, A))
+    """
+    parts = name.split('_')
+    if len(parts) < 4:
+        return None
+    chain_id = parts[2]
+    if re.search(UNSAFE_SEPARATORS, parts[3]):
+        return None
+    mutations = []
+    for token in re.split(MUTATION_SEPARATORS, parts[3]):
+        match = re.match(MUTATION_TOKEN, token)
+        if match is None:
+            return None
+        mutations.append(Mutation(match.group('chain_id') or chain_id, int(match.group('position')),
+                                  match.group('wt_aa'), match.group('mut_aa')))
+    return tuple(sorted(mutations, key=lambda m: (m.chain_id, m.position)))
 
 
 def parse_mutation_from_name(name):
     """
-    从name中解析突变信息
+    从name中解析单点突变信息
     例如: rcsb_1A0N_B_I121L_7_25 -> (B, 121, I, L)
+    多点突变返回None，需要用 parse_mutations_from_name
     """
-    parts = name.split('_')
-    if len(parts) >= 4:
-        chain_id = parts[2]  # B
-        mut_info = parts[3]  # I121L
-        
-        # 提取位置数字
-        match = re.search(r'(\d+)', mut_info)
-        if match:
-            position = int(match.group(1))
-            wt_aa = mut_info[0]  # I
-            mut_aa = mut_info[-1]  # L
-            return chain_id, position, wt_aa, mut_aa
+    mutations = parse_mutations_from_name(name)
+    if mutations is None or len(mutations) != 1:
+        return None
+    return tuple(mutations[0])
+
+
+def mutation_line(mutations):
+    """FoldX突变行：多个突变用逗号连接，按 (链, 位置) 排序，如 IB121L,KB130A;"""
+    ordered = sorted(mutations, key=lambda m: (m.chain_id, m.position))
+    return ','.join(f"{m.wt_aa}{m.chain_id}{m.position}{m.mut_aa}" for m in ordered) + ';'
+
+
+def locate_mutation_index(wt_seq, position, wt_aa, mut_aa=None, mut_seq=None):
+    """
+    确定突变在wt_seq中的0-based下标
+    名称中的位置是PDB残基编号，不一定等于序列下标：
+    优先用wt_seq与mut_seq的差异位点，其次检查 wt_seq[position-1] 是否为wt_aa
+    无法确定时返回None
+    """
+    if mut_seq is not None and len(mut_seq) == len(wt_seq):
+        diffs = [i for i, (a, b) in enumerate(zip(wt_seq, mut_seq)) if a != b]
+        if len(diffs) == 1 and wt_seq[diffs[0]] == wt_aa and (mut_aa is None or mut_seq[diffs[0]] == mut_aa):
+            return diffs[0]
+    if 1 <= position <= len(wt_seq) and wt_seq[position - 1] == wt_aa:
+        return position - 1
+    return None
+
+
+def locate_mutation_indices(wt_seq, mutations, mut_seq=None):
+    """
+    locate_mutation_index 的多点版本：返回与mutations一一对应的0-based下标列表，无法确定时返回None
+    差异位点先按 (链, 位置) 顺序与突变对应（与 parse_mutations_from_name 的排序一致），残基对不上时按
+    (WT残基, 突变残基) 逐个配对（多链突变的链顺序不一定与序列中的顺序相同）；都不行时逐个检查 wt_seq[position-1]
+    """
+    if mut_seq is not None and len(mut_seq) == len(wt_seq):
+        diffs = [i for i, (a, b) in enumerate(zip(wt_seq, mut_seq)) if a != b]
+        order = sorted(range(len(mutations)), key=lambda k: (mutations[k].chain_id, mutations[k].position))
+        if len(diffs) == len(mutations):
+            indices = [None] * len(mutations)
+            for k, diff in zip(order, diffs):
+                indices[k] = diff
+            if all(wt_seq[i] == m.wt_aa and mut_seq[i] == m.mut_aa for i, m in zip(indices, mutations)):
+                return indices
+
+            # 同一对残基的差异位点与突变仍按顺序对应
+            diffs_by_residues = defaultdict(list)
+            for diff in diffs:
+                diffs_by_residues[wt_seq[diff], mut_seq[diff]].append(diff)
+            indices = [None] * len(mutations)
+            for k in order:
+                candidates = diffs_by_residues.get((mutations[k].wt_aa, mutations[k].mut_aa))
+                if not candidates:
+                    break
+                indices[k] = candidates.pop(0)
+            else:
+                return indices
+    if all(1 <= m.position <= len(wt_seq) and wt_seq[m.position - 1] == m.wt_aa for m in mutations):
+        return [m.position - 1 for m in mutations]
     return None
 
 
+def parse_mutation_table(names):
+    """
+    parse_mutations_from_name 的向量化版本：names → DataFrame
+    列: name, clean_name, mutations（Mutation元组）, num_mutations, line（FoldX突变行），
+    以及第一个突变的 chain_id, position, wt_aa, mut_aa；无法解析的行mutations为None、position为NA
+    """
+    names = pd.Series(list(names), dtype=object)
+    clean_names = names.str.replace(' ', '_', regex=False)
+    parts = clean_names.str.split('_', n=4, expand=True).reindex(columns=range(5))
+
+    # 每个突变一行，按名称所在行号聚合
+    tokens = parts[3].fillna('').str.split(MUTATION_SEPARATORS, regex=True).explode()
+    fields = tokens.str.extract(MUTATION_TOKEN)
+    fields['position'] = pd.to_numeric(fields['position'], errors='coerce').astype('Int64')
+    fields['chain_id'] = fields['chain_id'].where(fields['chain_id'].notna(), parts[2].reindex(fields.index).to_numpy())
+    valid = (fields['position'].notna() & fields['chain_id'].notna()).groupby(level=0).all()
+    valid &= ~parts[3].fillna('').str.contains(UNSAFE_SEPARATORS, regex=True)
+    fields = fields[valid.reindex(fields.index).to_numpy()]
+    fields = fields.rename_axis('row').sort_values(['row', 'chain_id', 'position'], kind='stable')
+
+    mutations = pd.Series(
+        [Mutation(*values) for values in zip(fields['chain_id'], fields['position'].astype(int), fields['wt_aa'],
+                                             fields['mut_aa'])],
+        index=fields.index, dtype=object,
+    ).groupby(level=0).agg(tuple)
+    lines = (fields['wt_aa'] + fields['chain_id'] + fields['position'].astype(str) + fields['mut_aa'])
+    lines = lines.groupby(level=0).agg(','.join) + ';'
+    first = fields.groupby(level=0).first()
+
+    table = pd.DataFrame({'name': names, 'clean_name': clean_names})
+    table['mutations'] = mutations.reindex(table.index)
+    table['num_mutations'] = mutations.str.len().reindex(table.index).fillna(0).astype(int)
+    table['line'] = lines.reindex(table.index)
+    for column in ('chain_id', 'position', 'wt_aa', 'mut_aa'):
+        table[column] = first[column].reindex(table.index)
+    table['mutations'] = table['mutations'].astype(object).where(table['mutations'].notna(), None)
+    return table
+
+
+def check_wt_residues(table, wt_seqs, mut_seqs=None):
+    """
+    检查名称中的WT残基与wt_seq是否一致，返回status列：
+    ok: 每个突变都满足 wt_seq[position-1] == wt_aa；offset: 位置不对应但与mut_seq的差异位点一致（PDB编号不从1开始）；
+    mismatch: 都对不上；unparsed: 名称无法解析
+    """
+    mut_seqs = mut_seqs if mut_seqs is not None else [None] * len(table)
+    status = []
+    for mutations, wt_seq, mut_seq in zip(table['mutations'], wt_seqs, mut_seqs):
+        mut_seq = mut_seq if isinstance(mut_seq, str) else None
+        if mutations is None or not isinstance(wt_seq, str):
+            status.append('unparsed')
+        elif all(1 <= m.position <= len(wt_seq) and wt_seq[m.position - 1] == m.wt_aa for m in mutations):
+            status.append('ok')
+        elif locate_mutation_indices(wt_seq, mutations, mut_seq) is not None:
+            status.append('offset')
+        else:
+            status.append('mismatch')
+    return pd.Series(status, index=table.index, dtype=object)
+
+
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def content_digest(path):
+    """文件内容的SHA-256，文件不存在或读不了时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def write_individual_lists(table, base_dir, force=False, keep_mismatch=False):
+    """
+    一次遍历写出全部individual_list.txt，返回带 result 列的表：
+    written / unchanged（清单中哈希相同，且文件存在、内容哈希也相同）/ rejected（WT残基检查未通过）/
+    missing_dir（样本目录不存在）/ error
+    """
+    base_dir = Path(base_dir)
+    manifest_file = base_dir / MANIFEST_NAME
+    manifest = {} if force else load_manifest(manifest_file)
+    writable = {'ok', 'offset', 'mismatch'} if keep_mismatch else {'ok', 'offset'}
+
+    results = []
+    for row in table.itertuples(index=False):
+        if row.status not in writable:
+            results.append('rejected')
+            continue
+        content = f"{row.line}\n"
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        individual_list = base_dir / row.clean_name / "mut_data" / "individual_list.txt"
+        # 清单只说明上次写过什么，文件可能已被删除或改写
+        if manifest.get(row.clean_name) == digest and content_digest(individual_list) == digest:
+            results.append('unchanged')
+            continue
+        try:
+            with open(individual_list, 'w') as f:
+                f.write(content)
+        except FileNotFoundError:
+            results.append('missing_dir')
+            continue
+        except OSError:
+            results.append('error')
+            continue
+        manifest[row.clean_name] = digest
+        results.append('written')
+
+    tmp_file = manifest_file.with_name(MANIFEST_NAME + '.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, manifest_file)
+    return table.assign(result=results)
+
+
+def run_bulk(csv_file, base_dir, force=False, keep_mismatch=False):
+    """批量模式：读取一次CSV，解析、校验、写出，打印汇总表"""
+    train = pd.read_csv(csv_file, sep=',')
+    table = parse_mutation_table(train['name'])
+    table['status'] = check_wt_residues(table, train['wt_seq'].tolist(),
+                                        train['mut_seq'].tolist() if 'mut_seq' in train else None)
+    table = write_individual_lists(table, base_dir, force, keep_mismatch)
+
+    print(f"📊 {len(table)} 个样本（{csv_file}）")
+    summary = table.groupby(['status', 'result']).size().rename('count').reset_index()
+    print(summary.to_string(index=False))
+    bad = table[table['status'].isin(['mismatch', 'unparsed']) | table['result'].isin(['missing_dir', 'error'])]
+    if len(bad):
+        print(f"\n⚠️  需要检查的样本（前20个，共{len(bad)}个）:")
+        print(bad.head(20)[['name', 'line', 'status', 'result']].to_string(index=False))
+    return table
+
+
 @click.command()
 @click.option("--base_dir", default="/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train", type=str, help="基础输出目录")
 @click.option("--pattern", default="rcsb_*", type=str, help="样本目录匹配模式")
 @click.option("--force", is_flag=True, help="强制重新生成已存在的individual_list.txt")
-def main(base_dir, pattern, force):
+@click.option("--csv_file", default=None, type=str, help=f"批量模式：从CSV生成（如 {CSV_FILE}），不再扫描目录")
+@click.option("--keep_mismatch", is_flag=True, help="批量模式下WT残基与wt_seq不一致的样本也写出")
+def main(base_dir, pattern, force, csv_file, keep_mismatch):
     """
     根据目录路径生成individual_list.txt文件
+
+    使用方法：
+    python generate_individual_lists.py --base_dir /path/to/ddG_train
+    python generate_individual_lists.py --base_dir /path/to/ddG_train --csv_file /path/to/S8754.csv
     """
     
     # 设置基础目录
@@ -40,6 +272,10 @@ def main(base_dir, pattern, force):
         print(f"❌ 错误: 目录不存在: {base_dir}")
         return
     
+    if csv_file:
+        run_bulk(csv_file, base_dir, force, keep_mismatch)
+        return
+    
     success_count = 0
     skip_count = 0
     error_count = 0
@@ -64,14 +300,12 @@ def main(base_dir, pattern, force):
         print(f"\n处理 {idx+1}/{len(sample_dirs)}: {sample_name}")
         
         # 从样本名称中解析突变信息
-        mutation_info = parse_mutation_from_name(sample_name)
-        if mutation_info is None:
+        mutations = parse_mutations_from_name(sample_name)
+        if mutations is None:
             print(f"❌ 跳过: 无法从名称解析突变信息")
             error_count += 1
             continue
         
-        chain_id, pos_1based, wt_aa, mut_aa = mutation_info
-        
         # 检查mut_data目录
         mut_data_dir = sample_dir / "mut_data"
         if not mut_data_dir.exists():
@@ -88,12 +322,13 @@ def main(base_dir, pattern, force):
         
         try:
             # 写入individual_list.txt - 使用正确的格式
-            individual_list_content = f"{wt_aa}{chain_id}{pos_1based}{mut_aa};\n"
+            individual_list_content = f"{mutation_line(mutations)}\n"
             with open(individual_list_file, 'w') as f:
                 f.write(individual_list_content)
             
-            print(f"✅ 成功: 位置{pos_1based} {wt_aa}->{mut_aa} (链{chain_id})")
-            print(f"   individual_list.txt: {chain_id}{pos_1based}{wt_aa}{mut_aa};")
+            for m in mutations:
+                print(f"✅ 成功: 位置{m.position} {m.wt_aa}->{m.mut_aa} (链{m.chain_id})")
+            print(f"   individual_list.txt: {individual_list_content.strip()}")
             print(f"   文件路径: {individual_list_file}")
             
             success_count += 1
@@ -0,0 +1,281 @@
+"""
+本地的trRosetta式残基对几何特征（实验性）
+生成的 pair_local.pt 是GeoStab pair.pt之外的额外特征，不能替代pair.pt，下游模型目前也不读取它；
+由主链N/CA/C（CB按理想几何补全）计算 L×L×7 的pair张量：CB距离、ω二面角、θ二面角、φ键角（角度取sin/cos），
+每个 (i, j) 只依赖残基i、j的坐标；突变体可以在WT的pair张量上只重算主链移动过的残基所在的行和列（delta模式），
+代价从 O(L²) 降到约 O(k·L)，且未移动残基之间的元素与完整计算逐位相同；
+多个结构可以补齐成 (B, L, 3, 3) 的批次一次广播计算，padding位置按mask置零，各样本裁回自己的长度后分别保存
+"""
+
+import os
+
+import click
+import torch
+
+from esm_batching import make_token_batches
+from esm_engine import check_file_exists, save_tensor_atomic
+
+BACKBONE_ATOMS = ('N', 'CA', 'C')
+# 与GeoStab pair.py的pair.pt通道不同，另存为 pair_local.pt，与pair.pt并存而不覆盖它
+LOCAL_PAIR_NAME = 'pair_local.pt'
+PAIR_CHANNELS = ('cb_distance', 'sin_omega', 'cos_omega', 'sin_theta', 'cos_theta', 'sin_phi', 'cos_phi')
+# 主链原子位移超过该值（Å）的残基视为移动；PDB坐标精度为0.001Å，0表示任何变化都重算
+DELTA_TOLERANCE = 0.0
+# 移动残基占比超过该值时delta不再划算，直接完整计算
+DELTA_MAX_FRACTION = 0.5
+# delta结果与完整计算对比时允许的最大绝对误差
+CHECK_ATOL = 1e-5
+# 每批最多的残基对数（批大小 × 最长L²）；kernel受内存带宽限制，批次保持在缓存大小附近最快，
+# 长结构各自成批，主要是把大量短结构合并成一次调用
+DEFAULT_MAX_PAIRS = 1 << 15
+
+
+def read_backbone(pdb_file):
+    """
+    读取第一个MODEL中各残基的N/CA/C坐标
+    返回 (残基键列表[(链, 编号, 插入码)], float64张量 (L, 3, 3))；缺主链原子的残基被跳过
+    """
+    residues = {}
+    with open(pdb_file, 'r') as f:
+        for line in f:
+            if line.startswith('ENDMDL'):
+                break
+            if not line.startswith('ATOM  '):
+                continue
+            atom = line[12:16].strip()
+            if atom not in BACKBONE_ATOMS or line[16] not in (' ', 'A'):
+                continue
+            key = (line[21], int(line[22:26]), line[26])
+            atoms = residues.setdefault(key, {})
+            atoms.setdefault(atom, (float(line[30:38]), float(line[38:46]), float(line[46:54])))
+
+    keys = [key for key, atoms in residues.items() if len(atoms) == len(BACKBONE_ATOMS)]
+    coords = torch.tensor([[residues[key][atom] for atom in BACKBONE_ATOMS] for key in keys],
+                          dtype=torch.float64).reshape(-1, len(BACKBONE_ATOMS), 3)
+    return keys, coords
+
+
+def backbone_frames(coords):
+    """(..., L, 3, 3) 主链坐标 → N、CA、C 和理想几何补全的CB，各为 (..., L, 3)"""
+    n, ca, c = coords[..., 0, :], coords[..., 1, :], coords[..., 2, :]
+    b = ca - n
+    c_vec = c - ca
+    a = torch.cross(b, c_vec, dim=-1)
+    cb = -0.58273431 * a + 0.56802827 * b - 0.54067466 * c_vec + ca
+    return n, ca, c, cb
+
+
+def residue_vectors(coords):
+    """
+    只与单个残基有关的向量（O(L)）：CB，a = CA-CB，θ二面角在残基i处的正交基 v（垂直于CB-CA）和 u = n̂×v，
+    以及ω二面角三重积展开用的 q = a×CB
+    """
+    n, ca, _, cb = backbone_frames(coords)
+    a = ca - cb
+    axis = -a / torch.linalg.norm(a, dim=-1, keepdim=True).clamp_min(1e-12)
+    b0 = n - ca
+    v = b0 - (b0 * axis).sum(-1, keepdim=True) * axis
+    u = torch.cross(axis, v, dim=-1)
+    q = torch.cross(a, cb, dim=-1)
+    return cb, a, v, u, q
+
+
+def pair_dot(x_i, y_j):
+    """(..., k, 3) 与 (..., m, 3) 的两两点积 (..., k, m)；逐分量广播相加，与块的形状无关，结果逐位确定"""
+    x_i = x_i[..., :, None, :]
+    y_j = y_j[..., None, :, :]
+    return x_i[..., 0] * y_j[..., 0] + x_i[..., 1] * y_j[..., 1] + x_i[..., 2] * y_j[..., 2]
+
+
+def sin_cos(y, x):
+    """atan2(y, x) 的sin和cos（不经过三角函数），y = x = 0 时取角度0"""
+    r = torch.sqrt(x * x + y * y)
+    nonzero = r > 0
+    safe_r = torch.where(nonzero, r, torch.ones_like(r))
+    return torch.where(nonzero, y / safe_r, torch.zeros_like(r)), torch.where(nonzero, x / safe_r, torch.ones_like(r))
+
+
+def pair_block(rows, cols):
+    """
+    rows中每个残基对cols中每个残基的特征，rows/cols 为 (..., k, 3, 3) / (..., m, 3, 3) 主链坐标，返回 (..., k, m, 7)
+    每个元素只由两端残基的坐标决定，所以任意行/列子块、批次中的任意样本都与单独完整计算的对应元素一致
+
+    角度全部写成残基向量与 d = CB_j - CB_i 的点积，只有 (k, m) 的标量中间量，不展开 (k, m, 3) 的向量：
+    θ_ij = atan2(u_i·d, v_i·d)；φ_ij 的cos项为 a_i·d，sin项为 |a_i×d|；
+    ω_ij 的 y = d·(a_i×a_j)/|d| = (a_i·q'_j + q_i·a_j)/|d|（q' = a×CB 在j侧），x = a_i·a_j - (a_i·d)(a_j·d)/|d|²，
+    两者同乘 |d|² 后角度不变
+    """
+    cb_i, a_i, v_i, u_i, q_i = residue_vectors(rows)
+    cb_j, a_j, _, _, q_j = residue_vectors(cols)
+
+    d = [cb_j[..., None, :, c] - cb_i[..., :, None, c] for c in range(3)]
+    dist_sq = d[0] * d[0] + d[1] * d[1] + d[2] * d[2]
+    distance = torch.sqrt(dist_sq)
+
+    def dot_d(x, side):
+        x = x[..., :, None, :] if side == 'i' else x[..., None, :, :]
+        return d[0] * x[..., 0] + d[1] * x[..., 1] + d[2] * x[..., 2]
+
+    sin_theta, cos_theta = sin_cos(dot_d(u_i, 'i'), dot_d(v_i, 'i'))
+
+    a_i_d = dot_d(a_i, 'i')
+    a_i_sq = (a_i * a_i).sum(-1)[..., :, None]
+    sin_phi, cos_phi = sin_cos(torch.sqrt((a_i_sq * dist_sq - a_i_d * a_i_d).clamp_min(0.0)), a_i_d)
+
+    omega_y = (pair_dot(a_i, q_j) + pair_dot(q_i, a_j)) * distance
+    omega_x = pair_dot(a_i, a_j) * dist_sq - a_i_d * dot_d(a_j, 'j')
+    sin_omega, cos_omega = sin_cos(omega_y, omega_x)
+
+    features = torch.stack([distance, sin_omega, cos_omega, sin_theta, cos_theta, sin_phi, cos_phi], dim=-1)
+    return features.float()
+
+
+def compute_pair_features(coords):
+    """完整的 L×L×7 pair张量"""
+    return pair_block(coords, coords)
+
+
+def stack_backbones(coord_list):
+    """把多个 (L_i, 3, 3) 主链坐标补零对齐成 (B, L_max, 3, 3)，返回 (坐标, 残基mask (B, L_max))"""
+    max_length = max(coords.shape[0] for coords in coord_list)
+    stacked = torch.zeros((len(coord_list), max_length, len(BACKBONE_ATOMS), 3), dtype=torch.float64)
+    mask = torch.zeros((len(coord_list), max_length), dtype=torch.bool)
+    for index, coords in enumerate(coord_list):
+        stacked[index, :coords.shape[0]] = coords
+        mask[index, :coords.shape[0]] = True
+    return stacked, mask
+
+
+def compute_pair_features_batched(coords, mask):
+    """(B, L, 3, 3) 补齐的主链坐标一次算出 (B, L, L, 7)；任一端为padding的残基对置零"""
+    pair = pair_block(coords, coords)
+    pair_mask = mask[:, :, None] & mask[:, None, :]
+    return pair.masked_fill(~pair_mask[..., None], 0.0)
+
+
+def write_pair_features_batched(jobs, max_pairs=DEFAULT_MAX_PAIRS, max_batch_size=None):
+    """
+    批量生成pair_local.pt：jobs 为 [(pdb_file, out_file)]，按长度分桶组批（每批 批大小 × 最长L² 不超过max_pairs）
+    逐个yield (pdb_file, out_file, 'generated' / 'failed', 残基数或错误信息)
+    """
+    items = []
+    for pdb_file, out_file in jobs:
+        try:
+            keys, coords = read_backbone(pdb_file)
+        except (OSError, ValueError) as e:
+            yield pdb_file, out_file, 'failed', f"读取PDB出错: {e}"
+            continue
+        if len(keys) == 0:
+            yield pdb_file, out_file, 'failed', "没有完整主链的残基"
+            continue
+        items.append((pdb_file, out_file, coords))
+
+    batches = make_token_batches(items, max_pairs, length_fn=lambda item: item[2].shape[0] ** 2,
+                                 max_batch_size=max_batch_size, special_tokens=0)
+    for batch in batches:
+        coords, mask = stack_backbones([item[2] for item in batch])
+        pair = compute_pair_features_batched(coords, mask)
+        for index, (pdb_file, out_file, sample_coords) in enumerate(batch):
+            length = sample_coords.shape[0]
+            try:
+                # clone：否则torch.save会把整个批次的存储一起写进每个文件
+                save_tensor_atomic(pair[index, :length, :length].clone(), out_file)
+                yield pdb_file, out_file, 'generated', length
+            except OSError as e:
+                yield pdb_file, out_file, 'failed', f"保存{LOCAL_PAIR_NAME}出错: {e}"
+
+
+def moved_residues(wt_coords, mut_coords, tolerance=DELTA_TOLERANCE):
+    """主链原子最大位移超过tolerance的残基下标"""
+    displacement = torch.linalg.norm(mut_coords - wt_coords, dim=-1).amax(dim=-1)
+    return torch.nonzero(displacement > tolerance).flatten()
+
+
+def update_pair_features(wt_pair, wt_coords, mut_coords, tolerance=DELTA_TOLERANCE, max_fraction=DELTA_MAX_FRACTION):
+    """
+    在WT的pair张量上只重算移动残基的行和列，返回 (pair张量, 重算的残基数)
+    移动残基过多时退回完整计算（此时重算数为L）
+    """
+    length = mut_coords.shape[0]
+    moved = moved_residues(wt_coords, mut_coords, tolerance)
+    if len(moved) > max_fraction * length:
+        return compute_pair_features(mut_coords), length
+
+    pair = wt_pair.clone()
+    if len(moved):
+        sub = mut_coords[moved]
+        pair[moved, :] = pair_block(sub, mut_coords)
+        pair[:, moved] = pair_block(mut_coords, sub)
+    return pair, len(moved)
+
+
+def write_pair_features(pdb_file, out_file, wt_pdb_file=None, wt_pair_file=None, tolerance=DELTA_TOLERANCE):
+    """
+    由PDB生成pair_local.pt；给出WT的PDB和pair_local.pt且残基一一对应时走delta模式
+    返回重算的残基数（完整计算时为L）
+    """
+    keys, coords = read_backbone(pdb_file)
+    if len(keys) == 0:
+        raise ValueError(f"{pdb_file} 中没有完整主链的残基")
+
+    pair, recomputed = None, len(keys)
+    if wt_pdb_file and wt_pair_file and check_file_exists(wt_pdb_file) and check_file_exists(wt_pair_file):
+        wt_keys, wt_coords = read_backbone(wt_pdb_file)
+        wt_pair = torch.load(wt_pair_file)
+        if wt_keys == keys and tuple(wt_pair.shape) == (len(keys), len(keys), len(PAIR_CHANNELS)):
+            pair, recomputed = update_pair_features(wt_pair, wt_coords, coords, tolerance)
+    if pair is None:
+        pair = compute_pair_features(coords)
+    save_tensor_atomic(pair, out_file)
+    return recomputed
+
+
+def check_against_full(pair, pdb_file, atol=CHECK_ATOL):
+    """与完整计算对比，返回 (是否逐位相同, 最大绝对误差, 是否在atol内)"""
+    _, coords = read_backbone(pdb_file)
+    full = compute_pair_features(coords)
+    max_error = (pair - full).abs().max().item() if pair.numel() else 0.0
+    return torch.equal(pair, full), max_error, max_error <= atol
+
+
+@click.command()
+@click.option("--pdb_file", required=True, type=str, multiple=True, help="输入PDB（可重复，多个时批量计算）")
+@click.option("--saved_folder", required=True, type=str, multiple=True, help=f"{LOCAL_PAIR_NAME}输出目录，与--pdb_file一一对应")
+@click.option("--wt_pdb_file", default=None, type=str, help="WT的PDB（给出时走delta模式）")
+@click.option("--wt_pair_file", default=None, type=str, help=f"WT的{LOCAL_PAIR_NAME}（本模块生成）")
+@click.option("--tolerance", default=DELTA_TOLERANCE, type=float, help="判定残基移动的主链位移阈值（Å）")
+@click.option("--check", is_flag=True, help="再做一次完整计算并报告与delta结果的差异")
+@click.option("--max_pairs", default=DEFAULT_MAX_PAIRS, type=int, help="批量模式每批最多的残基对数")
+def main(pdb_file, saved_folder, wt_pdb_file, wt_pair_file, tolerance, check, max_pairs):
+    """
+    由PDB主链计算trRosetta式pair特征（L×L×7，实验性，不替代GeoStab的pair.pt）
+
+    使用方法：
+    python pair_features.py --pdb_file wt_data/relaxed.pdb --saved_folder wt_data
+    python pair_features.py --pdb_file mut_data/relaxed_repair.pdb --saved_folder mut_data --wt_pdb_file wt_data/relaxed.pdb --wt_pair_file wt_data/pair_local.pt --check
+    python pair_features.py --pdb_file a/relaxed.pdb --saved_folder a --pdb_file b/relaxed.pdb --saved_folder b
+    """
+    if len(pdb_file) != len(saved_folder):
+        raise click.BadParameter("--pdb_file 与 --saved_folder 的个数必须相同")
+    if len(pdb_file) > 1:
+        jobs = [(pdb, os.path.join(folder, LOCAL_PAIR_NAME)) for pdb, folder in zip(pdb_file, saved_folder)]
+        for pdb, out_file, status, detail in write_pair_features_batched(jobs, max_pairs):
+            if status == 'generated':
+                print(f"✅ {out_file}: L={detail}")
+            else:
+                print(f"❌ {pdb}: {detail}")
+        return
+
+    pdb_file, saved_folder = pdb_file[0], saved_folder[0]
+    out_file = os.path.join(saved_folder, LOCAL_PAIR_NAME)
+    recomputed = write_pair_features(pdb_file, out_file, wt_pdb_file, wt_pair_file, tolerance)
+    pair = torch.load(out_file)
+    print(f"✅ {out_file}: L={pair.shape[0]}，重算 {recomputed} 个残基")
+    if check:
+        exact, max_error, within = check_against_full(pair, pdb_file)
+        status = "逐位相同" if exact else ("在容差内" if within else "超出容差")
+        print(f"{'✅' if within else '❌'} 与完整计算对比: {status}，最大绝对误差 {max_error:.3e}")
+
+
+if __name__ == "__main__":
+    main()
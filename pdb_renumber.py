@@ -0,0 +1,135 @@
+"""
+进程内的PDB残基重新编号
+替代每个样本两次 `python tools/pdb_utils.py <pdb> <pdb> 0` 子进程：逐行流式处理ATOM/HETATM记录，不建立结构对象，
+每条链的残基按出现顺序从start开始连续编号并清除插入码；
+写入头部标记，已编号的文件直接跳过（幂等），通过同目录临时文件原子替换，可在进程池中并发调用
+
+原地编号会改变文件内容（也就改变了RepairPDB缓存和FoldX分组用的内容哈希），而individual_list.txt中的突变行
+用的是原始PDB编号；keep_original=True 时编号前先把原始结构保存为 <名>.original.pdb，
+FoldX的输入和缓存键都取 source_pdb() 返回的原始结构，重跑时仍与突变行的编号一致
+"""
+
+import os
+import tempfile
+
+import click
+
+RENUMBER_MARKER = "REMARK 999 RENUMBERED"
+# 残基序号所在的记录类型（PDB固定列格式：链 22列，残基序号 23-26列，插入码 27列）
+RESIDUE_RECORDS = ("ATOM  ", "HETATM", "ANISOU", "TER   ")
+ORIGINAL_SUFFIX = ".original"
+
+
+def marker_line(start=1):
+    return f"{RENUMBER_MARKER} START={start}".ljust(80) + "\n"
+
+
+def is_renumbered(pdb_file, start=1):
+    """文件开头（REMARK区之前）是否已有对应起始编号的标记"""
+    expected = marker_line(start).rstrip()
+    with open(pdb_file, 'r') as f:
+        for line in f:
+            if line.rstrip() == expected:
+                return True
+            if line.startswith(RESIDUE_RECORDS):
+                return False
+    return False
+
+
+def renumber_lines(lines, start=1):
+    """逐行重新编号，产出新行；首行写入标记，已有的旧标记丢弃"""
+    yield marker_line(start)
+    next_number = {}
+    residue_map = {}
+    for line in lines:
+        if line.startswith(RENUMBER_MARKER):
+            continue
+        body = line.rstrip('\n')
+        if not line.startswith(RESIDUE_RECORDS) or len(body) < 26:
+            yield line
+            continue
+
+        # 简写的TER行可能没有插入码列
+        body = body.ljust(27)
+        chain = body[21]
+        key = (chain, body[22:26], body[26])
+        if key not in residue_map:
+            if line.startswith("TER"):
+                # TER只沿用已出现残基的编号
+                yield line
+                continue
+            residue_map[key] = next_number.get(chain, start)
+            next_number[chain] = residue_map[key] + 1
+        yield f"{body[:22]}{residue_map[key]:>4} {body[27:]}" + line[len(line.rstrip('\n')):]
+
+
+def original_pdb_path(pdb_file):
+    """原地编号前保存的原始结构：relaxed.pdb -> relaxed.original.pdb"""
+    root, ext = os.path.splitext(str(pdb_file))
+    return f"{root}{ORIGINAL_SUFFIX}{ext}"
+
+
+def source_pdb(pdb_file, start=1):
+    """
+    编号前的原始结构：未编号时就是文件本身；已编号时为保存的原始副本；已编号又没有副本时返回None
+    """
+    if not is_renumbered(pdb_file, start):
+        return str(pdb_file)
+    original = original_pdb_path(pdb_file)
+    return original if os.path.exists(original) else None
+
+
+def renumber_pdb(in_file, out_file=None, start=1, keep_original=False):
+    """
+    重新编号残基序号，out_file为None时原地修改
+    已带标记时不重写（输入输出相同则直接返回，否则复制），返回是否实际重新编号
+    keep_original 时原地编号前把原始内容保存到 original_pdb_path(in_file)
+    """
+    out_file = str(out_file or in_file)
+    in_place = os.path.abspath(out_file) == os.path.abspath(str(in_file))
+    if is_renumbered(in_file, start):
+        if not in_place:
+            with open(in_file, 'r') as f:
+                _write_atomic(out_file, f)
+        return False
+    if in_place and keep_original:
+        # 未编号的文件就是原始结构，覆盖可能过期的旧副本
+        with open(in_file, 'r') as f:
+            _write_atomic(original_pdb_path(in_file), f)
+    with open(in_file, 'r') as f:
+        _write_atomic(out_file, renumber_lines(f, start))
+    return True
+
+
+def _write_atomic(out_file, lines):
+    out_dir = os.path.dirname(out_file) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.pdb', dir=out_dir)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, out_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@click.command()
+@click.argument("in_file", type=str)
+@click.argument("out_file", type=str)
+@click.option("--start", default=1, type=int, help="每条链的起始残基编号")
+def main(in_file, out_file, start):
+    """
+    重新编号PDB残基序号
+
+    使用方法：
+    python pdb_renumber.py relaxed.pdb relaxed.pdb
+    """
+    if renumber_pdb(in_file, out_file, start):
+        print(f"✅ 重新编号完成: {out_file}")
+    else:
+        print(f"⏭️  已编号，跳过: {in_file}")
+
+
+if __name__ == "__main__":
+    main()
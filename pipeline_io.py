@@ -0,0 +1,30 @@
+"""
+流程脚本共用的小工具：输出文件检查、从数据集CSV读取样本名称
+不依赖torch，FoldX相关脚本也可以直接导入
+"""
+
+import csv
+import os
+
+
+def check_file_exists(file_path, min_size=1):
+    """检查文件是否存在且大小大于min_size字节"""
+    return os.path.exists(file_path) and os.path.getsize(file_path) > min_size
+
+
+def load_names_from_csv(csv_file):
+    """从CSV文件加载蛋白质名称"""
+    names = []
+    try:
+        with open(csv_file, 'r', newline='') as f:
+            rows = list(csv.reader(f))
+
+        # 跳过标题行，提取第一列（name列）；按CSV规则解析，带引号的name中可以有逗号
+        for row in rows[1:]:
+            if row and row[0].strip():
+                names.append(row[0].strip())
+
+        return names
+    except Exception as e:
+        print(f"❌ 读取CSV文件失败: {e}")
+        return []
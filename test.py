@@ -65,129 +65,50 @@ for name in tqdm(names, desc="生成特征"):
 
 # %%
 import os, torch
-from Bio import SeqIO
-from transformers import AutoTokenizer, EsmForMaskedLM
 from tqdm import tqdm
-import re
-import shutil
-
-HF_MODEL_DIR = "/home/corp/xingqiao.lin/.cache/huggingface/hub/facebook/esm1v_t33_650M_UR90S_1"
 
-# 使用PyTorch格式加载模型（不使用safetensors）
-tok = AutoTokenizer.from_pretrained(HF_MODEL_DIR, use_fast=False, local_files_only=True)
-model = EsmForMaskedLM.from_pretrained(
-    HF_MODEL_DIR, 
-    local_files_only=True,
-    use_safetensors=False  # 明确指定不使用safetensors
-).eval().to("cpu")
-
-def extract_pdb_id(clean_name):
-    """从clean_name中提取PDB ID"""
-    # 匹配 rcsb_1ABC_A_... 格式
-    match = re.match(r'rcsb_([A-Z0-9]+)_', clean_name)
-    if match:
-        return match.group(1)
-    return None
-
-def find_same_pdb_variants(pdb_id, all_names):
-    """找到所有相同PDB ID的变体"""
-    variants = []
-    for name in all_names:
-        clean_name = name.replace(' ', '_')
-        if clean_name.startswith(f'rcsb_{pdb_id}_'):
-            variants.append(clean_name)
-    return variants
-
-# 统计信息
-processed_pdb_ids = set()
-skipped_count = 0
-copied_count = 0
-generated_count = 0
+from embedding_store import EMBEDDING_STORE_DIR, EmbeddingStore, embed_into_store
+from esm_batching import BatchStats
+from esm_engine import get_hf_esm_engine
+from esm_shared_pool import SharedModelPool
 
-for name in tqdm(names, desc="生成特征"):
+HF_MODEL_DIR = "/home/corp/xingqiao.lin/.cache/huggingface/hub/facebook/esm1v_t33_650M_UR90S_1"
+ESM1V_MAX_TOKENS = 4096  # 每批最多token数（含padding）
+ESM1V_NUM_WORKERS = 1    # 大于1时权重放入共享内存，多个CPU进程并行推理（进程数 × 线程数 ≈ 核心数）
+ESM1V_BACKEND = "fp32"   # "fp32" / "bf16" / "int8" / "compile"，见 esm_backend_benchmark.py
+
+# 使用PyTorch格式加载模型（不使用safetensors），整个cell只加载一次
+engine = get_hf_esm_engine(HF_MODEL_DIR, output_name="esm1v-1.pt", backend=ESM1V_BACKEND)
+if ESM1V_NUM_WORKERS > 1:
+    engine = SharedModelPool(engine, ESM1V_NUM_WORKERS)
+# 按序列内容寻址：相同WT序列只推理一次，各wt_data目录中的esm1v-1.pt硬链接到存储
+store = EmbeddingStore(EMBEDDING_STORE_DIR)
+
+work_items = []
+for name in names:
     clean_name = name.replace(' ', '_')
     wt_fasta_path = f'/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train/{clean_name}/wt_data'
-    seq_path = f'{wt_fasta_path}/result.fasta'
-    
-    # 检查文件是否存在
-    if not os.path.exists(seq_path):
-        print(f"⚠️ 跳过 {name}: FASTA文件不存在")
-        continue
-    
-    # 提取PDB ID
-    pdb_id = extract_pdb_id(clean_name)
-    if not pdb_id:
-        print(f"⚠️ 跳过 {name}: 无法提取PDB ID")
-        continue
-    
-    out_path = os.path.join(wt_fasta_path, "esm1v-1.pt")
-    
-    # 检查是否已经生成
-    if os.path.exists(out_path):
-        print(f"⏭️ {name}: esm1v-1.pt 已存在，跳过")
-        continue
-    
-    # 检查是否已经处理过这个PDB ID
-    if pdb_id in processed_pdb_ids:
-        print(f"⏭️ {name}: PDB ID {pdb_id} 已处理过，跳过")
-        continue
-    
-    try:
-        # 生成特征
-        seq = str(next(SeqIO.parse(seq_path, "fasta")).seq)
-        inputs = tok(seq, return_tensors="pt", add_special_tokens=True)
-        with torch.no_grad():
-            out = model(**inputs, output_hidden_states=True)
-            reps = out.hidden_states[-1][0, 1:-1, :].cpu().clone()
-        
-        # 保存到当前目录
-        torch.save(reps, out_path)
-        print(f"✅ 生成 {name}: {out_path}, shape={tuple(reps.shape)}")
-        generated_count += 1
-        
-        # 标记这个PDB ID已处理
-        processed_pdb_ids.add(pdb_id)
-        
-        # 找到所有相同PDB ID的变体
-        same_pdb_variants = find_same_pdb_variants(pdb_id, names)
-        
-        # 复制到所有相同PDB ID的目录
-        for variant in same_pdb_variants:
-            if variant == clean_name:
-                continue  # 跳过自己
-            
-            variant_wt_path = f'/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train/{variant}/wt_data'
-            variant_out_path = os.path.join(variant_wt_path, "esm1v-1.pt")
-            
-            # 检查目标目录是否存在
-            if not os.path.exists(variant_wt_path):
-                print(f"⚠️ 跳过 {variant}: 目标目录不存在")
-                continue
-            
-            # 检查目标文件是否已存在
-            if os.path.exists(variant_out_path):
-                print(f"⏭️ {variant}: esm1v-1.pt 已存在，跳过复制")
-                continue
-            
-            try:
-                # 复制特征文件
-                shutil.copy2(out_path, variant_out_path)
-                print(f"📋 复制 {pdb_id} 特征到 {variant}")
-                copied_count += 1
-            except Exception as e:
-                print(f"❌ 复制到 {variant} 失败: {e}")
-        
-        print(f"🎯 PDB {pdb_id}: 生成了1个，复制了{len(same_pdb_variants)-1}个变体")
-        
-    except Exception as e:
-        print(f"❌ {name}: 处理失败 - {e}")
+    work_items.append((name, f'{wt_fasta_path}/result.fasta'))
+
+# 统计信息
+status_counts = {'generated': 0, 'linked': 0, 'skipped': 0, 'failed': 0}
+batch_stats = BatchStats()
+results = embed_into_store(engine, work_items, store, max_tokens=ESM1V_MAX_TOKENS, stats=batch_stats)
+for name, status, message in tqdm(results, total=len(work_items), desc="生成特征"):
+    status_counts[status] += 1
+    if status == 'generated':
+        print(f"✅ 生成 {name}: {message}")
+    elif status == 'failed':
+        print(f"❌ {name}: 处理失败 - {message}")
+engine.close()
 
 # 输出统计信息
 print(f"\n📊 处理完成统计:")
-print(f"✅ 生成特征: {generated_count}")
-print(f"📋 复制特征: {copied_count}")
-print(f"⏭️ 跳过: {skipped_count}")
-print(f"🎯 处理的PDB ID数: {len(processed_pdb_ids)}")
+print(f"✅ 生成特征: {status_counts['generated']}")
+print(f"🔗 链接特征: {status_counts['linked']}")
+print(f"⏭️ 跳过: {status_counts['skipped']}")
+print(f"❌ 失败: {status_counts['failed']}")
+batch_stats.report("ESM-1v ")
 
 
 #生成ESM-1V-1特征
@@ -207,17 +128,9 @@ for name in names:
         os.mkdir(f'/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train/{name}/wt_data')
     if not os.path.exists(f'/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train/{name}/mut_data'):
         os.mkdir(f'/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train/{name}/mut_data')
-import subprocess
-for name in names:  # 只处理前5个
-    clean_name = name.replace(' ', '_')
-    wt_fasta_path = f'/home/corp/xingqiao.lin/code/GeoStab/data/ddG_train/{clean_name}/wt_data'
-    
-    # 生成fixed_embedding
-    if not os.path.exists(f'{wt_fasta_path}/esm1v-1.pt'):
-        cmd = f"python /home/corp/xingqiao.lin/code/GeoStab/generate_features/esm1v_logits.py --model_index 1 --fasta_file {wt_fasta_path}/result.fasta --saved_folder {wt_fasta_path}"
-        subprocess.run(cmd, shell=True)
-    
-    print(f"✅ {name} 特征生成完成")
+# 模型只加载一次，流式处理全部WT序列（替代每个样本启动一次esm1v_logits.py）
+from esm1v_ensemble import run_esm1v_ensemble
+run_esm1v_ensemble(names, model_indices=(1,), sides=('wt',))
 
 # %%
 #!/usr/bin/env bash
@@ -446,44 +359,22 @@ def main():
 main()
 
 ESM-1V 1-5 特征生成
-import os, torch
-from Bio import SeqIO
-from transformers import AutoTokenizer, EsmForMaskedLM
-
-# ===== 配置 =====
-BASE_DIR = "/home/corp/xingqiao.lin/.cache/huggingface/hub/facebook"
-MODEL_PREFIX = "esm1v_t33_650M_UR90S_"  # _1 … _5
-FASTA = "/path/to/protein.fasta"
-SAVE  = "/path/to/save"
-DEVICE = "cpu"   # 或 "cuda"
-os.makedirs(SAVE, exist_ok=True)
-
-# 读第一条序列
-seq = str(next(SeqIO.parse(FASTA, "fasta")).seq)
-
-# tokenizer 各模型相同，只需加载一次
-tok_dir = os.path.join(BASE_DIR, f"{MODEL_PREFIX}1")
-tokenizer = AutoTokenizer.from_pretrained(tok_dir, use_fast=False, local_files_only=True)
-
-# 分词（自动加 <cls> 与 </s>）
-inputs = tokenizer(seq, return_tensors="pt", add_special_tokens=True)
-inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
+# 交换循环顺序：模型i只加载一次，全部WT/mut序列流过后释放，再加载模型i+1（峰值内存只有一个模型）
+# 结果写入内容寻址存储并链接到各样本目录，中断后重跑会跳过已完成的模型和序列
+from esm1v_ensemble import run_esm1v_ensemble
 
-for i in range(1, 6):
-    model_dir = os.path.join(BASE_DIR, f"{MODEL_PREFIX}{i}")
-    print(f"Loading model {i} from: {model_dir}")
-
-    model = EsmForMaskedLM.from_pretrained(model_dir, local_files_only=True).eval().to(DEVICE)
+DEVICE = "cpu"   # 或 "cuda"
+BACKEND = "fp32" # "fp32" / "bf16" / "int8" / "compile"
+summary = run_esm1v_ensemble(names, model_indices=(1, 2, 3, 4, 5), sides=('wt', 'mut'), device=DEVICE, backend=BACKEND)
 
-    with torch.no_grad():
-        out  = model(**inputs, output_hidden_states=True)
-        last = out.hidden_states[-1]          # [1, L+2, 1280]
-        reps = last[0, 1:-1, :].detach()      # 去掉 <cls>, </s> → [L, 1280]
-        reps_cpu = reps.to("cpu").clone()
+# %%
+# ESM-1v零样本打分：每个唯一WT序列只前向一次（masked-marginal 为每个突变位点一次），
+# 对每个突变输出 log p(mut) − log p(wt)，整个CSV写成一张表
+from esm1v_zero_shot import run_zero_shot, save_table
 
-    out_path = os.path.join(SAVE, f"esm1v-{i}.pt")
-    torch.save(reps_cpu, out_path)
-    print(f"✅ saved: {out_path}  shape={tuple(reps_cpu.shape)}")
+zero_shot = run_zero_shot(train, model_indices=(1, 2, 3, 4, 5), mode='wt-marginal', device=DEVICE, backend=BACKEND)
+save_table(zero_shot, "/home/corp/xingqiao.lin/code/GeoStab/data/ddG/S8754_esm1v_zero_shot.csv")
+zero_shot
 
 
 # %%
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO_DIR, os.path.join(REPO_DIR, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def fake_foldx(tmp_path, monkeypatch):
+    """装在 tmp_path 下、不睡眠的FoldX替身，返回可执行文件路径"""
+    from fake_foldx import LATENCY_ENV, install_fake_foldx
+    monkeypatch.setenv(LATENCY_ENV, "0")
+    return install_fake_foldx(str(tmp_path / "geostab"))
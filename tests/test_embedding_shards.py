@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from embedding_shards import ShardReader, ShardWriter, convert_pt_tree, sample_feature_name, shard_file
+
+
+def embedding(length, dim=4, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    return torch.randn(length, dim, generator=generator)
+
+
+def test_round_trip_float32(tmp_path):
+    tensors = {f"s{i}/wt": embedding(3 + i, seed=i) for i in range(4)}
+    with ShardWriter(str(tmp_path), dtype='float32') as writer:
+        for name, tensor in tensors.items():
+            writer.append(name, tensor)
+    reader = ShardReader(str(tmp_path))
+    assert len(reader) == len(tensors)
+    assert sorted(reader.names()) == sorted(tensors)
+    for name, tensor in tensors.items():
+        assert torch.equal(reader[name], tensor)
+
+
+def test_round_trip_float16(tmp_path):
+    tensor = embedding(5)
+    with ShardWriter(str(tmp_path)) as writer:
+        writer.append("a/wt", tensor)
+    view = ShardReader(str(tmp_path)).get("a/wt")
+    assert view.dtype == torch.float16
+    assert torch.equal(view, tensor.half())
+
+
+def test_reopen_appends_and_rolls_over(tmp_path):
+    tensor = embedding(4)
+    # 每个张量64字节（float32），每个分片只放得下一个
+    with ShardWriter(str(tmp_path), dtype='float32', max_shard_bytes=64) as writer:
+        writer.append("a/wt", tensor)
+        writer.append("b/wt", tensor * 2)
+    with ShardWriter(str(tmp_path), dtype='float32', max_shard_bytes=64) as writer:
+        assert "a/wt" in writer
+        writer.append("c/wt", tensor * 3)
+    reader = ShardReader(str(tmp_path))
+    assert [reader.index[name]['shard'] for name in ("a/wt", "b/wt", "c/wt")] == [0, 1, 2]
+    assert os.path.exists(shard_file(str(tmp_path), 2))
+    for scale, name in enumerate(("a/wt", "b/wt", "c/wt"), start=1):
+        assert torch.equal(reader[name], tensor * scale)
+
+
+def test_same_key_is_stored_once(tmp_path):
+    tensor = embedding(6)
+    with ShardWriter(str(tmp_path), dtype='float32') as writer:
+        first = writer.append("a/wt", tensor, key="k")
+        second = writer.append("b/wt", None, key="k")
+    assert (second['shard'], second['offset']) == (first['shard'], first['offset'])
+    assert os.path.getsize(shard_file(str(tmp_path), 0)) == tensor.numel() * 4
+    reader = ShardReader(str(tmp_path))
+    assert torch.equal(reader["b/wt"], tensor)
+
+
+def test_dtype_mismatch_and_interrupted_index(tmp_path):
+    with ShardWriter(str(tmp_path), dtype='float32') as writer:
+        writer.append("a/wt", embedding(2))
+    with pytest.raises(ValueError):
+        ShardWriter(str(tmp_path), dtype='float16')
+    # 写到一半被中断的最后一行被忽略
+    with open(tmp_path / "index.jsonl", 'a') as f:
+        f.write('{"name": "b/wt", "sha')
+    assert ShardReader(str(tmp_path)).names() == ["a/wt"]
+
+
+def test_convert_pt_tree_skips_existing(tmp_path):
+    data_dir, shard_dir = tmp_path / "data", str(tmp_path / "shards")
+    for index, name in enumerate(("rcsb_1A0N_B_I121L_7_25", "rcsb_1A0N_B_K130A_7_25")):
+        for side in ("wt", "mut"):
+            (data_dir / name / f"{side}_data").mkdir(parents=True)
+            torch.save(embedding(3, seed=index), data_dir / name / f"{side}_data" / "esm2.pt")
+    os.remove(data_dir / "rcsb_1A0N_B_K130A_7_25" / "mut_data" / "esm2.pt")
+
+    assert convert_pt_tree(str(data_dir), shard_dir, dtype='float32') == (3, 0, 1, 0)
+    assert convert_pt_tree(str(data_dir), shard_dir, dtype='float32') == (0, 3, 1, 0)
+    reader = ShardReader(shard_dir)
+    assert torch.equal(reader[sample_feature_name("rcsb_1A0N_B_K130A_7_25", "wt")], embedding(3, seed=1))
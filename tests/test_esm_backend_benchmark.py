@@ -0,0 +1,40 @@
+import random
+
+import pandas as pd
+import pytest
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+@pytest.fixture(scope="module")
+def tiny_hf_dir(tmp_path_factory):
+    pytest.importorskip("esm")
+    pytest.importorskip("transformers")
+    from tiny_esm import write_tiny_hf_esm
+
+    return write_tiny_hf_esm(str(tmp_path_factory.mktemp("tiny_esm1v")))
+
+
+def mutation_table(num_rows=6, length=30, seed=0):
+    rng = random.Random(seed)
+    wt_seq = ''.join(rng.choice(AMINO_ACIDS) for _ in range(length))
+    records = []
+    for position in rng.sample(range(1, length + 1), num_rows):
+        wt_aa = wt_seq[position - 1]
+        mut_aa = rng.choice([aa for aa in AMINO_ACIDS if aa != wt_aa])
+        records.append({'name': f"rcsb_9000_A_{wt_aa}{position}{mut_aa}_7_25", 'wt_seq': wt_seq,
+                        'mut_seq': wt_seq[:position - 1] + mut_aa + wt_seq[position:], 'ddG': rng.uniform(-2, 2)})
+    return pd.DataFrame(records)
+
+
+def test_benchmark_backends_scores_esm1v(tiny_hf_dir):
+    from esm_backend_benchmark import benchmark_backends
+
+    table = benchmark_backends("esm1v-1", ['fp32', 'int8'], mutation_table(), model_dir=tiny_hf_dir)
+    assert table['backend'].tolist() == ['fp32', 'int8']
+    assert 'error' not in table or table['error'].isna().all()
+    assert table['score_errors'].tolist() == [0, 0]
+    fp32 = table.iloc[0]
+    assert fp32['cosine_min'] == pytest.approx(1.0)
+    assert fp32['ddg_spearman_vs_fp32'] == pytest.approx(1.0)
+    assert table['ddg_spearman_vs_measured'].notna().all()
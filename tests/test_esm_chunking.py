@@ -0,0 +1,68 @@
+import random
+
+import pytest
+import torch
+
+from esm_chunking import STITCH_MODES, ChunkedEmbeddingEngine, blend_weights, chunk_spans, stitch_chunks
+
+WINDOW = 20
+OVERLAP = 6
+# ≤窗口、窗口+1、刚好多出一个重叠、多个窗口
+LENGTHS = (1, WINDOW - 1, WINDOW, WINDOW + 1, WINDOW + OVERLAP, 5 * WINDOW + 3)
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+@pytest.fixture(scope="module")
+def tiny_engine(tmp_path_factory):
+    pytest.importorskip("esm")
+    from esm_engine import Esm2EmbeddingEngine
+    from tiny_esm import write_tiny_esm2
+
+    model_path = write_tiny_esm2(str(tmp_path_factory.mktemp("tiny_esm")))
+    return Esm2EmbeddingEngine(model_path)
+
+
+def random_sequence(length, seed=0):
+    rng = random.Random(seed)
+    return ''.join(rng.choice(AMINO_ACIDS) for _ in range(length))
+
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_spans_cover_sequence(length):
+    spans = chunk_spans(length, WINDOW, OVERLAP)
+    assert spans[0][0] == 0
+    assert spans[-1][1] == length
+    assert all(end - start <= WINDOW for start, end in spans)
+    assert all(prev[1] > nxt[0] for prev, nxt in zip(spans, spans[1:]))
+
+
+@pytest.mark.parametrize("mode", STITCH_MODES)
+@pytest.mark.parametrize("length", LENGTHS)
+def test_stitch_preserves_length(mode, length):
+    spans = chunk_spans(length, WINDOW, OVERLAP)
+    chunks = [torch.randn(end - start, 8) for start, end in spans]
+    assert stitch_chunks(chunks, spans, length, mode).shape == (length, 8)
+
+
+@pytest.mark.parametrize("overlap", (1, OVERLAP, WINDOW // 2, WINDOW - 5, WINDOW - 1))
+@pytest.mark.parametrize("length", LENGTHS)
+def test_blend_weights_sum_to_one(length, overlap):
+    spans = chunk_spans(length, WINDOW, overlap)
+    total = torch.zeros(length)
+    for (start, end), weights in zip(spans, blend_weights(spans, length)):
+        total[start:end] += weights
+    assert torch.allclose(total, torch.ones(length), atol=1e-6)
+
+
+@pytest.mark.parametrize("mode", STITCH_MODES)
+def test_chunked_engine_preserves_length(tiny_engine, mode):
+    engine = ChunkedEmbeddingEngine(tiny_engine, WINDOW, OVERLAP, mode)
+    seqs = [random_sequence(length, seed=length) for length in LENGTHS]
+    for seq, reps in zip(seqs, engine.embed_batch(seqs)):
+        assert reps.shape[0] == len(seq)
+
+
+def test_chunked_engine_matches_plain_engine_within_window(tiny_engine):
+    engine = ChunkedEmbeddingEngine(tiny_engine, WINDOW, OVERLAP)
+    seq = random_sequence(WINDOW)
+    assert torch.equal(engine.embed_batch([seq])[0], tiny_engine.embed_batch([seq])[0])
@@ -0,0 +1,65 @@
+import pytest
+
+SEQS = ["MKTAYIAKQR", "GSHMLE"]
+
+
+@pytest.fixture(scope="module")
+def tiny_esm2_path(tmp_path_factory):
+    pytest.importorskip("esm")
+    from tiny_esm import write_tiny_esm2
+
+    return write_tiny_esm2(str(tmp_path_factory.mktemp("tiny_esm2")))
+
+
+@pytest.fixture(scope="module")
+def tiny_hf_dir(tmp_path_factory):
+    pytest.importorskip("esm")
+    pytest.importorskip("transformers")
+    from tiny_esm import write_tiny_hf_esm
+
+    return write_tiny_hf_esm(str(tmp_path_factory.mktemp("tiny_hf_esm")))
+
+
+def check_contacts(outputs):
+    for seq, item in zip(SEQS, outputs):
+        assert item['contacts'].shape == (len(seq), len(seq))
+        assert item['logits'].shape[0] == len(seq)
+
+
+@pytest.mark.parametrize("backend", ['fp32', 'int8'])
+def test_esm2_contacts(tiny_esm2_path, backend):
+    from esm_engine import Esm2EmbeddingEngine
+
+    engine = Esm2EmbeddingEngine(tiny_esm2_path, backend=backend)
+    check_contacts(engine.extract_batch(SEQS, logits=True, contacts=True))
+
+
+@pytest.mark.parametrize("backend", ['fp32', 'int8'])
+def test_hf_contacts(tiny_hf_dir, backend):
+    from esm_engine import HfEsmEmbeddingEngine
+
+    engine = HfEsmEmbeddingEngine(tiny_hf_dir, backend=backend)
+    check_contacts(engine.extract_batch(SEQS, logits=True, contacts=True))
+
+
+def test_hf_contacts_restore_attention(tiny_hf_dir):
+    from esm_engine import HfEsmEmbeddingEngine
+
+    engine = HfEsmEmbeddingEngine(tiny_hf_dir)
+    engine.model.set_attn_implementation('sdpa')
+    before = [reps.clone() for reps in engine.embed_batch(SEQS)]
+    engine.extract_batch(SEQS, contacts=True)
+    assert engine.model.config._attn_implementation == 'sdpa'
+    for reps, ref in zip(engine.embed_batch(SEQS), before):
+        assert (reps - ref).abs().max().item() < 1e-5
+
+
+def test_engine_without_extract_batch_fails_at_construction():
+    from esm_engine import _EmbeddingEngine
+
+    class EmbedOnly(_EmbeddingEngine):
+        def embed_batch(self, seqs):
+            return []
+
+    with pytest.raises(TypeError):
+        EmbedOnly()
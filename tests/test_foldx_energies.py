@@ -0,0 +1,73 @@
+import subprocess
+
+import pytest
+
+from fake_foldx import fake_energy
+from foldx_energies import (append_energy_rows, energy_rows, load_energy_table, parse_build_energies,
+                            select_run)
+from synthetic_data import backbone_pdb_lines
+
+STEM = "relaxed_Repair"
+LINES = ["KA2G;", "LA3P,VA4A;"]
+RUNS = 3
+
+
+@pytest.fixture
+def build_dir(tmp_path, fake_foldx):
+    """用FoldX替身跑一次BuildModel，返回输出目录"""
+    (tmp_path / f"{STEM}.pdb").write_text(''.join(backbone_pdb_lines("MKLVAGTEDR")))
+    mutant_file = tmp_path / "individual_list.txt"
+    mutant_file.write_text(''.join(f"{line}\n" for line in LINES))
+    subprocess.run([fake_foldx, "--command=BuildModel", f"--pdb={STEM}.pdb", f"--pdb-dir={tmp_path}",
+                    f"--output-dir={tmp_path}", f"--mutant-file={mutant_file}", f"--numberOfRuns={RUNS}"],
+                   check=True, capture_output=True)
+    return str(tmp_path)
+
+
+def lowest_run(line):
+    return min(range(RUNS), key=lambda run: (fake_energy(line, run), run))
+
+
+def test_parse_build_energies(build_dir):
+    energies = parse_build_energies(build_dir, STEM)
+    assert sorted(energies) == [(k, run) for k in (1, 2) for run in range(RUNS)]
+    for (k, run), terms in energies.items():
+        ddg = fake_energy(LINES[k - 1], run)
+        assert terms['dif_total_energy'] == pytest.approx(ddg, abs=1e-4)
+        assert terms['dif_van_der_waals'] == pytest.approx(ddg / 2, abs=1e-4)
+        assert terms['mut_total_energy'] == pytest.approx(ddg - 100, abs=1e-4)
+        assert terms['wt_total_energy'] == -100.0
+
+
+def test_parse_without_raw(build_dir, tmp_path):
+    (tmp_path / f"Raw_{STEM}.fxout").unlink()
+    energies = parse_build_energies(build_dir, STEM)
+    assert len(energies) == len(LINES) * RUNS
+    assert all('wt_total_energy' not in terms for terms in energies.values())
+
+
+def test_select_run(build_dir):
+    energies = parse_build_energies(build_dir, STEM)
+    for k, line in enumerate(LINES, start=1):
+        assert select_run(energies, k, 'first') == 0
+        assert select_run(energies, k, 'lowest') == lowest_run(line)
+    # 没有能量记录时退回第0次运行
+    assert select_run(energies, 9, 'lowest') == 0
+    with pytest.raises(ValueError):
+        select_run(energies, 1, 'median')
+
+
+def test_energy_table_round_trip(build_dir, tmp_path):
+    energies = parse_build_energies(build_dir, STEM)
+    energy_file = str(tmp_path / "energies" / "foldx_energies.csv")
+    selected = lowest_run(LINES[0])
+    rows = energy_rows("sample_a", LINES[0], 1, energies, selected)
+    assert [row['run'] for row in rows] == list(range(RUNS))
+    append_energy_rows(rows, energy_file)
+    # 重复写入同一样本时保留最后一次
+    append_energy_rows(rows, energy_file)
+    table = load_energy_table(energy_file)
+    assert len(table) == RUNS
+    assert table.loc[table['selected'], 'run'].tolist() == [selected]
+    assert load_energy_table(energy_file, selected_only=True)['dif_total_energy'].tolist() == \
+        [pytest.approx(fake_energy(LINES[0], selected), abs=1e-4)]
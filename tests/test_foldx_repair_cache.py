@@ -0,0 +1,68 @@
+import os
+import stat
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from fake_foldx import LATENCY_ENV
+from foldx_repair_cache import REPAIRED_NAME, RepairCache, file_sha256
+from synthetic_data import backbone_pdb_lines
+
+SEQ = "MKLVAGTEDR"
+
+
+@pytest.fixture
+def wt_pdb(tmp_path):
+    pdb_file = tmp_path / "relaxed.pdb"
+    pdb_file.write_text(''.join(backbone_pdb_lines(SEQ)))
+    return str(pdb_file)
+
+
+def cached_get(root, foldx_exe, pdb_file):
+    return RepairCache(root, foldx_exe).get(pdb_file)
+
+
+def test_miss_then_hit(tmp_path, fake_foldx, wt_pdb):
+    cache = RepairCache(tmp_path / "cache", fake_foldx)
+    assert cache.lookup(wt_pdb) is None
+    path, hit = cache.get(wt_pdb)
+    assert not hit
+    assert path == cache.path_for(file_sha256(wt_pdb))
+    assert os.path.basename(path) == REPAIRED_NAME
+    with open(path) as f:
+        assert "REPAIRED BY FAKE FOLDX" in f.read()
+    assert cache.lookup(wt_pdb) == path
+    # 内容相同、路径不同的PDB命中同一个条目
+    copy = tmp_path / "other" / "relaxed.pdb"
+    copy.parent.mkdir()
+    copy.write_text(open(wt_pdb).read())
+    assert cache.get(str(copy)) == (path, True)
+    # 修复用的临时目录不留在条目里
+    assert sorted(os.listdir(os.path.dirname(path))) == ['.lock', REPAIRED_NAME]
+
+
+def test_concurrent_get_repairs_once(tmp_path, fake_foldx, wt_pdb, monkeypatch):
+    # 让修复持续一段时间，其余进程都在等同一把锁
+    monkeypatch.setenv(LATENCY_ENV, "0.3")
+    root = str(tmp_path / "cache")
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(cached_get, [root] * 4, [fake_foldx] * 4, [wt_pdb] * 4))
+    assert len({path for path, _ in results}) == 1
+    assert sorted(hit for _, hit in results) == [False, True, True, True]
+
+
+def test_failed_repair_leaves_no_entry(tmp_path, fake_foldx, wt_pdb):
+    failing = tmp_path / "failing_foldx"
+    failing.write_text("#!/bin/sh\necho broken >&2\nexit 1\n")
+    failing.chmod(failing.stat().st_mode | stat.S_IXUSR)
+    root = tmp_path / "cache"
+    with pytest.raises(RuntimeError, match="broken"):
+        RepairCache(root, failing).get(wt_pdb)
+    cache = RepairCache(root, fake_foldx)
+    assert cache.lookup(wt_pdb) is None
+    assert cache.get(wt_pdb)[1] is False
+
+
+def test_miss_without_foldx(tmp_path, wt_pdb):
+    with pytest.raises(RuntimeError):
+        RepairCache(tmp_path / "cache").get(wt_pdb)
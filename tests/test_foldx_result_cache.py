@@ -0,0 +1,112 @@
+import fcntl
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from foldx_energies import parse_build_energies
+from foldx_result_cache import ResultCache, normalize_mutation_line
+from synthetic_data import backbone_pdb_lines
+
+STEM = "relaxed_Repair"
+REPAIRED_HASH = "ab" * 32
+RUNS = 2
+
+
+def build_model(fake_foldx, out_dir, line):
+    """用FoldX替身对一个突变行跑BuildModel，返回 ({run: 突变体PDB}, {run: 能量项})"""
+    os.makedirs(out_dir)
+    with open(os.path.join(out_dir, f"{STEM}.pdb"), 'w') as f:
+        f.writelines(backbone_pdb_lines("MKLVAGTEDR"))
+    mutant_file = os.path.join(out_dir, "individual_list.txt")
+    with open(mutant_file, 'w') as f:
+        f.write(f"{line}\n")
+    subprocess.run([fake_foldx, "--command=BuildModel", f"--pdb={STEM}.pdb", f"--pdb-dir={out_dir}",
+                    f"--output-dir={out_dir}", f"--mutant-file={mutant_file}", f"--numberOfRuns={RUNS}"],
+                   check=True, capture_output=True)
+    energies = {run: terms for (_, run), terms in parse_build_energies(out_dir, STEM).items()}
+    return {run: os.path.join(out_dir, f"{STEM}_1_{run}.pdb") for run in range(RUNS)}, energies
+
+
+@pytest.fixture
+def outputs(tmp_path, fake_foldx):
+    lines = ["KA2G;", "LA3P,VA4A;", "EA8Q;"]
+    return {line: build_model(fake_foldx, str(tmp_path / f"build{index}"), line) for index, line in enumerate(lines)}
+
+
+def put_entry(root, line, mutant_pdbs, energies):
+    return ResultCache(root).put(REPAIRED_HASH, line, RUNS, mutant_pdbs, energies)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_round_trip(tmp_path, outputs):
+    cache = ResultCache(tmp_path / "cache")
+    line = "LA3P,VA4A;"
+    mutant_pdbs, energies = outputs[line]
+    assert cache.get(REPAIRED_HASH, line, RUNS) is None
+    entry = cache.put(REPAIRED_HASH, line, RUNS, mutant_pdbs, energies)
+
+    # 写法顺序和空白不同的同一组突变命中同一条目
+    assert normalize_mutation_line(" VA4A , LA3P ") == line
+    hit_entry, hit_energies = cache.get(REPAIRED_HASH, "VA4A,LA3P;", RUNS)
+    assert hit_entry == entry
+    assert hit_energies == energies
+    for run in range(RUNS):
+        assert read(cache.mutant_pdb(entry, run)) == read(mutant_pdbs[run])
+
+    assert cache.get(REPAIRED_HASH, line, RUNS + 1) is None
+    assert cache.get("cd" * 32, line, RUNS) is None
+    # 缺了某次运行的PDB视为未命中
+    os.remove(cache.mutant_pdb(entry, 1))
+    assert cache.get(REPAIRED_HASH, line, RUNS) is None
+
+
+def test_concurrent_put_keeps_one_entry(tmp_path, outputs):
+    root = str(tmp_path / "cache")
+    line = "KA2G;"
+    mutant_pdbs, energies = outputs[line]
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        entries = list(executor.map(put_entry, [root] * 8, [line] * 8, [mutant_pdbs] * 8, [energies] * 8))
+    assert len(set(entries)) == 1
+    cache = ResultCache(root)
+    assert [path for _, _, path in cache.entries()] == entries[:1]
+    # 没有残留的临时目录
+    assert os.listdir(os.path.dirname(entries[0])) == [os.path.basename(entries[0])]
+    assert cache.get(REPAIRED_HASH, line, RUNS)[1] == energies
+
+
+def test_evict_least_recently_used(tmp_path, outputs):
+    cache = ResultCache(tmp_path / "cache")
+    entries = {line: cache.put(REPAIRED_HASH, line, RUNS, *outputs[line]) for line in outputs}
+    # 按写入顺序设定最近使用时间，再命中最旧的一个
+    for age, entry in enumerate(reversed(list(entries.values())), start=1):
+        os.utime(os.path.join(entry, "meta.json"), (0, 1_000_000 - age * 100))
+    first, second, third = outputs
+    assert cache.get(REPAIRED_HASH, first, RUNS) is not None
+
+    sizes = {path: size for _, size, path in cache.entries()}
+    removed, freed = cache.evict(max_bytes=sizes[entries[first]] + sizes[entries[third]])
+    assert (removed, freed) == (1, sizes[entries[second]])
+    assert not os.path.exists(entries[second])
+    assert cache.get(REPAIRED_HASH, first, RUNS) is not None
+    assert cache.get(REPAIRED_HASH, third, RUNS) is not None
+
+    assert cache.evict(max_bytes=sum(sizes.values())) == (0, 0)
+
+
+def test_evict_unlimited_or_locked(tmp_path, outputs):
+    root = tmp_path / "cache"
+    line = "KA2G;"
+    ResultCache(root).put(REPAIRED_HASH, line, RUNS, *outputs[line])
+    assert ResultCache(root, max_gb=0).evict() == (0, 0)
+    # 别的进程正在淘汰时直接跳过
+    with open(root / ".evict.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        assert ResultCache(root).evict(max_bytes=0) == (0, 0)
+    assert ResultCache(root).evict(max_bytes=0)[0] == 1
+    assert ResultCache(root).entries() == []
@@ -0,0 +1,78 @@
+import pandas as pd
+
+from generate_individual_lists import (Mutation, locate_mutation_indices, mutation_line, parse_mutation_table,
+                                       parse_mutations_from_name, write_individual_lists)
+
+NAMES = ["rcsb_1A0N_B_I121L_7_25", "rcsb_1A0N_B_K130A_7_25"]
+
+
+def make_samples(base_dir):
+    for name in NAMES:
+        (base_dir / name / "mut_data").mkdir(parents=True)
+    table = parse_mutation_table(NAMES)
+    table['status'] = 'ok'
+    return table
+
+
+def individual_list(base_dir, name):
+    return base_dir / name / "mut_data" / "individual_list.txt"
+
+
+def test_second_run_is_unchanged(tmp_path):
+    table = make_samples(tmp_path)
+    assert write_individual_lists(table, tmp_path)['result'].tolist() == ['written', 'written']
+    assert write_individual_lists(table, tmp_path)['result'].tolist() == ['unchanged', 'unchanged']
+    assert individual_list(tmp_path, NAMES[0]).read_text() == "IB121L;\n"
+
+
+def test_deleted_or_edited_file_is_rewritten(tmp_path):
+    table = make_samples(tmp_path)
+    write_individual_lists(table, tmp_path)
+    individual_list(tmp_path, NAMES[0]).unlink()
+    individual_list(tmp_path, NAMES[1]).write_text("KB130G;\n")
+    result = write_individual_lists(table, tmp_path)
+    assert result['result'].tolist() == ['written', 'written']
+    assert individual_list(tmp_path, NAMES[0]).read_text() == "IB121L;\n"
+    assert individual_list(tmp_path, NAMES[1]).read_text() == "KB130A;\n"
+
+
+def test_missing_dir_and_rejected(tmp_path):
+    table = make_samples(tmp_path)
+    table = pd.concat([table, parse_mutation_table(["rcsb_2XYZ_A_L5P_7_25"]).assign(status='ok')],
+                      ignore_index=True)
+    table.loc[0, 'status'] = 'mismatch'
+    assert write_individual_lists(table, tmp_path)['result'].tolist() == ['rejected', 'written', 'missing_dir']
+
+
+def test_per_site_chain_and_separator():
+    mutations = parse_mutations_from_name("rcsb_1A0N_B_KC130A+I121L_7_25")
+    assert mutations == (Mutation('B', 121, 'I', 'L'), Mutation('C', 130, 'K', 'A'))
+    assert mutation_line(mutations) == "IB121L,KC130A;"
+    table = parse_mutation_table(["rcsb_1A0N_B_KC130A+I121L_7_25", "rcsb_1A0N_B_I121L_7_25"])
+    assert table['line'].tolist() == ["IB121L,KC130A;", "IB121L;"]
+    assert table['num_mutations'].tolist() == [2, 1]
+
+
+def test_unsafe_separators_are_unparsed():
+    names = ["rcsb_1A0N_B_I121L,K130A_7_25", "rcsb_1A0N_B_I121L/K130A_7_25", "rcsb_1A0N_B_I121L:K130A_7_25"]
+    for name in names:
+        assert parse_mutations_from_name(name) is None
+    table = parse_mutation_table(names)
+    assert table['mutations'].isna().all()
+    assert table['num_mutations'].tolist() == [0, 0, 0]
+
+
+def test_locate_multi_chain_indices():
+    # 序列中链C的位点在链B之前，PDB编号与序列下标也对不上
+    wt_seq = "MKLVAGT"
+    mut_seq = "MALVAGP"
+    mutations = parse_mutations_from_name("rcsb_1A0N_B_TB130P+KC5A_7_25")
+    assert mutations == (Mutation('B', 130, 'T', 'P'), Mutation('C', 5, 'K', 'A'))
+    assert locate_mutation_indices(wt_seq, mutations, mut_seq) == [6, 1]
+
+
+def test_locate_indices_in_position_order():
+    wt_seq = "MKLVAGT"
+    mut_seq = "MALVAGP"
+    mutations = parse_mutations_from_name("rcsb_1A0N_B_KB12A+TB40P_7_25")
+    assert locate_mutation_indices(wt_seq, mutations, mut_seq) == [1, 6]
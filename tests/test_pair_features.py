@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from pair_features import (LOCAL_PAIR_NAME, check_against_full, compute_pair_features, compute_pair_features_batched,
+                           read_backbone, stack_backbones, update_pair_features, write_pair_features,
+                           write_pair_features_batched)
+from synthetic_data import backbone_pdb_lines, random_sequence
+
+SEQ = "MKLVAGTEDRSQWYFHPNCI"
+# 模拟BuildModel：只有突变位点附近的残基移动
+MOVED = (5, 6, 12)
+
+
+def shifted_lines(lines, residues, dx=0.3):
+    """把指定残基（从1开始编号）的原子沿x平移dx"""
+    shifted = []
+    for line in lines:
+        if line.startswith("ATOM") and int(line[22:26]) in residues:
+            line = f"{line[:30]}{float(line[30:38]) + dx:>8.3f}{line[38:]}"
+        shifted.append(line)
+    return shifted
+
+
+@pytest.fixture
+def structures(tmp_path):
+    wt_lines = backbone_pdb_lines(SEQ)
+    wt_pdb, mut_pdb = tmp_path / "wt.pdb", tmp_path / "mut.pdb"
+    wt_pdb.write_text(''.join(wt_lines))
+    mut_pdb.write_text(''.join(shifted_lines(wt_lines, MOVED)))
+    return str(wt_pdb), str(mut_pdb)
+
+
+def test_delta_is_bit_identical(structures):
+    wt_pdb, mut_pdb = structures
+    _, wt_coords = read_backbone(wt_pdb)
+    _, mut_coords = read_backbone(mut_pdb)
+    pair, recomputed = update_pair_features(compute_pair_features(wt_coords), wt_coords, mut_coords)
+    assert recomputed == len(MOVED)
+    assert torch.equal(pair, compute_pair_features(mut_coords))
+
+
+def test_unmoved_structure_reuses_wt(structures):
+    wt_pdb, _ = structures
+    _, coords = read_backbone(wt_pdb)
+    wt_pair = compute_pair_features(coords)
+    pair, recomputed = update_pair_features(wt_pair, coords, coords.clone())
+    assert recomputed == 0
+    assert torch.equal(pair, wt_pair)
+
+
+def test_too_many_moved_falls_back_to_full(tmp_path):
+    wt_lines = backbone_pdb_lines(SEQ)
+    mut_pdb = tmp_path / "mut.pdb"
+    mut_pdb.write_text(''.join(shifted_lines(wt_lines, range(1, len(SEQ)))))
+    wt_pdb = tmp_path / "wt.pdb"
+    wt_pdb.write_text(''.join(wt_lines))
+    _, wt_coords = read_backbone(str(wt_pdb))
+    _, mut_coords = read_backbone(str(mut_pdb))
+    pair, recomputed = update_pair_features(compute_pair_features(wt_coords), wt_coords, mut_coords)
+    assert recomputed == len(SEQ)
+    assert torch.equal(pair, compute_pair_features(mut_coords))
+
+
+def test_write_with_wt_reference(structures, tmp_path):
+    wt_pdb, mut_pdb = structures
+    wt_pair_file = str(tmp_path / "wt" / LOCAL_PAIR_NAME)
+    mut_pair_file = str(tmp_path / "mut" / LOCAL_PAIR_NAME)
+    assert write_pair_features(wt_pdb, wt_pair_file) == len(SEQ)
+    assert write_pair_features(mut_pdb, mut_pair_file, wt_pdb, wt_pair_file) == len(MOVED)
+    exact, max_error, within = check_against_full(torch.load(mut_pair_file), mut_pdb)
+    assert exact and max_error == 0.0 and within
+
+
+def backbones(tmp_path, lengths):
+    rng = random.Random(0)
+    pdb_files = []
+    for index, length in enumerate(lengths):
+        pdb_file = tmp_path / f"s{index}.pdb"
+        pdb_file.write_text(''.join(backbone_pdb_lines(random_sequence(length, rng))))
+        pdb_files.append(str(pdb_file))
+    return pdb_files
+
+
+def test_batched_matches_per_structure_and_pads_zero(tmp_path):
+    lengths = (7, 12, 3)
+    coord_list = [read_backbone(pdb_file)[1] for pdb_file in backbones(tmp_path, lengths)]
+    coords, mask = stack_backbones(coord_list)
+    pair = compute_pair_features_batched(coords, mask)
+    assert pair.shape[:3] == (len(lengths), max(lengths), max(lengths))
+    for index, length in enumerate(lengths):
+        assert torch.equal(pair[index, :length, :length], compute_pair_features(coord_list[index]))
+        assert not pair[index, length:].any()
+        assert not pair[index, :, length:].any()
+
+
+def test_write_batched_matches_write_per_file(tmp_path):
+    pdb_files = backbones(tmp_path, (5, 9, 16, 4))
+    jobs = [(pdb_file, str(tmp_path / f"b{index}.pt")) for index, pdb_file in enumerate(pdb_files)]
+    # max_pairs很小，长度不同的结构分到多个批次
+    results = list(write_pair_features_batched(jobs, max_pairs=256))
+    assert sorted(detail for _, _, _, detail in results) == [4, 5, 9, 16]
+    assert {status for _, _, status, _ in results} == {'generated'}
+    for index, (pdb_file, batched_file) in enumerate(jobs):
+        per_file = str(tmp_path / f"p{index}.pt")
+        write_pair_features(pdb_file, per_file)
+        assert torch.equal(torch.load(batched_file), torch.load(per_file))
@@ -0,0 +1,62 @@
+import os
+
+from pdb_renumber import is_renumbered, original_pdb_path, renumber_pdb, source_pdb
+
+# 残基从100开始且带插入码，编号后会变
+PDB_LINES = [
+    "ATOM      1  N   ALA A 100       0.000   0.000   0.000  1.00  0.00           N\n",
+    "ATOM      2  CA  ALA A 100       1.000   0.000   0.000  1.00  0.00           C\n",
+    "ATOM      3  N   GLY A 100A      2.000   0.000   0.000  1.00  0.00           N\n",
+    "ATOM      4  N   LYS A 102       3.000   0.000   0.000  1.00  0.00           N\n",
+    "END\n",
+]
+
+
+def write_pdb(path):
+    with open(path, 'w') as f:
+        f.writelines(PDB_LINES)
+    return str(path)
+
+
+def residue_numbers(pdb_file):
+    with open(pdb_file) as f:
+        return [line[22:27] for line in f if line.startswith("ATOM")]
+
+
+def test_renumber_in_place(tmp_path):
+    pdb_file = write_pdb(tmp_path / "relaxed.pdb")
+    assert renumber_pdb(pdb_file)
+    assert is_renumbered(pdb_file)
+    assert residue_numbers(pdb_file) == ["   1 ", "   1 ", "   2 ", "   3 "]
+    assert not renumber_pdb(pdb_file)
+    assert not os.path.exists(original_pdb_path(pdb_file))
+
+
+def test_keep_original_preserves_source(tmp_path):
+    pdb_file = write_pdb(tmp_path / "relaxed.pdb")
+    assert source_pdb(pdb_file) == pdb_file
+    renumber_pdb(pdb_file, keep_original=True)
+    original = original_pdb_path(pdb_file)
+    assert original == str(tmp_path / "relaxed.original.pdb")
+    assert source_pdb(pdb_file) == original
+    with open(original) as f:
+        assert f.readlines() == PDB_LINES
+    # 重跑时WT已编号，不会用编号后的内容覆盖原始副本
+    renumber_pdb(pdb_file, keep_original=True)
+    with open(original) as f:
+        assert f.readlines() == PDB_LINES
+
+
+def test_source_missing_after_plain_renumber(tmp_path):
+    pdb_file = write_pdb(tmp_path / "relaxed.pdb")
+    renumber_pdb(pdb_file)
+    assert source_pdb(pdb_file) is None
+
+
+def test_renumber_to_other_file_leaves_input(tmp_path):
+    pdb_file = write_pdb(tmp_path / "relaxed.pdb")
+    out_file = str(tmp_path / "out.pdb")
+    renumber_pdb(pdb_file, out_file, keep_original=True)
+    assert not is_renumbered(pdb_file)
+    assert is_renumbered(out_file)
+    assert not os.path.exists(original_pdb_path(pdb_file))